@@ -7,94 +7,40 @@ from sklearn.pipeline import Pipeline
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
 import pickle # Added for the next step: saving the model
+import os
+from forest_engine import ARTIFACT_PREFIX, artifact_version, compile_pipeline, save_engine
 
 # --- Configuration ---
 INPUT_FILE = 'datasets/irrigation_dataset.csv'
 TARGET_VARIABLE = 'water_requirement_liters_per_hectare'
 RANDOM_STATE = 42
 MODEL_OUTPUT_FILE = 'optimized_irrigation_model.pkl' # File to save the trained model
+CHUNK_SIZE = 500_000 # Rows per chunk; memory use stays flat however large the input is
 # ---------------------
 
-print("### Starting Full Data Engineering and ML Pipeline ###")
-print("-" * 50)
-
-# --- A. Data Loading and Engineering ---
-try:
-    df = pd.read_csv(INPUT_FILE)
-    print(f"Loaded '{INPUT_FILE}' with {len(df)} samples.")
-except FileNotFoundError:
-    print(f"ERROR: '{INPUT_FILE}' not found. Please ensure the raw data is in the same directory.")
-    exit()
-
-# 1. Rename columns to standardized, clean names
-df.rename(columns={
+# Raw column names -> standardized, clean names
+RENAME_COLUMNS = {
     'label': 'crop_type',
     'temperature': 'temperature_celsius',
     'humidity': 'humidity_percent',
     'rainfall': 'rainfall_mm'
-}, inplace=True)
-
-# 2. Normalize and check for consistency
-df['crop_type'] = df['crop_type'].str.lower().str.strip()
-print("Normalized 'crop_type' to lowercase.")
-
-# --- CRITICAL FIX: Ensure calculation columns are numeric ---
-numeric_cols_to_check = ['temperature_celsius', 'humidity_percent', 'rainfall_mm']
-
-for col in numeric_cols_to_check:
-    # Coerce errors: non-numeric values become NaN
-    df[col] = pd.to_numeric(df[col], errors='coerce')
-
-# Impute (fill) resulting NaNs with the mean of the column
-df.fillna(df.mean(numeric_only=True), inplace=True)
-print("Ensured all calculation columns are numeric and handled initial non-numeric data.")
-# -----------------------------------------------------------
+}
 
+# Calculation columns that must be numeric; missing or non-numeric values get the column mean
+NUMERIC_COLS_TO_CHECK = ['temperature_celsius', 'humidity_percent', 'rainfall_mm']
 
-# 3. Generate a synthetic 'soil_moisture_percent' column
-df['soil_moisture_percent'] = np.round(np.random.uniform(30.0, 70.0, size=len(df)), 1)
-print("Generated synthetic 'soil_moisture_percent' column.")
+# Rows per block when computing the imputation means. Fixed (not CHUNK_SIZE) so the
+# means, and therefore the output, do not depend on the chunk size.
+STATS_BLOCK_SIZE = 250_000
 
-# 4. Define the rules and engineered features (Base Water Requirement)
+# Base Water Requirement per crop (unknown crops get 4000)
 CROP_RULES_FULL = {
     'rice': 6500, 'maize': 5000, 'pomegranate': 4400, 'banana': 5100, 
     'mango': 4600, 'watermelon': 4700, 'papaya': 4850
 }
 
-# --- FEATURE ENGINEERING: Create the numerical 'crop_water_base' feature ---
-df['crop_water_base'] = df['crop_type'].map(CROP_RULES_FULL).fillna(4000)
-print("Engineered 'crop_water_base' feature (numerical category proxy).")
-
-# 5. Calculate the dynamic target variable: 'water_requirement_liters_per_hectare'
-def calculate_water(row):
-    crop_base_water = CROP_RULES_FULL.get(row['crop_type'], 4000)
-    
-    # --- HARD TYPE CONVERSION ADDED HERE ---
-    temp_celsius = float(row['temperature_celsius'])
-    soil_moisture = float(row['soil_moisture_percent'])
-    rainfall = float(row['rainfall_mm'])
-    humidity = float(row['humidity_percent'])
-    
-    # Dynamic calculation using environmental factors
-    water_req = (
-        crop_base_water +
-        (temp_celsius * 15) -
-        (soil_moisture * 20) -
-        (rainfall * 50) +
-        (humidity * 10)
-    )
-    
-    # Add random noise for realism
-    noise = np.random.normal(0, 150)
-    water_req = int(water_req + noise)
-    
-    return max(500, water_req)
-
-df[TARGET_VARIABLE] = df.apply(calculate_water, axis=1)
-print(f"Calculated dynamic '{TARGET_VARIABLE}'.")
-
-# 6. Keep only the final columns needed for modeling
-final_columns = [
+# Final columns needed for modeling
+FINAL_COLUMNS = [
     'crop_type', 
     'soil_moisture_percent', 
     'temperature_celsius', 
@@ -103,108 +49,254 @@ final_columns = [
     'crop_water_base', 
     TARGET_VARIABLE
 ]
-df_final = df[final_columns].copy()
 
-print("-" * 50)
 
-# ---------------------------------------------------------------------------------------------------
-## START ML PIPELINE
-# ---------------------------------------------------------------------------------------------------
+def _raw_name(columns, clean_name):
+    """Name of the raw CSV column that becomes clean_name after renaming."""
+    for raw, clean in RENAME_COLUMNS.items():
+        if clean == clean_name and raw in columns:
+            return raw
+    return clean_name
 
-# B. Data Preparation and Splitting
-X = df_final.drop(columns=[TARGET_VARIABLE])
-Y = df_final[TARGET_VARIABLE]
-X_train, X_test, Y_train, Y_test = train_test_split(
-    X, Y, test_size=0.2, random_state=RANDOM_STATE
-)
 
-# Define Preprocessing Steps
-numerical_features = [
-    'soil_moisture_percent', 'temperature_celsius', 'humidity_percent', 
-    'rainfall_mm', 'crop_water_base'
-]
-categorical_features = ['crop_type']
-
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('num', StandardScaler(), numerical_features),
-        ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
-    ],
-    remainder='passthrough'
-)
-
-# C. Optimized Model Training (Grid Search)
-model_pipeline = Pipeline(steps=[
-    ('preprocessor', preprocessor),
-    ('regressor', RandomForestRegressor(random_state=RANDOM_STATE, n_jobs=-1))
-])
-
-param_grid = {
+def column_means(path, block_size=STATS_BLOCK_SIZE):
+    """First pass: mean of each calculation column after coercing non-numeric values to NaN."""
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = {_raw_name(header, col): col for col in NUMERIC_COLS_TO_CHECK}
+    sums = dict.fromkeys(NUMERIC_COLS_TO_CHECK, 0.0)
+    counts = dict.fromkeys(NUMERIC_COLS_TO_CHECK, 0)
+    for block in pd.read_csv(path, usecols=list(usecols), chunksize=block_size):
+        for raw, col in usecols.items():
+            values = pd.to_numeric(block[raw], errors='coerce').to_numpy(dtype=np.float64)
+            valid = values[~np.isnan(values)]
+            sums[col] += float(valid.sum())
+            counts[col] += len(valid)
+    return {col: sums[col] / counts[col] if counts[col] else np.nan for col in NUMERIC_COLS_TO_CHECK}
+
+
+def make_generators(seed):
+    """
+    Independent generators for soil moisture and target noise. Each one is drawn
+    from sequentially, chunk after chunk, so the values a row gets do not depend
+    on how the input is chunked.
+    """
+    moisture_seq, noise_seq = np.random.SeedSequence(seed).spawn(2)
+    return np.random.default_rng(moisture_seq), np.random.default_rng(noise_seq)
+
+
+def engineer_chunk(chunk, means, moisture_rng, noise_rng):
+    """Column-wise data engineering for one chunk of raw rows; returns the FINAL_COLUMNS frame."""
+    chunk = chunk.rename(columns=RENAME_COLUMNS)
+    n = len(chunk)
+
+    # Normalize and check for consistency
+    crop_type = chunk['crop_type'].astype(object).str.lower().str.strip()
+
+    # Coerce errors (non-numeric values become NaN), then impute with the dataset-wide mean
+    numeric = {col: pd.to_numeric(chunk[col], errors='coerce').fillna(means[col]).to_numpy(dtype=np.float64)
+               for col in NUMERIC_COLS_TO_CHECK}
+
+    # Synthetic soil moisture
+    soil_moisture = np.round(moisture_rng.uniform(30.0, 70.0, size=n), 1)
+
+    # Numerical category proxy
+    crop_water_base = crop_type.map(CROP_RULES_FULL).fillna(4000).to_numpy(dtype=np.float64)
+
+    # Dynamic target from the environmental factors plus noise for realism,
+    # truncated to whole litres and floored at 500
+    water_req = (
+        crop_water_base +
+        (numeric['temperature_celsius'] * 15) -
+        (soil_moisture * 20) -
+        (numeric['rainfall_mm'] * 50) +
+        (numeric['humidity_percent'] * 10)
+    )
+    water_req = np.trunc(water_req + noise_rng.normal(0, 150, size=n)).astype(np.int64)
+
+    return pd.DataFrame({
+        'crop_type': crop_type.to_numpy(),
+        'soil_moisture_percent': soil_moisture,
+        'temperature_celsius': numeric['temperature_celsius'],
+        'humidity_percent': numeric['humidity_percent'],
+        'rainfall_mm': numeric['rainfall_mm'],
+        'crop_water_base': crop_water_base,
+        TARGET_VARIABLE: np.maximum(water_req, 500)
+    }, index=chunk.index)
+
+
+def iter_engineered(path, seed=RANDOM_STATE, chunksize=CHUNK_SIZE, means=None):
+    """Yield engineered chunks; identical output for a given seed whatever the chunk size."""
+    if means is None:
+        means = column_means(path)
+    moisture_rng, noise_rng = make_generators(seed)
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        yield engineer_chunk(chunk, means, moisture_rng, noise_rng)
+
+
+def write_engineered(path, output_path, seed=RANDOM_STATE, chunksize=CHUNK_SIZE):
+    """Stream the engineered dataset to a CSV file one chunk at a time; returns the row count."""
+    rows = 0
+    for i, chunk in enumerate(iter_engineered(path, seed, chunksize)):
+        chunk.to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        rows += len(chunk)
+    return rows
+
+
+def load_engineered(path, seed=RANDOM_STATE, chunksize=CHUNK_SIZE):
+    """Whole engineered dataset as one DataFrame (for training)."""
+    return pd.concat(iter_engineered(path, seed, chunksize), ignore_index=True)
+
+
+# Hyperparameter grid shared by both search modes (halving treats n_estimators as its resource)
+PARAM_GRID = {
     'regressor__n_estimators': [100, 200], 
     'regressor__max_depth': [10, None],
     'regressor__min_samples_split': [2, 5]
 }
 
-print("Starting Grid Search for Hyperparameter Optimization...")
-grid_search = GridSearchCV(
-    model_pipeline, 
-    param_grid, 
-    cv=3,
-    scoring='neg_mean_absolute_error',
-    verbose=0, 
-    n_jobs=-1
-)
-
-grid_search.fit(X_train, Y_train)
-best_model = grid_search.best_estimator_
-
-# D. Evaluation
-Y_pred_optimized = best_model.predict(X_test)
-mae_optimized = mean_absolute_error(Y_test, Y_pred_optimized)
-r2_optimized = r2_score(Y_test, Y_pred_optimized)
-
-print("\n✅ Grid Search Complete.")
-print(f"Best Hyperparameters Found: {grid_search.best_params_}")
-print("\n" + "=" * 70)
-print("🎯 MODEL PERFORMANCE REPORT".center(70))
-print("=" * 70)
-print(f"\n📊 Dataset Information:")
-print(f"   • Total Samples: {len(df):,}")
-print(f"   • Training Set: {len(X_train):,} samples ({len(X_train)/len(df)*100:.1f}%)")
-print(f"   • Test Set: {len(X_test):,} samples ({len(X_test)/len(df)*100:.1f}%)")
-print(f"   • Features Used: {X.shape[1]}")
-
-print(f"\n🌟 Model Accuracy Metrics:")
-print(f"   ┌─────────────────────────────────────────────┐")
-print(f"   │  Model Accuracy (R²):  {r2_optimized*100:5.2f}%          │")
-print(f"   │  Average Error (MAE):  {mae_optimized:6.2f} liters    │")
-print(f"   └─────────────────────────────────────────────┘")
-
-# Interpretation
-if r2_optimized >= 0.95:
-    quality = "🏆 EXCELLENT"
-    interpretation = "Your model is highly accurate!"
-elif r2_optimized >= 0.85:
-    quality = "✅ VERY GOOD"
-    interpretation = "Your model performs well."
-elif r2_optimized >= 0.70:
-    quality = "👍 GOOD"
-    interpretation = "Your model is acceptable."
-else:
-    quality = "⚠️  NEEDS IMPROVEMENT"
-    interpretation = "Consider more training data."
-
-print(f"\n📈 Model Quality: {quality}")
-print(f"   {interpretation}")
-print(f"\n💡 What This Means:")
-print(f"   • On average, predictions are within ±{mae_optimized:.0f} liters of actual values")
-print(f"   • The model explains {r2_optimized*100:.2f}% of the variation in water requirements")
-
-print("\n" + "=" * 70)
-
-# E. Save the Model (Next Logical Step)
-with open(MODEL_OUTPUT_FILE, 'wb') as file:
-    pickle.dump(best_model, file)
-print(f"✅ Model saved successfully to '{MODEL_OUTPUT_FILE}'")
-print(f"🚀 Model is ready for deployment and real-time predictions!")
-print("=" * 70 + "\n")
\ No newline at end of file
+
+def split_features(df_final):
+    """B. Data Preparation and Splitting: returns X_train, X_test, Y_train, Y_test."""
+    X = df_final.drop(columns=[TARGET_VARIABLE])
+    Y = df_final[TARGET_VARIABLE]
+    return train_test_split(X, Y, test_size=0.2, random_state=RANDOM_STATE)
+
+
+def make_pipeline():
+    """Preprocessing + Random Forest Pipeline (the model app.py serves)."""
+    # Define Preprocessing Steps
+    numerical_features = [
+        'soil_moisture_percent', 'temperature_celsius', 'humidity_percent', 
+        'rainfall_mm', 'crop_water_base'
+    ]
+    categorical_features = ['crop_type']
+
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('num', StandardScaler(), numerical_features),
+            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
+        ],
+        remainder='passthrough'
+    )
+
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('regressor', RandomForestRegressor(random_state=RANDOM_STATE, n_jobs=-1))
+    ])
+
+
+def make_search(search='grid', verbose=True):
+    """
+    'grid': the original exhaustive GridSearchCV.
+    'halving': successive halving over rows and n_estimators (halving_search.py).
+    """
+    if search == 'halving':
+        from halving_search import SuccessiveHalvingSearch
+        return SuccessiveHalvingSearch(make_pipeline(), PARAM_GRID, cv=3, factor=3,
+                                       random_state=RANDOM_STATE, n_jobs=-1, verbose=verbose)
+    return GridSearchCV(
+        make_pipeline(), 
+        PARAM_GRID, 
+        cv=3,
+        scoring='neg_mean_absolute_error',
+        verbose=0, 
+        n_jobs=-1
+    )
+
+
+def train_and_export(df_final, search='grid'):
+    """Search the Random Forest hyperparameters, report accuracy and save the pickle + memory-mapped copy."""
+    X_train, X_test, Y_train, Y_test = split_features(df_final)
+
+    # C. Optimized Model Training
+    print(f"Starting {'Successive Halving' if search == 'halving' else 'Grid'} Search for Hyperparameter Optimization...")
+    grid_search = make_search(search)
+    grid_search.fit(X_train, Y_train)
+    best_model = grid_search.best_estimator_
+
+    # D. Evaluation
+    Y_pred_optimized = best_model.predict(X_test)
+    mae_optimized = mean_absolute_error(Y_test, Y_pred_optimized)
+    r2_optimized = r2_score(Y_test, Y_pred_optimized)
+
+    print(f"\n✅ {'Successive Halving' if search == 'halving' else 'Grid'} Search Complete.")
+    print(f"Best Hyperparameters Found: {grid_search.best_params_}")
+    print("\n" + "=" * 70)
+    print("🎯 MODEL PERFORMANCE REPORT".center(70))
+    print("=" * 70)
+    print(f"\n📊 Dataset Information:")
+    print(f"   • Total Samples: {len(df_final):,}")
+    print(f"   • Training Set: {len(X_train):,} samples ({len(X_train)/len(df_final)*100:.1f}%)")
+    print(f"   • Test Set: {len(X_test):,} samples ({len(X_test)/len(df_final)*100:.1f}%)")
+    print(f"   • Features Used: {X_train.shape[1]}")
+
+    print(f"\n🌟 Model Accuracy Metrics:")
+    print(f"   ┌─────────────────────────────────────────────┐")
+    print(f"   │  Model Accuracy (R²):  {r2_optimized*100:5.2f}%          │")
+    print(f"   │  Average Error (MAE):  {mae_optimized:6.2f} liters    │")
+    print(f"   └─────────────────────────────────────────────┘")
+
+    # Interpretation
+    if r2_optimized >= 0.95:
+        quality = "🏆 EXCELLENT"
+        interpretation = "Your model is highly accurate!"
+    elif r2_optimized >= 0.85:
+        quality = "✅ VERY GOOD"
+        interpretation = "Your model performs well."
+    elif r2_optimized >= 0.70:
+        quality = "👍 GOOD"
+        interpretation = "Your model is acceptable."
+    else:
+        quality = "⚠️  NEEDS IMPROVEMENT"
+        interpretation = "Consider more training data."
+
+    print(f"\n📈 Model Quality: {quality}")
+    print(f"   {interpretation}")
+    print(f"\n💡 What This Means:")
+    print(f"   • On average, predictions are within ±{mae_optimized:.0f} liters of actual values")
+    print(f"   • The model explains {r2_optimized*100:.2f}% of the variation in water requirements")
+
+    print("\n" + "=" * 70)
+
+    # E. Save the Model (Next Logical Step)
+    with open(MODEL_OUTPUT_FILE, 'wb') as file:
+        pickle.dump(best_model, file)
+    print(f"✅ Model saved successfully to '{MODEL_OUTPUT_FILE}'")
+
+    # F. Export the memory-mappable copy served by app.py
+    save_engine(compile_pipeline(best_model), ARTIFACT_PREFIX, source_version=artifact_version(MODEL_OUTPUT_FILE))
+    print(f"✅ Memory-mapped model saved to '{ARTIFACT_PREFIX}.bin'")
+    print(f"🚀 Model is ready for deployment and real-time predictions!")
+    print("=" * 70 + "\n")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Engineer the training set from raw data and train the model.')
+    parser.add_argument('--input', default=INPUT_FILE)
+    parser.add_argument('--seed', type=int, default=RANDOM_STATE, help='seed for soil moisture and target noise')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--output', help='write the engineered dataset to this CSV and stop (no training)')
+    parser.add_argument('--search', choices=['grid', 'halving'], default='grid',
+                        help="hyperparameter search: exhaustive grid or successive halving (faster)")
+    args = parser.parse_args()
+
+    print("### Starting Full Data Engineering and ML Pipeline ###")
+    print("-" * 50)
+
+    # --- A. Data Loading and Engineering ---
+    if not os.path.exists(args.input):
+        print(f"ERROR: '{args.input}' not found. Please ensure the raw data is in the same directory.")
+        exit()
+
+    if args.output:
+        rows = write_engineered(args.input, args.output, args.seed, args.chunksize)
+        print(f"✅ Engineered {rows:,} rows from '{args.input}' into '{args.output}' (seed {args.seed}).")
+        exit()
+
+    df_final = load_engineered(args.input, args.seed, args.chunksize)
+    print(f"Loaded and engineered '{args.input}' with {len(df_final)} samples (seed {args.seed}).")
+    print("-" * 50)
+
+    train_and_export(df_final, args.search)
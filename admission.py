@@ -0,0 +1,351 @@
+"""
+Admission control: per-client rate limits and concurrency caps, checked
+before a request reaches its view.
+
+Requests are grouped into route classes (ROUTE_CLASSES): 'predict' for
+/predict and /predict/batch, and 'auth' for the OTP and password-reset
+routes, which wait on Firebase and SMTP. Each class can have
+
+    * a token bucket per client IP: `rate` requests per second with bursts of
+      up to `burst`. An empty bucket answers 429 with Retry-After set to when
+      the next token arrives.
+    * a cap on requests of the class in progress at once. Beyond it, new ones
+      get 503 with Retry-After right away, instead of queueing behind slow
+      Firebase/SMTP calls and holding every worker.
+
+Rejections cost one dict lookup and a little arithmetic; nothing else runs.
+Other routes (pages, static files, admin, /metrics) are never limited.
+
+Buckets and in-flight counts live in a state backend:
+
+    MemoryAdmissionState   per process (each gunicorn worker limits on its own)
+    SQLiteAdmissionState   a WAL-mode SQLite file shared by every worker on the
+                           host, so limits hold for the whole server. Slots
+                           left by a worker that died are reclaimed. The file
+                           is private to the server's user; see local_state.py.
+
+If the shared database is locked for longer than its busy timeout, the
+request is admitted; a limiter outage does not take the API down.
+
+Configuration (environment):
+    AQUAWISE_RATE_LIMITS          per-IP buckets, "class=rate:burst,...", e.g. "predict=20:40,auth=0.2:5"
+                                  (default: none)
+    AQUAWISE_CONCURRENCY_LIMITS   in-flight caps, "class=limit,...", e.g. "auth=16" (default: none)
+    AQUAWISE_ADMISSION_BACKEND    'memory' (default) or 'sqlite'
+    AQUAWISE_ADMISSION_DB         SQLite file (default: admission.sqlite3 in a private per-user temp directory)
+    AQUAWISE_TRUSTED_PROXIES      reverse proxies in front of the app; the client IP is taken that many
+                                  entries from the right of X-Forwarded-For (default 0: the socket address)
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from local_state import state_path
+from metrics import REGISTRY
+
+ROUTE_CLASSES = {
+    '/predict': 'predict',
+    '/predict/batch': 'predict',
+    '/api/send-otp': 'auth',
+    '/api/verify-otp': 'auth',
+    '/api/reset-password': 'auth',
+}
+
+DECISIONS = REGISTRY.counter(
+    'aquawise_admission_total',
+    'Requests by admission decision (admitted, rate_limited: 429, overloaded: 503, error: admitted, state unavailable)',
+    ['route_class', 'decision'])
+IN_FLIGHT = REGISTRY.gauge(
+    'aquawise_admission_in_flight', 'Requests of a concurrency-capped class in progress in this worker', ['route_class'])
+
+
+def parse_limits(spec, parse_value):
+    """Parse "class=value,class=value" into {class: parse_value(value)}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, _, value = item.partition('=')
+        if name.strip() not in set(ROUTE_CLASSES.values()):
+            raise ValueError(f"Unknown route class '{name.strip()}'. Choose one of: {sorted(set(ROUTE_CLASSES.values()))}")
+        limits[name.strip()] = parse_value(value.strip())
+    return limits
+
+
+def _parse_bucket(value):
+    rate, _, burst = value.partition(':')
+    rate, burst = float(rate), float(burst or rate)
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"Rate limit '{value}' needs a positive rate and a burst of at least 1")
+    return rate, burst
+
+
+def _parse_concurrency(value):
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(f"Concurrency limit '{value}' must be at least 1")
+    return limit
+
+
+def _refill(tokens, updated, now, rate, burst):
+    """Take one token from a bucket; returns (tokens left, updated, seconds until a token if refused)."""
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, now, 0.0
+    return tokens, now, (1 - tokens) / rate
+
+
+class MemoryAdmissionState:
+    """Buckets (LRU-bounded) and in-flight counts for this process only."""
+
+    backend = 'memory'
+
+    def __init__(self, max_buckets=100000, clock=time.monotonic):
+        self.max_buckets = max_buckets
+        self._clock = clock
+        self._buckets = OrderedDict()  # (route class, client) -> (tokens, updated)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Take a token from key's bucket; returns 0 if allowed, else seconds until one is available."""
+        now = self._clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens, updated, wait = _refill(tokens, updated, now, rate, burst)
+            self._buckets[key] = (tokens, updated)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)  # least recently seen client starts over with a full bucket
+        return wait
+
+    def acquire(self, route_class, limit):
+        """Claim an in-flight slot; returns a slot handle, or None if `limit` are taken."""
+        with self._lock:
+            if self._in_flight.get(route_class, 0) >= limit:
+                return None
+            self._in_flight[route_class] = self._in_flight.get(route_class, 0) + 1
+        return route_class
+
+    def release(self, slot):
+        with self._lock:
+            self._in_flight[slot] -= 1
+
+    def status(self):
+        return {'backend': self.backend, 'buckets': len(self._buckets), 'in_flight': dict(self._in_flight)}
+
+
+class SQLiteAdmissionState:
+    """Buckets and in-flight slots in a WAL-mode SQLite file shared by the workers on this host."""
+
+    backend = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS buckets_updated ON buckets (updated);
+        CREATE TABLE IF NOT EXISTS slots (
+            id INTEGER PRIMARY KEY,
+            route_class TEXT NOT NULL,
+            pid INTEGER NOT NULL,
+            acquired_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS slots_route_class ON slots (route_class);
+    """
+    PRUNE_EVERY = 1000        # takes between deletes of idle (full) buckets
+    SLOT_MAX_AGE = 300.0      # seconds; a slot held longer than this is assumed leaked
+
+    def __init__(self, path=None, busy_timeout=0.5, clock=time.time):
+        self.path = state_path(path, 'admission.sqlite3')
+        self.busy_timeout = busy_timeout
+        self.idle_seconds = 3600.0  # buckets untouched this long are full again; set by AdmissionController
+        self._clock = clock
+        self._local = threading.local()
+        self._takes = 0
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self):
+        # One connection per thread and per process (connections must not cross a fork)
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')  # limiter state may lose its last writes on power loss
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def _transaction(self, fn):
+        db = self._connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(db)
+            db.execute('COMMIT')
+            return result
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def take(self, key, rate, burst):
+        key = '\x1f'.join(key)
+        now = self._clock()
+        self._takes += 1
+        prune = self._takes % self.PRUNE_EVERY == 0
+
+        def take(db):
+            row = db.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated, wait = _refill(*(row or (burst, now)), now, rate, burst)
+            db.execute('INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) ON CONFLICT (key) '
+                       'DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated', (key, tokens, updated))
+            if prune:
+                db.execute('DELETE FROM buckets WHERE updated < ?', (now - self.idle_seconds,))
+            return wait
+        return self._transaction(take)
+
+    def acquire(self, route_class, limit):
+        now = self._clock()
+
+        def acquire(db):
+            count = lambda: db.execute('SELECT count(*) FROM slots WHERE route_class = ?', (route_class,)).fetchone()[0]
+            if count() >= limit:
+                self._reclaim(db, route_class, now)
+                if count() >= limit:
+                    return None
+            return db.execute('INSERT INTO slots (route_class, pid, acquired_at) VALUES (?, ?, ?)',
+                              (route_class, os.getpid(), now)).lastrowid
+        return self._transaction(acquire)
+
+    def _reclaim(self, db, route_class, now):
+        """Free slots held by workers that no longer exist, or for longer than SLOT_MAX_AGE."""
+        rows = db.execute('SELECT id, pid, acquired_at FROM slots WHERE route_class = ?', (route_class,)).fetchall()
+        stale = [(slot,) for slot, pid, acquired_at in rows
+                 if now - acquired_at > self.SLOT_MAX_AGE or not _pid_alive(pid)]
+        db.executemany('DELETE FROM slots WHERE id = ?', stale)
+
+    def release(self, slot):
+        self._connection().execute('DELETE FROM slots WHERE id = ?', (slot,))
+
+    def status(self):
+        db = self._connection()
+        return {
+            'backend': self.backend,
+            'path': self.path,
+            'buckets': db.execute('SELECT count(*) FROM buckets').fetchone()[0],
+            'in_flight': dict(db.execute('SELECT route_class, count(*) FROM slots GROUP BY route_class').fetchall())
+        }
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Rejected(Exception):
+    """The request was not admitted; respond with `status` and Retry-After."""
+
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    def response(self):
+        """(body, status, headers) in the shape the views return."""
+        return {'error': str(self)}, self.status, {'Retry-After': str(max(1, math.ceil(self.retry_after)))}
+
+
+class AdmissionController:
+    """Applies the rate and concurrency limits of each route class."""
+
+    def __init__(self, state, rate_limits=None, concurrency_limits=None, trusted_proxies=0):
+        self.state = state
+        self.rate_limits = dict(rate_limits or {})                # class -> (rate, burst)
+        self.concurrency_limits = dict(concurrency_limits or {})  # class -> max in flight
+        self.trusted_proxies = trusted_proxies
+        if self.rate_limits and hasattr(state, 'idle_seconds'):
+            state.idle_seconds = max(burst / rate for rate, burst in self.rate_limits.values())
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        rate_limits = parse_limits(environ.get('AQUAWISE_RATE_LIMITS'), _parse_bucket)
+        concurrency_limits = parse_limits(environ.get('AQUAWISE_CONCURRENCY_LIMITS'), _parse_concurrency)
+        backend = environ.get('AQUAWISE_ADMISSION_BACKEND', 'memory')
+        if backend == 'memory':
+            state = MemoryAdmissionState()
+        elif backend == 'sqlite':
+            state = SQLiteAdmissionState(environ.get('AQUAWISE_ADMISSION_DB'))
+        else:
+            raise ValueError(f"AQUAWISE_ADMISSION_BACKEND must be 'memory' or 'sqlite', not {backend!r}")
+        return cls(state, rate_limits, concurrency_limits, int(environ.get('AQUAWISE_TRUSTED_PROXIES', 0)))
+
+    @property
+    def enabled(self):
+        return bool(self.rate_limits or self.concurrency_limits)
+
+    def client_ip(self, remote_addr, forwarded_for=None):
+        """The client address, looking through AQUAWISE_TRUSTED_PROXIES proxies' X-Forwarded-For."""
+        if self.trusted_proxies and forwarded_for:
+            hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+            if hops:
+                # Entries left of what our own proxies appended can be forged by the client
+                return hops[-min(self.trusted_proxies, len(hops))]
+        return remote_addr or 'unknown'
+
+    def admit(self, path, client):
+        """
+        Admit a request for path from client (an IP). Returns a ticket to pass to
+        release() when the request finishes, or None for unlimited routes; raises
+        Rejected when the request should be shed.
+        """
+        route_class = ROUTE_CLASSES.get(path)
+        if route_class is None:
+            return None
+        bucket = self.rate_limits.get(route_class)
+        limit = self.concurrency_limits.get(route_class)
+        if bucket is None and limit is None:
+            return None
+        try:
+            if bucket is not None:
+                wait = self.state.take((route_class, client), *bucket)
+                if wait:
+                    DECISIONS.inc(route_class=route_class, decision='rate_limited')
+                    raise Rejected(429, 'Too many requests. Please slow down.', wait)
+            slot = None
+            if limit is not None:
+                slot = self.state.acquire(route_class, limit)
+                if slot is None:
+                    DECISIONS.inc(route_class=route_class, decision='overloaded')
+                    raise Rejected(503, 'Server is busy. Please try again shortly.', 1)
+                IN_FLIGHT.inc(route_class=route_class)
+        except sqlite3.OperationalError as e:
+            # Locked past the busy timeout, disk full, ...: let the request through
+            print(f"⚠️ [Admission] State unavailable, admitting request: {e}")
+            DECISIONS.inc(route_class=route_class, decision='error')
+            return None
+        DECISIONS.inc(route_class=route_class, decision='admitted')
+        return (route_class, slot) if slot is not None else None
+
+    def release(self, ticket):
+        if ticket is None:
+            return
+        route_class, slot = ticket
+        IN_FLIGHT.dec(route_class=route_class)
+        try:
+            self.state.release(slot)
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ [Admission] Could not release slot (reclaimed after {SQLiteAdmissionState.SLOT_MAX_AGE:g}s): {e}")
+
+    def status(self):
+        return {
+            'rate_limits': {k: {'rate': r, 'burst': b} for k, (r, b) in self.rate_limits.items()},
+            'concurrency_limits': self.concurrency_limits,
+            'trusted_proxies': self.trusted_proxies,
+            'state': self.state.status()
+        }
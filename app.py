@@ -1,8 +1,30 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, abort, g
 from flask_cors import CORS
 import pickle
-import pandas as pd
+import numpy as np
 import os
+import math
+import hmac
+import time
+from forest_engine import (ARTIFACT_PREFIX, UnsupportedPipelineError, artifact_version,
+                           compile_pipeline, load_engine, read_manifest)
+from nn_engine import load_nn_engine, select_variant
+from prediction_cache import PredictionCache
+from model_registry import ModelRegistry, ReloadInProgress
+from micro_batcher import MicroBatcher, BatcherOverloaded, BatcherTimeout
+from static_assets import StaticAssets
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, process_memory, format_memory
+from profiler import PROFILE_HEADER, MemoryTracker, SamplingProfiler
+from mail_queue import MailQueue
+from otp_store import create_otp_store
+from auth_backend import UserCache, create_auth_backend
+from admission import AdmissionController, Rejected
+
+# Startup mode: by default pandas and firebase_admin are imported on first use and Firebase is
+# initialized on the first auth request. AQUAWISE_EAGER_INIT=1 does everything at import time.
+EAGER_INIT = os.environ.get('AQUAWISE_EAGER_INIT', '0') == '1'
+if EAGER_INIT:
+    import pandas as pd
 
 app = Flask(__name__, template_folder='.')
 # Strict CORS disabled for extensive dev compatibility
@@ -18,122 +40,645 @@ def after_request(response):
 
 # --- Load the trained model ---
 MODEL_FILE = 'optimized_irrigation_model.pkl'
+# Flat, memory-mapped copy of the compiled forest (written by retrain_model.py / forest_engine.py)
+MODEL_ARTIFACT = ARTIFACT_PREFIX
+
+def load_forest_model():
+    """
+    Return (model, version, source). Prefers the memory-mapped artifact, which every
+    worker shares through the page cache; falls back to unpickling the Pipeline.
+    """
+    pickle_version = artifact_version(MODEL_FILE) if os.path.exists(MODEL_FILE) else None
+
+    if os.path.exists(MODEL_ARTIFACT + '.json'):
+        try:
+            manifest = read_manifest(MODEL_ARTIFACT)
+            if pickle_version is None or manifest['source_version'] == pickle_version:
+                engine = load_engine(MODEL_ARTIFACT, mmap=True)
+                print(f"✅ Model memory-mapped from '{MODEL_ARTIFACT}.bin' ({engine.n_trees} trees)")
+                return engine, manifest['source_version'] or manifest['data_version'], 'memmap'
+            print(f"⚠️  '{MODEL_ARTIFACT}.json' was built from an older '{MODEL_FILE}'; "
+                  "run 'python forest_engine.py' to refresh it. Loading the pickle instead.")
+        except Exception as e:
+            print(f"⚠️  Could not memory-map '{MODEL_ARTIFACT}': {e}. Loading the pickle instead.")
 
-try:
     with open(MODEL_FILE, 'rb') as file:
         model = pickle.load(file)
     # Model reloaded for compatibility
     print(f"✅ Model loaded successfully from '{MODEL_FILE}'")
+
+    # Swap the sklearn Pipeline for the flattened array engine (same outputs, far less per-call overhead)
+    try:
+        model = compile_pipeline(model)
+        print(f"⚡ Model compiled to ForestEngine ({model.n_trees} trees)")
+    except UnsupportedPipelineError as e:
+        print(f"⚠️  Could not compile model, serving sklearn Pipeline instead: {e}")
+    return model, pickle_version, 'pickle'
+
+# --- Load the advanced neural network (NumPy engine, no TensorFlow runtime) ---
+NN_MODEL_DIR = 'model_advanced'
+NN_FILE_NAMES = ('model.json', 'group1-shard1of1.bin', 'scalers.json')
+NN_MODEL_FILES = [os.path.join(NN_MODEL_DIR, name) for name in NN_FILE_NAMES]
+# Serve the smallest quantized export (quantize_nn.py) whose test predictions stay within this
+# fraction of the mean prediction of the original's, e.g. 0.005; unset serves the original float32 weights
+NN_MAX_DEVIATION = float(os.environ['AQUAWISE_NN_MAX_DEVIATION']) if os.environ.get('AQUAWISE_NN_MAX_DEVIATION') else None
+
+def load_nn_model():
+    """Return (model, version, source) for the model_advanced/ network or its selected variant."""
+    model_dir = select_variant(NN_MODEL_DIR, NN_MAX_DEVIATION)
+    files = [os.path.join(model_dir, name) for name in NN_FILE_NAMES]
+    return load_nn_engine(model_dir), artifact_version(*files), model_dir
+
+# Crop base water values (also served by /crop-info)
+CROP_BASE_WATER = {
+    'rice': 6500, 
+    'maize': 5000, 
+    'pomegranate': 4400, 
+    'banana': 5100, 
+    'mango': 4600, 
+    'watermelon': 4700, 
+    'papaya': 4850
+}
+
+def canary_batch():
+    """Fixed readings every candidate model must predict sensibly before it is swapped in."""
+    import pandas as pd
+
+    rows = []
+    for crop, base in CROP_BASE_WATER.items():
+        for moisture, temp, humidity, rain in [(35.0, 32.0, 55.0, 60.0), (60.0, 22.0, 85.0, 220.0)]:
+            rows.append({'crop_type': crop, 'soil_moisture_percent': moisture, 'temperature_celsius': temp,
+                         'humidity_percent': humidity, 'rainfall_mm': rain, 'crop_water_base': float(base)})
+    return pd.DataFrame(rows)
+
+# Versioned model slots: requests use a snapshot, reloads swap atomically in the background
+MODEL_HISTORY = int(os.environ.get('AQUAWISE_MODEL_HISTORY', 1))
+# A candidate is rejected if any canary prediction moves by more than this fraction of the active
+# model's (0 disables the check; POST .../reload?force=1 accepts one deliberately different model)
+CANARY_MAX_CHANGE = float(os.environ.get('AQUAWISE_CANARY_MAX_CHANGE', 0.5)) or None
+# Admin reload/rollback commands are written here for the other workers' watchers (model_registry.py)
+MODEL_CONTROL_DIR = os.environ.get('AQUAWISE_MODEL_CONTROL_DIR', '.')
+model_registries = {
+    name: ModelRegistry(name, loader, canary=canary_batch, history=MODEL_HISTORY, max_change=CANARY_MAX_CHANGE,
+                        control_path=os.path.join(MODEL_CONTROL_DIR, f'.model-control-{name}.json'))
+    for name, loader in (('forest', load_forest_model), ('nn', load_nn_model))
+}
+# Files whose change triggers a reload when AQUAWISE_MODEL_WATCH_SECONDS > 0
+MODEL_WATCH_PATHS = {
+    'forest': [MODEL_ARTIFACT + '.json', MODEL_FILE],
+    'nn': NN_MODEL_FILES
+}
+# Also how often workers pick up reload/rollback commands issued through another worker
+MODEL_WATCH_SECONDS = float(os.environ.get('AQUAWISE_MODEL_WATCH_SECONDS', 0))
+
+_memory_before = process_memory()
+try:
+    model_registries['forest'].load_initial()
 except Exception as e:
     print(f"❌ ERROR Loading Model: {e}")
     print("⚠️  Use 'python train_model_advanced.py' to retrain the model for this environment.")
     print("⚠️  Server continues running for OTP/Auth features.")
-    model = None
+print(f"📊 Process memory before model load: {format_memory(_memory_before)}; after: {format_memory()}")
+
+try:
+    _nn_slot = model_registries['nn'].load_initial()
+    print(f"✅ Neural network loaded from '{_nn_slot.source}/' ({len(_nn_slot.model.layers)} folded layers)")
+except Exception as e:
+    print(f"⚠️  Neural network engine unavailable: {e}")
+
+prediction_cache = PredictionCache.from_env()
+if prediction_cache.enabled:
+    print(f"✅ Prediction cache enabled ({prediction_cache.max_entries} entries, TTL {prediction_cache.ttl_seconds:.0f}s)")
+
+# Request and stage timings (cheap enough to leave on: one perf_counter pair and a locked bucket increment)
+REQUEST_LATENCY = REGISTRY.histogram(
+    'aquawise_http_request_duration_seconds', 'Request latency by route', ['method', 'route'])
+REQUESTS = REGISTRY.counter(
+    'aquawise_http_requests_total', 'Responses by route and status code', ['method', 'route', 'status'])
+STAGE_LATENCY = REGISTRY.histogram(
+    'aquawise_stage_duration_seconds',
+    'Time spent in one stage of a request (validation, dataframe, predict, firebase_lookup, '
+    'firebase_update)', ['stage'])
+
+def observe_request(method, route, status, seconds):
+    """Record one finished request; also called by asgi.py for the routes it serves natively."""
+    REQUEST_LATENCY.observe(seconds, method=method, route=route)
+    REQUESTS.inc(method=method, route=route, status=status)
+
+# On-demand profiling (profiler.py): off unless AQUAWISE_PROFILE_RATE > 0 or a request carries a
+# signed X-Aquawise-Profile header; controlled and downloaded through /admin/profile
+profiler = SamplingProfiler.from_env(secret=os.environ.get('AQUAWISE_ADMIN_TOKEN'))
+memory_tracker = MemoryTracker()
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    if profiler.wants(request.headers.get(PROFILE_HEADER)):
+        profiler.start()
+        g.profiling = True
+
+@app.after_request
+def _record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # The URL rule ('/assets/<path:filename>'), not the raw path, keeps the label set bounded
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.teardown_request
+def _stop_profiling(exc):
+    # Runs even when the view raised, so a profiled thread is always released
+    if g.pop('profiling', False):
+        profiler.stop()
+
+# Admission control (admission.py): per-IP token buckets and in-flight caps per route class,
+# configured with AQUAWISE_RATE_LIMITS / AQUAWISE_CONCURRENCY_LIMITS; off when neither is set
+admission = AdmissionController.from_env()
+
+@app.before_request
+def _admit_request():
+    if not admission.enabled or request.method == 'OPTIONS':
+        return None
+    client = admission.client_ip(request.remote_addr, request.headers.get('X-Forwarded-For'))
+    try:
+        g.admission_ticket = admission.admit(request.path, client)
+    except Rejected as e:
+        return e.response()  # still timed and counted by _record_request
+
+@app.teardown_request
+def _release_admission(exc):
+    admission.release(g.pop('admission_ticket', None))
+
+REGISTRY.callback('aquawise_process_resident_memory_bytes', 'Resident set size of this worker',
+                  lambda: process_memory()['rss'])
+REGISTRY.callback('aquawise_process_proportional_memory_bytes', 'Proportional set size (shared pages split across processes)',
+                  lambda: process_memory()['pss'])
+REGISTRY.callback('aquawise_prediction_cache_entries', 'Entries in the prediction cache', lambda: len(prediction_cache))
+for _counter in ('hits', 'misses', 'evictions', 'expirations', 'invalidations'):
+    REGISTRY.callback(f'aquawise_prediction_cache_{_counter}_total', f'Prediction cache {_counter}',
+                      lambda name=_counter: getattr(prediction_cache, name), kind='counter')
+
+# Engine used when a request does not pick one ('forest' or 'nn')
+DEFAULT_ENGINE = os.environ.get('AQUAWISE_DEFAULT_ENGINE', 'forest')
+
+def _select_engine(requested):
+    """Return (engine name, active ModelSlot or None); raises ValueError for unknown names."""
+    name = str(requested or DEFAULT_ENGINE).lower()
+    if name not in model_registries:
+        raise ValueError(f"Unknown engine '{name}'. Choose one of: {sorted(model_registries)}")
+    return name, model_registries[name].active
+
+@app.before_request
+def _start_model_watchers():
+    # Watcher threads are per process, so each gunicorn worker starts its own on its first request
+    if MODEL_WATCH_SECONDS > 0:
+        for name, registry in model_registries.items():
+            registry.watch(MODEL_WATCH_PATHS[name], MODEL_WATCH_SECONDS)
+
+# Opt-in micro-batching: concurrent /predict calls share one vectorized predict per engine
+MICROBATCH_ENABLED = os.environ.get('AQUAWISE_MICROBATCH', '0') == '1'
+micro_batchers = {}
+if MICROBATCH_ENABLED:
+    for _name in ('forest', 'nn'):
+        micro_batchers[_name] = MicroBatcher.from_env(
+            _name, lambda df, name=_name: model_registries[name].active.model.predict(df))
+    _batcher = micro_batchers['forest']
+    print(f"✅ Micro-batching enabled (window {_batcher.window_seconds * 1000:.1f} ms, max batch {_batcher.max_batch_size})")
+
+# --- Static files and pages (fingerprinted, precompressed, ETag/304; see static_assets.py) ---
+static_assets = StaticAssets()
+
+def _static_response(response):
+    return response if response is not None else abort(404)
 
 # --- Route: Serve the HTML page ---
 @app.route('/')
 def home():
-    return render_template('index.html')
+    return _static_response(static_assets.page(request, 'index.html'))
 
 @app.route('/index.html')
 def index():
-    return render_template('index.html')
+    return _static_response(static_assets.page(request, 'index.html'))
 
 @app.route('/dashboard.html')
 def dashboard():
-    return render_template('dashboard.html')
+    return _static_response(static_assets.page(request, 'dashboard.html'))
 
 @app.route('/predict.html')
 def predict_page():
-    return render_template('predict.html')
+    return _static_response(static_assets.page(request, 'predict.html'))
 
 @app.route('/history.html')
 def history():
-    return render_template('history.html')
+    return _static_response(static_assets.page(request, 'history.html'))
 
 @app.route('/settings.html')
 def settings():
-    return render_template('settings.html')
+    return _static_response(static_assets.page(request, 'settings.html'))
 
 @app.route('/weather.html')
 def weather():
-    return render_template('weather.html')
+    return _static_response(static_assets.page(request, 'weather.html'))
 
 # --- STATIC FILE SERVING (Fix for Render/Production) ---
-from flask import send_from_directory
-
 @app.route('/assets/<path:filename>')
 def serve_assets(filename):
-    return send_from_directory('assets', filename)
+    return _static_response(static_assets.serve(request, 'assets', filename))
 
 @app.route('/css/<path:filename>')
 def serve_css(filename):
-    return send_from_directory('css', filename)
+    return _static_response(static_assets.serve(request, 'css', filename))
 
 @app.route('/js/<path:filename>')
 def serve_js(filename):
-    return send_from_directory('js', filename)
-
-# --- Route: Handle prediction requests ---
-@app.route('/predict', methods=['POST'])
-def predict():
-    if model is None:
-        return jsonify({'error': 'Model not loaded. Please check server logs.'}), 500
-    
+    return _static_response(static_assets.serve(request, 'js', filename))
+
+# --- Prediction input schema (shared by /predict and /predict/batch) ---
+REQUIRED_FIELDS = [
+    'crop_type',
+    'soil_moisture_percent',
+    'temperature_celsius',
+    'humidity_percent',
+    'rainfall_mm',
+    'crop_water_base'
+]
+NUMERIC_FIELDS = REQUIRED_FIELDS[1:]
+
+# Upper bound on rows per /predict/batch call (keeps one request from pinning a worker)
+MAX_BATCH_SIZE = int(os.environ.get('AQUAWISE_MAX_BATCH_SIZE', 1000))
+
+def predict_response(data, requested_engine=None):
+    """
+    Single-row prediction shared by the Flask view and the ASGI app ('asgi.py').
+
+    Returns (body, status, headers). Blocks while the model runs, so async
+    callers run it in an executor.
+    """
+    started = time.perf_counter()
     try:
-        # Get JSON data from request
-        data = request.json
+        if not isinstance(data, dict):
+            return {'error': 'Request body must be a JSON object'}, 400, {}
+
+        # Pick the engine (?engine=nn or {"engine": "nn"}); defaults to the Random Forest
+        try:
+            engine_name, slot = _select_engine(requested_engine or data.get('engine'))
+        except ValueError as e:
+            return {'error': str(e)}, 400, {}
+        if slot is None:
+            return {'error': 'Model not loaded. Please check server logs.'}, 500, {}
+        engine = slot.model
         
         # Validate required fields
-        required_fields = [
-            'crop_type', 
-            'soil_moisture_percent', 
-            'temperature_celsius', 
-            'humidity_percent', 
-            'rainfall_mm', 
-            'crop_water_base'
-        ]
-        
-        missing_fields = [field for field in required_fields if field not in data]
+        missing_fields = [field for field in REQUIRED_FIELDS if data.get(field) is None]
         if missing_fields:
-            return jsonify({'error': f'Missing fields: {missing_fields}'}), 400
-        
-        # Create DataFrame with the exact column order used during training
-        input_df = pd.DataFrame([{
-            'crop_type': data['crop_type'],
-            'soil_moisture_percent': float(data['soil_moisture_percent']),
-            'temperature_celsius': float(data['temperature_celsius']),
-            'humidity_percent': float(data['humidity_percent']),
-            'rainfall_mm': float(data['rainfall_mm']),
-            'crop_water_base': float(data['crop_water_base'])
-        }])
-        
-        # Make prediction
-        prediction = model.predict(input_df)[0]
+            return {'error': f'Missing fields: {missing_fields}'}, 400, {}
+
+        # Same rule as _validate_batch: a non-empty crop name, and numbers (or numeric strings) that are finite
+        invalid = [] if _is_crop_name(data['crop_type']) else ['crop_type']
+        numeric = {}
+        for field in NUMERIC_FIELDS:
+            try:
+                numeric[field] = float(data[field])
+            except (TypeError, ValueError):
+                numeric[field] = math.nan
+            if not math.isfinite(numeric[field]):
+                invalid.append(field)
+        if invalid:
+            return {'error': f'Invalid values for fields: {invalid}'}, 400, {}
+        if hasattr(engine, 'known_crops') and not engine.known_crops([data['crop_type']])[0]:
+            return {'error': f"Unknown crop_type for engine '{engine_name}': {data['crop_type']}"}, 400, {}
+        STAGE_LATENCY.observe(time.perf_counter() - started, stage='validation')
+
+        # Repeated sensor readings are served from the quantized prediction cache
+        version = slot.version
+        cache_key = prediction_cache.make_key(engine_name, data['crop_type'], numeric)
+        prediction = prediction_cache.get(cache_key, version)
+        cache_status = 'hit'
+
+        if prediction is None:
+            cache_status = 'miss'
+            if engine_name in micro_batchers:
+                # Joins the next micro-batch; blocks until its row is predicted
+                prediction = micro_batchers[engine_name].submit({'crop_type': data['crop_type'], **numeric})
+            else:
+                import pandas as pd
+
+                # Create DataFrame with the exact column order used during training
+                with STAGE_LATENCY.time(stage='dataframe'):
+                    input_df = pd.DataFrame([{'crop_type': data['crop_type'], **numeric}])
+
+                # Make prediction
+                with STAGE_LATENCY.time(stage='predict'):
+                    prediction = engine.predict(input_df)[0]
+            prediction_cache.put(cache_key, version, prediction)
         
         # Return result
-        return jsonify({
+        return {
             'success': True,
-            'water_requirement_liters_per_hectare': round(prediction, 2),
+            'water_requirement_liters_per_hectare': round(float(prediction), 2),
+            'engine': engine_name,
+            'model_version': slot.version,
+            'cache': cache_status,
             'input_data': data
-        })
+        }, 200, {}
     
+    except BatcherOverloaded as e:
+        return {'error': str(e)}, 503, {'Retry-After': '1'}
+    except BatcherTimeout as e:
+        return {'error': str(e)}, 504, {}
+    except Exception as e:
+        return {'error': str(e)}, 500, {}
+
+# --- Route: Handle prediction requests ---
+@app.route('/predict', methods=['POST'])
+def predict():
+    return predict_response(request.get_json(silent=True), request.args.get('engine'))
+
+def _batch_columns(payload):
+    """
+    Normalise a batch payload into ({field: list}, n_rows).
+
+    Accepts either an array of records (``[{...}, {...}]`` or
+    ``{"records": [...]}``) or a columnar object (``{"columns": {field: [...]}}``).
+    Missing values come back as None so validation can report them per row.
+    """
+    if isinstance(payload, dict) and 'columns' in payload:
+        columns = payload['columns']
+        if not isinstance(columns, dict):
+            raise ValueError("'columns' must be an object of field -> array")
+        lengths = {len(v) for v in columns.values() if isinstance(v, list)}
+        if len(lengths) > 1:
+            raise ValueError('All columns must have the same length')
+        n_rows = lengths.pop() if lengths else 0
+        return {f: columns[f] if isinstance(columns.get(f), list) else [None] * n_rows
+                for f in REQUIRED_FIELDS}, n_rows
+
+    records = payload.get('records') if isinstance(payload, dict) else payload
+    if not isinstance(records, list):
+        raise ValueError("Expected an array of records, {'records': [...]} or {'columns': {...}}")
+    return {f: [r.get(f) if isinstance(r, dict) else None for r in records]
+            for f in REQUIRED_FIELDS}, len(records)
+
+def _is_crop_name(value):
+    return isinstance(value, str) and bool(value.strip())
+
+def _validate_batch(columns, n_rows):
+    """
+    Validate every row in one pass.
+
+    Returns (clean columns as NumPy arrays, boolean mask of valid rows,
+    {row index: error message}).
+    """
+    import pandas as pd
+
+    errors = {}
+    crops = np.array(columns['crop_type'], dtype=object)
+    missing = {'crop_type': np.array([c is None for c in crops], dtype=bool)}
+    invalid = {'crop_type': np.array([c is not None and not _is_crop_name(c) for c in crops], dtype=bool)}
+
+    clean = {'crop_type': crops}
+    for field in NUMERIC_FIELDS:
+        raw = pd.Series(columns[field], dtype=object)
+        missing[field] = raw.isna().to_numpy()
+        values = pd.to_numeric(raw, errors='coerce').to_numpy(dtype=np.float64)
+        invalid[field] = ~missing[field] & ~np.isfinite(values)
+        clean[field] = values
+
+    any_missing = np.logical_or.reduce([missing[f] for f in REQUIRED_FIELDS])
+    any_invalid = np.logical_or.reduce([invalid[f] for f in REQUIRED_FIELDS])
+
+    for i in np.flatnonzero(any_missing):
+        errors[int(i)] = f'Missing fields: {[f for f in REQUIRED_FIELDS if missing[f][i]]}'
+    for i in np.flatnonzero(any_invalid & ~any_missing):
+        errors[int(i)] = f'Invalid values for fields: {[f for f in REQUIRED_FIELDS if invalid[f][i]]}'
+
+    valid = ~(any_missing | any_invalid)
+    return clean, valid, errors
+
+def predict_batch_response(payload, requested_engine=None):
+    """Batch prediction shared by the Flask view and the ASGI app; returns (body, status, headers)."""
+    try:
+        if not requested_engine and isinstance(payload, dict):
+            requested_engine = payload.get('engine')
+        engine_name, slot = _select_engine(requested_engine)
+    except ValueError as e:
+        return {'error': str(e)}, 400, {}
+    if slot is None:
+        return {'error': 'Model not loaded. Please check server logs.'}, 500, {}
+    engine = slot.model
+
+    try:
+        columns, n_rows = _batch_columns(payload)
+    except (ValueError, TypeError, AttributeError) as e:
+        return {'error': f'Invalid batch payload: {e}'}, 400, {}
+
+    if n_rows == 0:
+        return {'error': 'Batch is empty'}, 400, {}
+    if n_rows > MAX_BATCH_SIZE:
+        return {'error': f'Batch too large: {n_rows} rows (max {MAX_BATCH_SIZE})'}, 413, {}
+
+    try:
+        with STAGE_LATENCY.time(stage='validation'):
+            clean, valid, errors = _validate_batch(columns, n_rows)
+
+            # The NN only knows the crops it was trained on; reject the others per row
+            if hasattr(engine, 'known_crops'):
+                unknown = valid & ~engine.known_crops(clean['crop_type'])
+                for i in np.flatnonzero(unknown):
+                    errors[int(i)] = f"Unknown crop_type for engine '{engine_name}': {clean['crop_type'][i]}"
+                valid &= ~unknown
+
+        predictions = np.full(n_rows, np.nan)
+        if valid.any():
+            import pandas as pd
+
+            # One DataFrame and one model.predict call for the whole batch
+            with STAGE_LATENCY.time(stage='dataframe'):
+                input_df = pd.DataFrame({field: clean[field][valid] for field in REQUIRED_FIELDS})
+            with STAGE_LATENCY.time(stage='predict'):
+                predictions[valid] = engine.predict(input_df)
+
+        rounded = np.round(predictions, 2).tolist()
+        results = []
+        for i in range(n_rows):
+            if valid[i]:
+                results.append({'index': i, 'water_requirement_liters_per_hectare': rounded[i]})
+            else:
+                results.append({'index': i, 'error': errors[i]})
+
+        return {
+            'success': True,
+            'engine': engine_name,
+            'model_version': slot.version,
+            'count': n_rows,
+            'predicted': int(valid.sum()),
+            'failed': n_rows - int(valid.sum()),
+            'results': results
+        }, 200, {}
+
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500, {}
+
+# --- Route: Handle batch prediction requests (field gateways) ---
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    return predict_batch_response(request.get_json(silent=True), request.args.get('engine'))
+
+# --- Route: Prediction cache statistics (for tuning AQUAWISE_CACHE_RESOLUTION) ---
+@app.route('/predict/cache', methods=['GET'])
+def prediction_cache_stats():
+    return jsonify(prediction_cache.stats())
+
+# ==========================================
+#  🛠️ ADMIN: MODEL VERSIONS & HOT RELOAD
+# ==========================================
+# Admin routes are disabled unless AQUAWISE_ADMIN_TOKEN is set; send it as "Authorization: Bearer <token>".
+ADMIN_TOKEN = os.environ.get('AQUAWISE_ADMIN_TOKEN')
+
+def _admin_denied():
+    """Return an error response unless the request carries the admin token."""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled (set AQUAWISE_ADMIN_TOKEN)'}), 403
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied, ADMIN_TOKEN):
+        return jsonify({'error': 'Invalid admin token'}), 401
+    return None
+
+def _worker_info():
+    # An admin call runs in one worker; the others follow through the control file only if they watch it
+    return {'pid': os.getpid(), 'propagated_to_other_workers': MODEL_WATCH_SECONDS > 0}
+
+def _admin_registry(engine):
+    if engine not in model_registries:
+        return None, (jsonify({'error': f"Unknown engine '{engine}'"}), 404)
+    return model_registries[engine], None
+
+@app.route('/admin/models', methods=['GET'])
+def admin_models():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    return jsonify({name: registry.status() for name, registry in model_registries.items()})
+
+@app.route('/admin/models/<engine>/reload', methods=['POST'])
+def admin_reload_model(engine):
+    denied = _admin_denied()
+    if denied:
+        return denied
+    registry, error = _admin_registry(engine)
+    if error:
+        return error
+
+    wait = request.args.get('wait', '0') == '1'
+    force = request.args.get('force', '0') == '1'
+    try:
+        # The other workers are told only once this one has the new model live
+        record = registry.reload(wait=wait, force=force, publish=True)
+    except ReloadInProgress as e:
+        return jsonify({'error': str(e)}), 409
+    if not wait:
+        return jsonify({'success': True, 'status': 'reloading', 'engine': engine, **_worker_info()}), 202
+    failed = record['status'] in ('failed', 'rejected')
+    return jsonify({'success': not failed, **record, **registry.status(), **_worker_info()}), \
+        (500 if record['status'] == 'failed' else 409 if failed else 200)
+
+@app.route('/admin/models/<engine>/rollback', methods=['POST'])
+def admin_rollback_model(engine):
+    denied = _admin_denied()
+    if denied:
+        return denied
+    registry, error = _admin_registry(engine)
+    if error:
+        return error
+    try:
+        target = registry.rollback()
+    except LookupError as e:
+        return jsonify({'error': str(e), **_worker_info()}), 409
+    registry.publish('rollback', version=target.version)
+    return jsonify({'success': True, **registry.status(), **_worker_info()})
+
+# --- Route: Append labeled observations for incremental retraining (retrain_model.py --incremental) ---
+@app.route('/admin/observations', methods=['POST'])
+def admin_append_observations():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    from observation_log import OBSERVATION_LOG, append_observations
+
+    payload = request.get_json(silent=True)
+    rows = payload.get('rows') if isinstance(payload, dict) else payload
+    if not isinstance(rows, list) or not rows:
+        return jsonify({'error': "Body must be a non-empty list of rows or {'rows': [...]}"}), 400
+    appended, errors = append_observations(rows)
+    status = 200 if appended else 400
+    return jsonify({'success': appended > 0, 'appended': appended, 'log': OBSERVATION_LOG,
+                    'errors': {str(i): e for i, e in errors.items()}}), status
+
+# --- Routes: on-demand profiling and allocation snapshots (per worker) ---
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if request.method == 'POST':
+        settings = request.get_json(silent=True) or {}
+        try:
+            if 'rate' in settings:
+                rate = float(settings['rate'])
+                if not 0 <= rate <= 1:
+                    raise ValueError('rate must be between 0 and 1')
+                profiler.rate = rate
+            if 'interval_ms' in settings:
+                interval = float(settings['interval_ms'])
+                if interval <= 0:
+                    raise ValueError('interval_ms must be positive')
+                profiler.interval_seconds = interval / 1000
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify({'pid': os.getpid(), **profiler.status(), 'tracemalloc': memory_tracker.status()})
+
+@app.route('/admin/profile/stacks', methods=['GET'])
+def admin_profile_stacks():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    body = profiler.collapsed(reset=request.args.get('reset', '0') == '1')
+    return body, 200, {'Content-Type': 'text/plain; charset=utf-8',
+                       'Content-Disposition': f'attachment; filename="aquawise-{os.getpid()}.collapsed"'}
+
+@app.route('/admin/profile/memory', methods=['GET', 'DELETE'])
+def admin_profile_memory():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if request.method == 'DELETE':
+        return jsonify(memory_tracker.stop())
+    group = request.args.get('group', 'lineno')
+    if group not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'error': "group must be 'lineno', 'filename' or 'traceback'"}), 400
+    try:
+        top = int(request.args.get('top', 20))
+    except ValueError:
+        return jsonify({'error': 'top must be an integer'}), 400
+    return jsonify({'pid': os.getpid(), **memory_tracker.diff(top, group)})
+
+@app.route('/admin/admission', methods=['GET'])
+def admin_admission():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    return jsonify({'pid': os.getpid(), **admission.status()})
+
+# --- Route: Prometheus metrics ---
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return REGISTRY.render(), 200, {'Content-Type': METRICS_CONTENT_TYPE}
 
 # --- Route: Get crop base values (helper endpoint) ---
 @app.route('/crop-info', methods=['GET'])
 def crop_info():
-    crop_rules = {
-        'rice': 6500, 
-        'maize': 5000, 
-        'pomegranate': 4400, 
-        'banana': 5100, 
-        'mango': 4600, 
-        'watermelon': 4700, 
-        'papaya': 4850
-    }
-    return jsonify(crop_rules)
+    return jsonify(CROP_BASE_WATER)
 
 
 
@@ -143,171 +688,211 @@ def crop_info():
 import smtplib
 import random
 import string
-import time
 from email.message import EmailMessage
-import firebase_admin
-from firebase_admin import credentials, auth
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 # --- CONFIGURATION (USER MUST FILL THIS) ---
 SMTP_EMAIL = "faheem.hswn@gmail.com"
 SMTP_PASSWORD = "zyoo arad mwpd lekm".replace(" ", "")  # Sanitize spaces
 # -------------------------------------------
-
-# Initialize Firebase Admin SDK
-try:
-    if not firebase_admin._apps:
-        # Check for environment variable first (Best for Render/Cloud)
-        firebase_creds_env = os.environ.get('FIREBASE_CREDENTIALS')
-        
-        if firebase_creds_env:
-            # Load from JSON string in environment variable
-            import json
-            cred_dict = json.loads(firebase_creds_env)
-            cred = credentials.Certificate(cred_dict)
-        else:
-            # Fallback to local file (Development)
-            cred = credentials.Certificate("smart-irrigation-system-3a5ff-firebase-adminsdk-fbsvc-9a698da30d.json")
-            
-        firebase_admin.initialize_app(cred)
-    print("✅ Firebase Admin SDK Initialized")
-except Exception as e:
-    print(f"⚠️ WARNING: Firebase Admin SDK failed to initialize. Password reset will not work.\nReason: {e}")
-
-# In-Memory OTP Storage: {email: {'otp': '123456', 'expires_at': timestamp}}
-otp_storage = {}
+# SMTP server; point these at a local stand-in (python -m benchmarks.smtp_sink) for testing.
+# AQUAWISE_SMTP_SECURITY is 'ssl' (implicit TLS), 'starttls' or 'none'.
+SMTP_HOST = os.environ.get('AQUAWISE_SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('AQUAWISE_SMTP_PORT', 465))
+SMTP_SECURITY = os.environ.get('AQUAWISE_SMTP_SECURITY', 'ssl')
+SMTP_TIMEOUT = float(os.environ.get('AQUAWISE_SMTP_TIMEOUT', 30))
+
+# User accounts (auth_backend.py). Firebase Admin is imported and initialized on the first auth
+# request, so workers that only serve pages and /predict never pay for it (and nothing
+# gRPC-related exists before gunicorn forks). AQUAWISE_AUTH_BACKEND=fake runs offline.
+# Lookups by email go through a TTL cache with single-flight deduplication.
+auth_backend = create_auth_backend()
+user_cache = UserCache.from_env(auth_backend)
+REGISTRY.callback('aquawise_user_cache_entries', 'Emails in the user lookup cache', lambda: len(user_cache))
+
+if EAGER_INIT:
+    auth_backend.initialize()
+
+# OTP storage with a capacity and expiry (otp_store.py). AQUAWISE_OTP_BACKEND=sqlite shares it
+# between workers, so any worker can verify a code another one issued.
+OTP_TTL_SECONDS = 300
+otp_store = create_otp_store()
+REGISTRY.callback('aquawise_otp_storage_entries', 'OTPs held in the OTP store (including expired, unpurged ones)',
+                  lambda: len(otp_store))
 
 def generate_otp():
     return ''.join(random.choices(string.digits, k=6))
 
+def connect_smtp():
+    """Open and log in to the SMTP server (called by the mail_queue sender threads)."""
+    if SMTP_SECURITY == 'ssl':
+        server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    else:
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_SECURITY == 'starttls':
+            server.starttls()
+    server.ehlo_or_helo_if_needed()
+    if server.has_extn('auth'):  # local stand-ins usually accept mail without AUTH
+        server.login(SMTP_EMAIL, SMTP_PASSWORD)
+    return server
+
+# OTP emails are delivered in the background over persistent connections (mail_queue.py)
+mail_queue = MailQueue.from_env(lambda: connect_smtp())
+REGISTRY.callback('aquawise_smtp_queue_capacity', 'Maximum emails the delivery queue holds',
+                  lambda: mail_queue.max_size)
+
 def send_smtp_email(to_email, otp):
+    """Queue the OTP email; returns False if the delivery queue is full. Never blocks on SMTP."""
     # Only mock if the config is still the default placeholder
     if "your-email" in SMTP_EMAIL:
         print(f"⚠️ [MOCK EMAIL] SMTP not configured. OTP for {to_email} is: {otp}")
         return True # Pretend success for testing if not configured
-        
-    try:
-        msg = EmailMessage()
-        msg.set_content(f"Your AquaWise Verification Code is: {otp}\n\nThis code expires in 5 minutes.")
-        msg['Subject'] = 'AquaWise Password Reset Code'
-        msg['From'] = SMTP_EMAIL
-        msg['To'] = to_email
-
-        # Connect to Gmail SMTP
-        server = smtplib.SMTP_SSL('smtp.gmail.com', 465)
-        server.login(SMTP_EMAIL, SMTP_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-        print(f"✅ OTP sent to {to_email}")
-        return True
-    except Exception as e:
-        print(f"❌ SMTP Error: {e}")
-        return False
 
-# 1. SEND OTP ENDPOINT
-@app.route('/api/send-otp', methods=['POST', 'OPTIONS'])
-def send_otp_route():
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'ok'}), 200
-
-    data = request.json
-    email = data.get('email')
+    msg = EmailMessage()
+    msg.set_content(f"Your AquaWise Verification Code is: {otp}\n\nThis code expires in {OTP_TTL_SECONDS // 60} minutes.")
+    msg['Subject'] = 'AquaWise Password Reset Code'
+    msg['From'] = SMTP_EMAIL
+    msg['To'] = to_email
+    # A code that cannot be delivered before it expires is not worth sending
+    return mail_queue.submit(msg, deadline=time.time() + OTP_TTL_SECONDS)
+
+# Firebase Admin only has a blocking API (email goes through mail_queue). The auth flows below are coroutines that
+# hand those calls to a dedicated thread pool: the ASGI app ('asgi.py') awaits them on its event
+# loop, so slow auth requests wait without holding a worker, and the Flask views run them to
+# completion with asyncio.run().
+AUTH_IO_THREADS = int(os.environ.get('AQUAWISE_AUTH_IO_THREADS', 32))
+auth_io_executor = ThreadPoolExecutor(max_workers=AUTH_IO_THREADS, thread_name_prefix='auth-io')
+
+async def run_blocking(fn, *args, **kwargs):
+    """Await a blocking call (Firebase) on the auth I/O thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(auth_io_executor, functools.partial(fn, *args, **kwargs))
+
+def timed_stage(stage, fn, *args):
+    """Call fn(*args), recording its duration (not the pool wait) as `stage` in aquawise_stage_duration_seconds."""
+    with STAGE_LATENCY.time(stage=stage):
+        return fn(*args)
+
+def lookup_user(email):
+    """User record for email, or None if the email is not registered (blocking on a cache miss)."""
+    return user_cache.get_user_by_email(email)
+
+def set_user_password(uid, new_password):
+    """Update the password for uid and drop the user's cached record (blocking)."""
+    user_cache.update_user(uid, password=new_password)
+
+async def send_otp_flow(data):
+    """Check the email is registered, store a fresh OTP and queue its email; returns (body, status[, headers])."""
+    email = data.get('email') if isinstance(data, dict) else None
     
     if not email:
-        return jsonify({'error': 'Email is required'}), 400
+        return {'error': 'Email is required'}, 400
     
     # ✅ CHECK IF USER EXISTS BEFORE SENDING OTP
     try:
-        user = auth.get_user_by_email(email)
-        print(f"User found for OTP request: {email} (UID: {user.uid})")
-    except firebase_admin._auth_utils.UserNotFoundError:
-        print(f"OTP request failed - email not registered: {email}")
-        return jsonify({'error': 'This email is not registered. Please sign up first!'}), 404
+        user = await run_blocking(timed_stage, 'firebase_lookup', lookup_user, email)
     except Exception as e:
         print(f"Error checking email: {str(e)}")
-        return jsonify({'error': 'Failed to verify email. Please try again.'}), 500
+        return {'error': 'Failed to verify email. Please try again.'}, 500
+    if user is None:
+        print(f"OTP request failed - email not registered: {email}")
+        return {'error': 'This email is not registered. Please sign up first!'}, 404
+    print(f"User found for OTP request: {email} (UID: {user.uid})")
     
     # Generate OTP
     otp = str(random.randint(100000, 999999))
-    otp_storage[email] = {'otp': otp, 'expires_at': time.time() + 300} # 5 minutes
+    otp_store.set(email, otp, OTP_TTL_SECONDS)
     
+    # Only queued here; a sender thread delivers it (mail_queue.py)
     success = send_smtp_email(email, otp)
     if success:
-        print(f"✅ OTP sent to {email}")
-        return jsonify({'success': True, 'message': 'Verification code sent to your email!'})
+        return {'success': True, 'message': 'Verification code sent to your email!'}, 200
     else:
-        print(f"Email send failed: {e}") # 'e' from send_smtp_email is not available here, should be handled inside send_smtp_email or passed back.
-        return jsonify({'error': 'Failed to send email. Please try again.'}), 500
-
-# 2. VERIFY OTP ENDPOINT
-@app.route('/api/verify-otp', methods=['POST', 'OPTIONS'])
-def verify_otp_route():
-    if request.method == 'OPTIONS':
-        return jsonify({'status': 'ok'}), 200
+        print(f"Email queue full, OTP email for {email} not sent")
+        return {'error': 'Email service is busy. Please try again shortly.'}, 503, {'Retry-After': '5'}
 
-    data = request.json
-    email = data.get('email')
-    user_otp = data.get('otp')
+def verify_otp_response(data):
+    """Check a submitted OTP against otp_store (no remote calls); returns (body, status)."""
+    email = data.get('email') if isinstance(data, dict) else None
+    user_otp = data.get('otp') if isinstance(data, dict) else None
     
     if not email or not user_otp:
-        return jsonify({'error': 'Email and OTP required'}), 400
+        return {'error': 'Email and OTP required'}, 400
         
-    record = otp_storage.get(email)
+    check = otp_store.check(email, user_otp)
     
-    if not record:
-        return jsonify({'error': 'No OTP requested for this email'}), 400
+    if check == 'missing':
+        return {'error': 'No OTP requested for this email'}, 400
         
-    if time.time() > record['expires_at']:
-        del otp_storage[email]
-        return jsonify({'error': 'OTP has expired. Please request a new one.'}), 400
+    if check == 'expired':
+        otp_store.delete(email)
+        return {'error': 'OTP has expired. Please request a new one.'}, 400
         
-    if record['otp'] != user_otp:
-        return jsonify({'error': 'Invalid OTP'}), 400
+    if check != 'valid':
+        return {'error': 'Invalid OTP'}, 400
         
-    return jsonify({'success': True, 'message': 'OTP Verified'})
+    return {'success': True, 'message': 'OTP Verified'}, 200
 
-# 3. RESET PASSWORD ENDPOINT
-@app.route('/api/reset-password', methods=['POST'])
-def reset_password():
-    data = request.json
+async def reset_password_flow(data):
+    """Verify the OTP and set the new Firebase password; returns (body, status)."""
+    data = data if isinstance(data, dict) else {}
     email = data.get('email')
     otp = data.get('otp')
     new_password = data.get('new_password')
     
     if not email or not otp or not new_password:
-        return jsonify({'error': 'Missing required fields'}), 400
+        return {'error': 'Missing required fields'}, 400
 
     # Verify OTP is still valid
-    record = otp_storage.get(email)
-    if not record:
-        return jsonify({'error': 'Session expired. Please request a new code.'}), 400
+    check = otp_store.check(email, otp)
+    if check in ('missing', 'expired'):
+        return {'error': 'Session expired. Please request a new code.'}, 400
     
-    if record['otp'] != otp:
-        return jsonify({'error': 'Invalid verification code. Please try again.'}), 400
+    if check != 'valid':
+        return {'error': 'Invalid verification code. Please try again.'}, 400
           
     try:
         # Get user from Firebase
         print(f"Attempting password reset for: {email}")  # Debug log
-        user = auth.get_user_by_email(email)
+        user = await run_blocking(timed_stage, 'firebase_lookup', lookup_user, email)
+        if user is None:
+            print(f"Firebase user not found for email: {email}")  # Debug log
+            return {'error': 'Email not registered. Please sign up first.'}, 404
         print(f"User found: {user.uid}")  # Debug log
         
         # Update password
-        auth.update_user(
-            user.uid,
-            password=new_password
-        )
+        await run_blocking(timed_stage, 'firebase_update', set_user_password, user.uid, new_password)
         
         # Cleanup OTP
-        del otp_storage[email]
+        otp_store.delete(email)
         
         print(f"Password reset successful for: {email}")  # Debug log
-        return jsonify({'success': True, 'message': 'Password reset successfully!'})
+        return {'success': True, 'message': 'Password reset successfully!'}, 200
         
-    except firebase_admin._auth_utils.UserNotFoundError:
-        print(f"Firebase user not found for email: {email}")  # Debug log
-        return jsonify({'error': 'Email not registered. Please sign up first.'}), 404
     except Exception as e:
         print(f"Password reset error for {email}: {str(e)}")  # Debug log
-        return jsonify({'error': f'Failed to reset password: {str(e)}'}), 500
+        return {'error': f'Failed to reset password: {str(e)}'}, 500
+
+# 1. SEND OTP ENDPOINT
+@app.route('/api/send-otp', methods=['POST', 'OPTIONS'])
+def send_otp_route():
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    return asyncio.run(send_otp_flow(request.get_json(silent=True)))
+
+# 2. VERIFY OTP ENDPOINT
+@app.route('/api/verify-otp', methods=['POST', 'OPTIONS'])
+def verify_otp_route():
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    return verify_otp_response(request.get_json(silent=True))
+
+# 3. RESET PASSWORD ENDPOINT
+@app.route('/api/reset-password', methods=['POST'])
+def reset_password():
+    return asyncio.run(reset_password_flow(request.get_json(silent=True)))
 
 if __name__ == '__main__':
     print("\n" + "="*50)
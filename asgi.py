@@ -0,0 +1,253 @@
+"""
+ASGI entry point: the same API served from an event loop.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+The model, caches, registries and handlers are the ones in 'app.py'; this
+module only changes how requests are scheduled:
+
+    * /predict and /predict/batch run the shared handlers in a bounded
+      inference thread pool; when too many are waiting the request gets a
+      503 with Retry-After instead of queueing without limit
+    * /api/send-otp, /api/verify-otp and /api/reset-password await the auth
+      coroutines from 'app.py' directly on the loop, so hundreds of slow
+      Firebase/SMTP round trips can be in flight without blocking predictions
+    * every other route (pages, static files, admin, /metrics) is passed to
+      the Flask app in a thread
+
+The native routes go through the same admission control as the Flask views
+(admission.py): rate-limited or over-cap requests are answered with 429/503
+before their body is read.
+
+Configuration (environment):
+    AQUAWISE_ASGI_INFERENCE_THREADS  threads running model inference (default: CPU count)
+    AQUAWISE_ASGI_INFERENCE_QUEUE    max predictions waiting or running (default 256)
+    AQUAWISE_AUTH_IO_THREADS         threads for blocking Firebase/SMTP calls (default 32, see app.py)
+"""
+
+import asyncio
+import contextvars
+import functools
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import app as api
+
+INFERENCE_THREADS = int(os.environ.get('AQUAWISE_ASGI_INFERENCE_THREADS', os.cpu_count() or 1))
+INFERENCE_QUEUE = int(os.environ.get('AQUAWISE_ASGI_INFERENCE_QUEUE', 256))
+
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix='inference')
+_inference_slots = None  # asyncio.Semaphore, created on the serving loop
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type,Authorization'),
+    (b'access-control-allow-methods', b'GET,PUT,POST,DELETE,OPTIONS'),
+]
+
+
+# Set by _handle_native when the request was picked for profiling (see profiler.py)
+_profile_request = contextvars.ContextVar('profile_request', default=False)
+
+
+class InferenceOverloaded(RuntimeError):
+    """More predictions are waiting than AQUAWISE_ASGI_INFERENCE_QUEUE allows."""
+
+
+async def run_inference(fn, *args):
+    """Run a blocking prediction handler in the bounded inference pool."""
+    global _inference_slots
+    if _inference_slots is None:
+        _inference_slots = asyncio.Semaphore(INFERENCE_QUEUE)
+    if _inference_slots.locked():
+        raise InferenceOverloaded('Prediction queue is full, please retry shortly')
+    if _profile_request.get():
+        fn = functools.partial(api.profiler.run, fn)  # samples the inference thread running it
+    async with _inference_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(inference_executor, fn, *args)
+
+
+# --- Native async routes ---
+
+async def predict(query, data):
+    return await run_inference(api.predict_response, data, query.get('engine'))
+
+
+async def predict_batch(query, data):
+    return await run_inference(api.predict_batch_response, data, query.get('engine'))
+
+
+async def send_otp(query, data):
+    return await api.send_otp_flow(data)
+
+
+async def verify_otp(query, data):
+    return api.verify_otp_response(data)
+
+
+async def reset_password(query, data):
+    return await api.reset_password_flow(data)
+
+
+ROUTES = {
+    ('POST', '/predict'): predict,
+    ('POST', '/predict/batch'): predict_batch,
+    ('POST', '/api/send-otp'): send_otp,
+    ('POST', '/api/verify-otp'): verify_otp,
+    ('POST', '/api/reset-password'): reset_password,
+}
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def _send(send, status, body, headers=(), content_type=b'application/json'):
+    raw_headers = [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]
+    raw_headers += [(k.lower().encode(), str(v).encode()) for k, v in headers]
+    raw_headers += CORS_HEADERS
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _handle_native(handler, scope, receive, send):
+    started = time.perf_counter()
+    ticket = None
+    if api.admission.enabled:
+        forwarded = b','.join(v for k, v in scope.get('headers', []) if k == b'x-forwarded-for').decode('latin-1')
+        client = api.admission.client_ip((scope.get('client') or ('', 0))[0], forwarded)
+        try:
+            # Runs on the loop: the memory state is a dict update, the SQLite state one short transaction
+            ticket = api.admission.admit(scope['path'], client)
+        except api.Rejected as e:
+            body, status, headers = e.response()
+            await _send(send, status, json.dumps(body).encode(), headers.items())
+            api.observe_request(scope['method'], scope['path'], status, time.perf_counter() - started)
+            return
+    try:
+        await _serve_native(handler, scope, receive, send, started)
+    finally:
+        api.admission.release(ticket)
+
+
+async def _serve_native(handler, scope, receive, send, started):
+    profile_header = api.PROFILE_HEADER.lower().encode('latin-1')
+    signature = next((v.decode('latin-1') for k, v in scope.get('headers', []) if k == profile_header), None)
+    _profile_request.set(api.profiler.wants(signature))
+    query = {k: v[-1] for k, v in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+    raw = await _read_body(receive)
+    try:
+        data = json.loads(raw) if raw else None
+    except ValueError:
+        data = None  # handlers report a missing/invalid body like the Flask views do
+
+    try:
+        result = await handler(query, data)
+    except InferenceOverloaded as e:
+        result = ({'error': str(e)}, 503, {'Retry-After': '1'})
+    body, status, *extra = result  # (body, status) plus headers for 503s and predictions
+    headers = extra[0] if extra else {}
+    await _send(send, status, json.dumps(body).encode(), headers.items())
+    # Routes passed to Flask are recorded by its own request hooks
+    api.observe_request(scope['method'], scope['path'], status, time.perf_counter() - started)
+
+
+# --- Fallback: everything else is served by the Flask app ---
+
+def _wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif key != 'CONTENT_LENGTH':
+            key = f'HTTP_{key}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _call_flask(environ):
+    """Run the Flask app synchronously; returns (status code, headers, body bytes)."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    chunks = api.app(environ, start_response)
+    try:
+        body = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return response['status'], response['headers'], body
+
+
+async def _handle_flask(scope, receive, send):
+    body = await _read_body(receive)
+    loop = asyncio.get_running_loop()
+    status, headers, body = await loop.run_in_executor(None, _call_flask, _wsgi_environ(scope, body))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Same per-process setup Flask does in before_request
+            api._start_model_watchers()
+            print(f"✅ ASGI app ready ({INFERENCE_THREADS} inference threads, "
+                  f"{api.AUTH_IO_THREADS} auth I/O threads)")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            inference_executor.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        raise NotImplementedError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is not None:
+        return await _handle_native(handler, scope, receive, send)
+    return await _handle_flask(scope, receive, send)
@@ -0,0 +1,250 @@
+"""
+User accounts for the password-reset flow, and a cache in front of them.
+
+The OTP routes need two calls: look a user up by email, and update a user's
+password. They go through a backend with the Firebase Admin method names:
+
+    FirebaseAuthBackend   the real thing; firebase_admin is imported and
+                          initialized on first use, so start-up stays fast
+    FakeAuthBackend       in-process accounts for offline tests and benchmarks;
+                          optional latency, no network
+
+UserCache wraps a backend. Lookups are cached per email: found users for
+AQUAWISE_USER_CACHE_TTL seconds, unregistered emails for the shorter
+AQUAWISE_USER_CACHE_NEGATIVE_TTL (so a user who just signed up is found
+soon). Concurrent lookups of the same email share one backend call. Updating a
+user drops its cached entry in this process. Errors are never cached.
+
+Configuration (environment):
+    AQUAWISE_AUTH_BACKEND             'firebase' (default) or 'fake'
+    AQUAWISE_FAKE_AUTH_USERS          fake backend: comma-separated registered emails (default: every email)
+    AQUAWISE_FAKE_AUTH_LATENCY_MS     fake backend: delay of every call (default 0)
+    AQUAWISE_USER_CACHE_SIZE          max cached emails, 0 disables caching (default 10000)
+    AQUAWISE_USER_CACHE_TTL           seconds a found user is cached (default 300)
+    AQUAWISE_USER_CACHE_NEGATIVE_TTL  seconds an unregistered email is cached (default 30)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from metrics import REGISTRY
+
+FIREBASE_CREDENTIALS_FILE = 'smart-irrigation-system-3a5ff-firebase-adminsdk-fbsvc-9a698da30d.json'
+
+LOOKUPS = REGISTRY.counter(
+    'aquawise_user_lookups_total',
+    'User lookups by email (hit, negative_hit: cached "not registered", coalesced: joined a running call, miss)',
+    ['result'])
+
+
+class FirebaseAuthBackend:
+    """Firebase Admin SDK accounts; initialized on the first call."""
+
+    name = 'firebase'
+
+    def __init__(self, credentials_file=FIREBASE_CREDENTIALS_FILE):
+        self.credentials_file = credentials_file
+        self._lock = threading.Lock()
+        self._firebase = None
+
+    def initialize(self):
+        """Import and initialize the Firebase Admin SDK once; returns (firebase_admin, auth)."""
+        if self._firebase is not None:
+            return self._firebase
+        with self._lock:
+            if self._firebase is not None:
+                return self._firebase
+
+            import firebase_admin
+            from firebase_admin import credentials, auth
+            try:
+                if not firebase_admin._apps:
+                    # Check for environment variable first (Best for Render/Cloud)
+                    firebase_creds_env = os.environ.get('FIREBASE_CREDENTIALS')
+
+                    if firebase_creds_env:
+                        # Load from JSON string in environment variable
+                        cred = credentials.Certificate(json.loads(firebase_creds_env))
+                    else:
+                        # Fallback to local file (Development)
+                        cred = credentials.Certificate(self.credentials_file)
+
+                    firebase_admin.initialize_app(cred)
+                print("✅ Firebase Admin SDK Initialized")
+            except Exception as e:
+                print(f"⚠️ WARNING: Firebase Admin SDK failed to initialize. Password reset will not work.\nReason: {e}")
+
+            self._firebase = (firebase_admin, auth)
+            return self._firebase
+
+    def get_user_by_email(self, email):
+        """User record for email, or None if the email is not registered (blocking)."""
+        firebase_admin, auth = self.initialize()
+        try:
+            return auth.get_user_by_email(email)
+        except firebase_admin._auth_utils.UserNotFoundError:
+            return None
+
+    def update_user(self, uid, **fields):
+        _, auth = self.initialize()
+        auth.update_user(uid, **fields)
+
+
+class FakeUser:
+    def __init__(self, uid, email):
+        self.uid = uid
+        self.email = email
+        self.password = None
+
+
+class FakeAuthBackend:
+    """In-process accounts. With emails=None every address is registered."""
+
+    name = 'fake'
+
+    def __init__(self, emails=None, latency_seconds=0.0):
+        self.emails = None if emails is None else set(emails)
+        self.latency_seconds = latency_seconds
+        self.users = {}  # uid -> FakeUser, created on first lookup
+        self.calls = {'get_user_by_email': 0, 'update_user': 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        emails = environ.get('AQUAWISE_FAKE_AUTH_USERS')
+        return cls(emails=[e.strip() for e in emails.split(',') if e.strip()] if emails else None,
+                   latency_seconds=float(environ.get('AQUAWISE_FAKE_AUTH_LATENCY_MS', 0)) / 1000)
+
+    def initialize(self):
+        pass
+
+    def get_user_by_email(self, email):
+        with self._lock:
+            self.calls['get_user_by_email'] += 1
+        time.sleep(self.latency_seconds)
+        if self.emails is not None and email not in self.emails:
+            return None
+        uid = 'fake-' + hashlib.sha1(email.encode()).hexdigest()[:16]
+        with self._lock:
+            return self.users.setdefault(uid, FakeUser(uid, email))
+
+    def update_user(self, uid, **fields):
+        with self._lock:
+            self.calls['update_user'] += 1
+        time.sleep(self.latency_seconds)
+        with self._lock:
+            user = self.users.get(uid)
+            if user is None:
+                raise KeyError(f'No user with uid {uid!r}')
+            for field, value in fields.items():
+                setattr(user, field, value)
+
+
+class UserCache:
+    """Email -> user cache with positive/negative TTLs and single-flight lookups."""
+
+    def __init__(self, backend, max_entries=10000, ttl_seconds=300.0, negative_ttl_seconds=30.0,
+                 clock=time.monotonic):
+        self.backend = backend
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = float(ttl_seconds)
+        self.negative_ttl_seconds = float(negative_ttl_seconds)
+        self._clock = clock
+        self._entries = OrderedDict()  # email -> (user or None, expires_at)
+        self._inflight = {}            # email -> Future of the running backend call
+        self._invalidations = 0        # bumped by update_user; a lookup that raced one is not cached
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, backend, environ=os.environ):
+        return cls(
+            backend,
+            max_entries=int(environ.get('AQUAWISE_USER_CACHE_SIZE', 10000)),
+            ttl_seconds=float(environ.get('AQUAWISE_USER_CACHE_TTL', 300)),
+            negative_ttl_seconds=float(environ.get('AQUAWISE_USER_CACHE_NEGATIVE_TTL', 30))
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_user_by_email(self, email):
+        """Cached backend.get_user_by_email (blocking on a miss)."""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None:
+                if entry[1] > self._clock():
+                    self._entries.move_to_end(email)
+                    LOOKUPS.inc(result='hit' if entry[0] is not None else 'negative_hit')
+                    return entry[0]
+                del self._entries[email]
+            future = self._inflight.get(email)
+            leader = future is None
+            if leader:
+                LOOKUPS.inc(result='miss')
+                future = self._inflight[email] = Future()
+                invalidations = self._invalidations
+            else:
+                LOOKUPS.inc(result='coalesced')
+        if not leader:
+            return future.result()  # raises the leader's error too
+
+        try:
+            user = self.backend.get_user_by_email(email)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[email]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[email]
+            if self.max_entries > 0 and invalidations == self._invalidations:
+                ttl = self.ttl_seconds if user is not None else self.negative_ttl_seconds
+                self._entries[email] = (user, self._clock() + ttl)
+                self._entries.move_to_end(email)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        future.set_result(user)
+        return user
+
+    def update_user(self, uid, **fields):
+        """backend.update_user, then forget every cached entry for uid."""
+        try:
+            self.backend.update_user(uid, **fields)
+        finally:
+            with self._lock:
+                self._invalidations += 1
+                for email in [e for e, (user, _) in self._entries.items() if user is not None and user.uid == uid]:
+                    del self._entries[email]
+
+    def invalidate(self, email=None):
+        """Drop one email (or everything) from the cache."""
+        with self._lock:
+            self._invalidations += 1
+            if email is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(email, None)
+
+    def stats(self):
+        return {
+            'backend': self.backend.name,
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'negative_ttl_seconds': self.negative_ttl_seconds
+        }
+
+
+def create_auth_backend(environ=os.environ):
+    """The backend selected by AQUAWISE_AUTH_BACKEND."""
+    backend = environ.get('AQUAWISE_AUTH_BACKEND', 'firebase')
+    if backend == 'firebase':
+        return FirebaseAuthBackend()
+    if backend == 'fake':
+        return FakeAuthBackend.from_env(environ)
+    raise ValueError(f"AQUAWISE_AUTH_BACKEND must be 'firebase' or 'fake', not {backend!r}")
@@ -0,0 +1,115 @@
+"""
+Rows/sec and peak memory of the adapt_data.py data-engineering step:
+the original row-wise version (df.apply + per-row np.random.normal, whole
+file in memory) vs the chunked column-wise version.
+
+A synthetic raw CSV is generated by resampling datasets/irrigation_dataset.csv.
+The row-wise version is timed on fewer rows because it is slow. Peak memory
+(tracemalloc) is measured in a separate run, streaming to a CSV file, at two
+input sizes larger than one chunk: it is bounded by the chunk size, not the input.
+
+Usage:
+    python -m benchmarks.data_pipeline [--rows 2000000] [--legacy-rows 100000] [--chunksize 500000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import adapt_data
+
+
+def make_raw_csv(path, rows, seed=0):
+    """Resample the real dataset (with a few non-numeric values) into a raw CSV of `rows` rows."""
+    source = pd.read_csv(adapt_data.INPUT_FILE)
+    source = source[pd.to_numeric(source['temperature_celsius'], errors='coerce').notna()]
+    rng = np.random.default_rng(seed)
+    sample = source.iloc[rng.integers(0, len(source), size=rows)].reset_index(drop=True)
+    bad = rng.choice(rows, size=max(1, rows // 10000), replace=False)
+    sample['rainfall_mm'] = sample['rainfall_mm'].astype(object)
+    sample.loc[bad, 'rainfall_mm'] = 'n/a'
+    sample.to_csv(path, index=False)
+
+
+def legacy_engineer(path):
+    """The original adapt_data.py step: whole-frame load, df.apply and per-row noise."""
+    df = pd.read_csv(path)
+    df.rename(columns=adapt_data.RENAME_COLUMNS, inplace=True)
+    df['crop_type'] = df['crop_type'].str.lower().str.strip()
+    for col in adapt_data.NUMERIC_COLS_TO_CHECK:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df.fillna(df.mean(numeric_only=True), inplace=True)
+    df['soil_moisture_percent'] = np.round(np.random.uniform(30.0, 70.0, size=len(df)), 1)
+    df['crop_water_base'] = df['crop_type'].map(adapt_data.CROP_RULES_FULL).fillna(4000)
+
+    def calculate_water(row):
+        crop_base_water = adapt_data.CROP_RULES_FULL.get(row['crop_type'], 4000)
+        water_req = (
+            crop_base_water +
+            (float(row['temperature_celsius']) * 15) -
+            (float(row['soil_moisture_percent']) * 20) -
+            (float(row['rainfall_mm']) * 50) +
+            (float(row['humidity_percent']) * 10)
+        )
+        return max(500, int(water_req + np.random.normal(0, 150)))
+
+    df[adapt_data.TARGET_VARIABLE] = df.apply(calculate_water, axis=1)
+    return df[adapt_data.FINAL_COLUMNS].copy()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def peak_mb(fn, *args):
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--legacy-rows', type=int, default=100_000)
+    parser.add_argument('--chunksize', type=int, default=adapt_data.CHUNK_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_csv = os.path.join(tmp, 'legacy.csv')
+        half_csv = os.path.join(tmp, 'raw_half.csv')
+        big_csv = os.path.join(tmp, 'raw.csv')
+        out_csv = os.path.join(tmp, 'out.csv')
+        print(f"\n🧪 Generating {args.legacy_rows:,}, {args.rows // 2:,} and {args.rows:,} raw rows...")
+        make_raw_csv(legacy_csv, args.legacy_rows)
+        make_raw_csv(big_csv, args.rows)
+        make_raw_csv(half_csv, args.rows // 2)
+
+        _, legacy_s = timed(legacy_engineer, legacy_csv)
+        _, small_s = timed(adapt_data.load_engineered, legacy_csv, adapt_data.RANDOM_STATE, args.chunksize)
+        rows, big_s = timed(adapt_data.write_engineered, big_csv, out_csv, adapt_data.RANDOM_STATE, args.chunksize)
+
+        print(f"\n{'version':<34}{'rows':>12}{'seconds':>10}{'rows/sec':>14}")
+        print(f"{'row-wise (df.apply)':<34}{args.legacy_rows:>12,}{legacy_s:>10.2f}{args.legacy_rows / legacy_s:>14,.0f}")
+        print(f"{'column-wise, in memory':<34}{args.legacy_rows:>12,}{small_s:>10.2f}{args.legacy_rows / small_s:>14,.0f}")
+        print(f"{'column-wise, chunked to CSV':<34}{rows:>12,}{big_s:>10.2f}{rows / big_s:>14,.0f}")
+        print(f"\n⚡ Speed-up at {args.legacy_rows:,} rows: {legacy_s / small_s:.1f}x")
+
+        print("\n📊 Peak traced memory:")
+        print(f"   row-wise, {args.legacy_rows:,} rows:        {peak_mb(legacy_engineer, legacy_csv):8.1f} MB")
+        for csv, n in ((half_csv, args.rows // 2), (big_csv, args.rows)):
+            mb = peak_mb(adapt_data.write_engineered, csv, out_csv, adapt_data.RANDOM_STATE, args.chunksize)
+            print(f"   chunked to CSV, {n:,} rows:  {mb:8.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Local stand-ins for Firebase and SMTP, for load tests and benchmarks.
+
+Servers started on `benchmarks.fakes:wsgi_app` (gunicorn) or
+`benchmarks.fakes:asgi_app` (uvicorn) run the real app on
+auth_backend.FakeAuthBackend (every email registered) behind the real user
+lookup cache, and with the mail queue's SMTP connections going to FakeSMTP.
+Each fake call sleeps half of AQUAWISE_BENCH_AUTH_LATENCY_MS and succeeds;
+emails are delivered in the background by the real mail_queue.py senders. Every OTP is FAKE_OTP, so a
+client can complete send-otp -> verify-otp -> reset-password. Nothing
+external is contacted. (To exercise real SMTP delivery instead, run
+`python -m benchmarks.smtp_sink` and point AQUAWISE_SMTP_* at it.)
+"""
+
+import os
+import random
+import time
+
+FAKE_OTP = '424242'
+LATENCY_SECONDS = float(os.environ.get('AQUAWISE_BENCH_AUTH_LATENCY_MS', 0)) / 1000
+
+
+class FakeSMTP:
+    """Stands in for a logged-in smtplib connection."""
+
+    def send_message(self, message):
+        time.sleep(LATENCY_SECONDS / 2)
+
+    def quit(self):
+        pass
+
+    close = quit
+
+
+def connect_smtp():
+    return FakeSMTP()
+
+
+class _FixedOTPRandom:
+    """The random module, except that randint() (the OTP generator) returns FAKE_OTP."""
+
+    def randint(self, a, b):
+        return int(FAKE_OTP)
+
+    def __getattr__(self, name):
+        return getattr(random, name)
+
+
+def install():
+    """Patch the fakes into app.py; returns the app module."""
+    import app as api
+    from auth_backend import FakeAuthBackend
+    api.auth_backend = api.user_cache.backend = FakeAuthBackend(latency_seconds=LATENCY_SECONDS / 2)
+    api.connect_smtp = connect_smtp
+    api.random = _FixedOTPRandom()
+    return api
+
+
+def __getattr__(name):
+    # The app is only imported (and patched) when a server asks for it, so clients
+    # can import FAKE_OTP without loading the model
+    if name == 'wsgi_app':
+        return install().app
+    if name == 'asgi_app':
+        install()
+        import asgi
+        return asgi.app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,161 @@
+"""
+NN feature transform: the pandas create_features() from 'train_model_advanced.py'
+and the float64 transform in 'nn_engine.py' vs the shared float32 FeatureTransform
+('features.py').
+
+Checks parity first (raw features against the pandas version, standardized
+features and NN predictions against the old serving transform), then reports
+time and peak allocations per call for several batch sizes.
+
+Usage:
+    python -m benchmarks.features [--rows 1,64,10000,1000000] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from features import FeatureTransform
+from nn_engine import MODEL_DIR, load_nn_engine
+
+CROPS = ['banana', 'maize', 'mango', 'papaya', 'pomegranate', 'rice', 'watermelon']
+
+
+def legacy_create_features(data):
+    """create_features() as it was in 'train_model_advanced.py'."""
+    epsilon = 1e-6
+    df_feat = data.copy()
+    df_feat['temp_humidity_ratio'] = df_feat['temperature_celsius'] / (df_feat['humidity_percent'] + epsilon)
+    df_feat['humidity_rainfall_ratio'] = df_feat['humidity_percent'] / (df_feat['rainfall_mm'] + epsilon)
+    df_feat['temp_moisture_interaction'] = df_feat['temperature_celsius'] * df_feat['soil_moisture_percent']
+    df_feat['moisture_humidity_product'] = df_feat['soil_moisture_percent'] * df_feat['humidity_percent']
+    df_feat['moisture_rainfall_product'] = df_feat['soil_moisture_percent'] * df_feat['rainfall_mm']
+    df_feat['water_saturation_deficit'] = (100 - df_feat['humidity_percent']) * (df_feat['temperature_celsius'] / 25)
+    df_feat['soil_water_deficit'] = (100 - df_feat['soil_moisture_percent'])
+    df_feat['net_water_input'] = df_feat['rainfall_mm'] - (df_feat['temperature_celsius'] / 5)
+    df_feat['temp_squared'] = df_feat['temperature_celsius']**2
+    df_feat['moisture_squared'] = df_feat['soil_moisture_percent']**2
+    return df_feat
+
+
+def legacy_training_matrix(df, feature_columns, crop_classes):
+    """The trainer's old path: label-encode, create_features, select columns."""
+    df = df.copy()
+    df['crop_encoded'] = df['crop_type'].map({c: i for i, c in enumerate(crop_classes)})
+    return legacy_create_features(df)[feature_columns].values
+
+
+def legacy_serving_matrix(df, feature_columns, crop_classes, mean, scale):
+    """The old nn_engine transform: float64 features, standardized, then cast."""
+    raw = legacy_training_matrix(df, feature_columns, crop_classes).astype(np.float64)
+    return ((raw - mean) / scale).astype(np.float32)
+
+
+def random_readings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'crop_type': rng.choice(CROPS, size=n),
+        'soil_moisture_percent': np.round(rng.uniform(20, 80, n), 1),
+        'temperature_celsius': np.round(rng.uniform(10, 40, n), 2),
+        'humidity_percent': np.round(rng.uniform(15, 100, n), 2),
+        'rainfall_mm': np.round(rng.uniform(0, 300, n), 2),
+    })
+
+
+def measure(fn, repeat):
+    """Median milliseconds per call and peak bytes allocated by one call."""
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return float(np.median(samples)), peak
+
+
+def check_parity(scalers, engine):
+    columns, classes = scalers['feature_columns'], scalers['crop_classes']
+    mean = np.asarray(scalers['scaler_X_mean'])
+    scale = np.asarray(scalers['scaler_X_scale'])
+    df = random_readings(100_000, seed=1)
+    df.loc[:99, 'rainfall_mm'] = 0.0  # exercise the epsilon guard
+    assert np.array_equal(FeatureTransform.from_scalers(scalers).transform(df.astype({'crop_type': 'category'})),
+                          FeatureTransform.from_scalers(scalers).transform(df)), 'categorical crops differ'
+
+    transform = FeatureTransform.from_scalers(scalers)
+    raw_old = legacy_training_matrix(df, columns, classes)
+    raw_new = transform.transform(df, standardize=False)
+    rel = np.max(np.abs(raw_new - raw_old) / np.maximum(np.abs(raw_old), 1.0))
+
+    std_old = legacy_serving_matrix(df, columns, classes, mean, scale)
+    std_new = transform.transform(df)
+    std_diff = np.max(np.abs(std_new - std_old))
+
+    y_scale, y_mean = scalers['scaler_y_scale'][0], scalers['scaler_y_mean'][0]
+    pred_old = engine.forward(std_old)[:, 0].astype(np.float64) * y_scale + y_mean
+    pred_new = engine.predict(df)
+    pred_diff = np.max(np.abs(pred_new - pred_old))
+
+    print(f"\n🔬 Parity on {len(df):,} rows ({len(columns)} features from scalers.json)")
+    print(f"   raw features vs pandas create_features   max rel. diff {rel:.2e} (float32 storage)")
+    print(f"   standardized vs old nn_engine transform  max abs. diff {std_diff:.2e}")
+    print(f"   NN predictions                           max abs. diff {pred_diff:.2e} L/ha")
+    # Raw features differ only by the float32 cast; the serving path must be bit-identical
+    assert rel <= np.finfo(np.float32).eps and std_diff == 0 and pred_diff == 0, 'feature transform parity failed'
+    return {'max_rel_diff_raw': float(rel), 'max_abs_diff_standardized': float(std_diff),
+            'max_abs_diff_prediction': float(pred_diff)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', default='1,64,10000,1000000')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    with open(os.path.join(MODEL_DIR, 'scalers.json')) as f:
+        scalers = json.load(f)
+    engine = load_nn_engine()
+    results = {'parity': check_parity(scalers, engine), 'timings': []}
+
+    columns, classes = scalers['feature_columns'], scalers['crop_classes']
+    mean = np.asarray(scalers['scaler_X_mean'])
+    scale = np.asarray(scalers['scaler_X_scale'])
+    transform = FeatureTransform.from_scalers(scalers)
+
+    print(f"\n⏱️  Time per call (median of {args.repeat}) and peak allocation of one call")
+    for n in (int(r) for r in args.rows.split(',')):
+        df = random_readings(n)
+        df_categorical = df.astype({'crop_type': 'category'})  # how dataset_cache.py hands the trainer crops
+        out = np.empty((n, len(columns)), dtype=np.float32, order='F')
+        repeat = max(3, args.repeat // 4) if n >= 1_000_000 else args.repeat
+        cases = {
+            'pandas create_features': lambda: legacy_training_matrix(df, columns, classes),
+            'old nn_engine transform': lambda: legacy_serving_matrix(df, columns, classes, mean, scale),
+            'FeatureTransform': lambda: transform.transform(df),
+            'FeatureTransform (out=)': lambda: transform.transform(df, out=out),
+            'FeatureTransform (categorical)': lambda: transform.transform(df_categorical, out=out),
+        }
+        print(f"\n   {n:,} rows")
+        for label, fn in cases.items():
+            ms, peak = measure(fn, repeat)
+            results['timings'].append({'rows': n, 'case': label, 'ms': ms, 'peak_bytes': peak})
+            print(f"   {label:<31} {ms:10.3f} ms   peak {peak / 1e6:9.2f} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to '{args.json}'")
+
+
+if __name__ == '__main__':
+    main()
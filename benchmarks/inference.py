@@ -0,0 +1,96 @@
+"""
+Per-row and batch latency: sklearn Pipeline.predict vs the compiled ForestEngine.
+
+Usage:
+    python -m benchmarks.inference [--repeat 200] [--batch 1000]
+"""
+
+import argparse
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+from forest_engine import compile_pipeline
+
+MODEL_FILE = 'optimized_irrigation_model.pkl'
+
+SAMPLE_ROW = {
+    'crop_type': 'rice',
+    'soil_moisture_percent': 45.0,
+    'temperature_celsius': 27.5,
+    'humidity_percent': 78.0,
+    'rainfall_mm': 180.0,
+    'crop_water_base': 6500.0
+}
+
+CROPS = {'rice': 6500, 'maize': 5000, 'pomegranate': 4400, 'banana': 5100,
+         'mango': 4600, 'watermelon': 4700, 'papaya': 4850}
+
+
+def random_batch(n, seed=0):
+    rng = np.random.default_rng(seed)
+    crops = rng.choice(list(CROPS), size=n)
+    return pd.DataFrame({
+        'crop_type': crops,
+        'soil_moisture_percent': np.round(rng.uniform(30, 70, n), 1),
+        'temperature_celsius': np.round(rng.uniform(10, 40, n), 2),
+        'humidity_percent': np.round(rng.uniform(15, 100, n), 2),
+        'rainfall_mm': np.round(rng.uniform(20, 300, n), 2),
+        'crop_water_base': [float(CROPS[c]) for c in crops],
+    })
+
+
+def time_call(fn, repeat):
+    """Return per-call latencies in milliseconds."""
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return np.array(samples)
+
+
+def report(label, samples, rows=1):
+    print(f"   {label:<28} p50={np.percentile(samples, 50):8.3f} ms   "
+          f"p95={np.percentile(samples, 95):8.3f} ms   per-row={np.median(samples) / rows * 1000:9.2f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=1000)
+    args = parser.parse_args()
+
+    with open(MODEL_FILE, 'rb') as f:
+        pipeline = pickle.load(f)
+    engine = compile_pipeline(pipeline)
+
+    single = pd.DataFrame([SAMPLE_ROW])
+    batch = random_batch(args.batch)
+
+    assert np.array_equal(pipeline.predict(batch), engine.predict(batch)), 'engine output differs from Pipeline.predict'
+
+    print("=" * 70)
+    print(f"⏱️  Inference latency ({engine.n_trees} trees, repeat={args.repeat})")
+    print("=" * 70)
+    print("Single row:")
+    base = time_call(lambda: pipeline.predict(single), args.repeat)
+    fast = time_call(lambda: engine.predict(single), args.repeat)
+    report('sklearn Pipeline.predict', base)
+    report('ForestEngine.predict', fast)
+    print(f"   Speed-up: {np.median(base) / np.median(fast):.1f}x")
+
+    print(f"Batch of {args.batch} rows:")
+    repeat = max(5, args.repeat // 20)
+    base = time_call(lambda: pipeline.predict(batch), repeat)
+    fast = time_call(lambda: engine.predict(batch), repeat)
+    report('sklearn Pipeline.predict', base, args.batch)
+    report('ForestEngine.predict', fast, args.batch)
+    print(f"   Speed-up: {np.median(base) / np.median(fast):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""
+HTTP load test for the API: throughput, latency percentiles and error rate.
+
+Starts the server the way the Procfile does (gunicorn -c gunicorn.conf.py
+app:app), or uvicorn asgi:app with --server asgi, once per --workers value,
+or targets an already running server with --url. It then replays a weighted
+mix of requests for --duration seconds:
+
+    predict    POST /predict with one reading
+    nn         POST /predict?engine=nn
+    batch      POST /predict/batch with --batch-size readings
+    crop-info  GET /crop-info
+    auth       POST /api/send-otp -> /api/verify-otp -> /api/reset-password
+
+Readings are random or, with --payloads dataset, rows sampled from
+datasets/irrigation_dataset.csv. With --rps the load is open-loop: requests
+are scheduled at a fixed rate and latency is measured from the scheduled send
+time, so a stalled server shows up as queueing rather than as fewer requests.
+Without --rps each of the --concurrency clients sends back to back.
+
+The auth flow needs --fake-auth, which runs the server on benchmarks/fakes.py
+(Firebase and SMTP fakes sleeping --auth-latency-ms, a fixed OTP). Its servers
+keep OTPs in a SQLite store shared by all workers (AQUAWISE_OTP_BACKEND=sqlite,
+one database per run), so a verify or reset may land on any worker. Set
+AQUAWISE_OTP_BACKEND=memory to measure per-worker storage instead; with several
+workers the requests that land on a worker that never saw the OTP then show up
+as 400s in the status breakdown.
+
+Usage:
+    python -m benchmarks.loadtest [--workers 1,2,4] [--rps 200] [--concurrency 16] [--duration 20]
+                                  [--mix predict=8,batch=1,auth=1] [--payloads dataset] [--fake-auth]
+                                  [--server gunicorn|asgi] [--url http://host:port] [--json out.json]
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.fakes import FAKE_OTP
+from benchmarks.serving import free_port, wait_until_up
+from dataset_cache import DATASET_PATH, clean
+from retrain_model import CROP_BASE_WATER
+
+ENDPOINTS = ['predict', 'nn', 'batch', 'crop-info', 'auth']
+
+SERVERS = {
+    'gunicorn': lambda app, port, workers, extra: [
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+        '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', *extra, f'{app}:wsgi_app' if app else 'app:app'],
+    'asgi': lambda app, port, workers, extra: [
+        sys.executable, '-m', 'uvicorn', '--workers', str(workers), '--port', str(port),
+        '--log-level', 'warning', *extra, f'{app}:asgi_app' if app else 'asgi:app'],
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}' (choose from {ENDPOINTS})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Readings:
+    """Source of /predict rows: random readings or rows sampled from the training CSV."""
+
+    def __init__(self, source, path=DATASET_PATH):
+        self.rows = None
+        if source == 'dataset':
+            df, _ = clean(pd.read_csv(path, dtype=str))
+            df = df[df['crop_type'].isin(list(CROP_BASE_WATER))]
+            self.rows = [{**row, 'crop_water_base': CROP_BASE_WATER[row['crop_type']]}
+                         for row in df.drop(columns=['water_requirement_liters_per_hectare']).to_dict('records')]
+
+    def sample(self, rng):
+        if self.rows:
+            return rng.choice(self.rows)
+        crop = rng.choice(list(CROP_BASE_WATER))
+        return {'crop_type': crop, 'soil_moisture_percent': round(rng.uniform(30, 70), 1),
+                'temperature_celsius': round(rng.uniform(15, 40), 2), 'humidity_percent': round(rng.uniform(40, 95), 2),
+                'rainfall_mm': round(rng.uniform(20, 300), 2), 'crop_water_base': CROP_BASE_WATER[crop]}
+
+
+class Client:
+    """One keep-alive HTTP connection; reconnects when the server closes it (gunicorn sync workers do)."""
+
+    def __init__(self, base_url, timeout):
+        parts = urllib.parse.urlsplit(base_url)
+        self.host, self.port, self.timeout = parts.hostname, parts.port or 80, timeout
+        self.conn = None
+
+    def request(self, method, path, payload=None):
+        """Return the HTTP status, or 0 for a connection error/timeout."""
+        body = None if payload is None else json.dumps(payload).encode()
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                response.read()
+                if response.will_close:
+                    self.conn.close()
+                    self.conn = None
+                return response.status
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                # A kept-alive connection the server already closed fails at once; retry on a new one
+                if attempt:
+                    return 0
+        return 0
+
+
+def run_load(base_url, args, readings):
+    """Drive the server; returns {endpoint: [(status, latency seconds)]} measured after the warm-up."""
+    endpoints, weights = zip(*args.mix.items())
+    records = {name: [] for name in ('predict', 'nn', 'batch', 'crop-info', 'send-otp', 'verify-otp', 'reset-password')}
+    lock = threading.Lock()
+    started = time.perf_counter()
+    measure_from = started + args.warmup
+    stop = measure_from + args.duration
+    slots = itertools.count()
+
+    def record(name, status, sent, scheduled):
+        done = time.perf_counter()
+        if sent >= measure_from:
+            with lock:
+                records[name].append((status, done - (scheduled if scheduled is not None else sent)))
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = Client(base_url, args.timeout)
+        for i in itertools.count():
+            scheduled = None
+            if args.rps:
+                slot = next(slots)
+                scheduled = started + slot / args.rps
+                if scheduled >= stop:
+                    return
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            elif time.perf_counter() >= stop:
+                return
+
+            endpoint = rng.choices(endpoints, weights)[0]
+            sent = time.perf_counter()
+            if endpoint == 'predict':
+                record('predict', client.request('POST', '/predict', readings.sample(rng)), sent, scheduled)
+            elif endpoint == 'nn':
+                record('nn', client.request('POST', '/predict?engine=nn', readings.sample(rng)), sent, scheduled)
+            elif endpoint == 'batch':
+                rows = [readings.sample(rng) for _ in range(args.batch_size)]
+                record('batch', client.request('POST', '/predict/batch', rows), sent, scheduled)
+            elif endpoint == 'crop-info':
+                record('crop-info', client.request('GET', '/crop-info'), sent, scheduled)
+            else:
+                email = f'loadtest-{seed}-{i}@example.com'
+                record('send-otp', client.request('POST', '/api/send-otp', {'email': email}), sent, scheduled)
+                step = time.perf_counter()
+                record('verify-otp', client.request('POST', '/api/verify-otp', {'email': email, 'otp': FAKE_OTP}),
+                       step, None)
+                step = time.perf_counter()
+                record('reset-password', client.request('POST', '/api/reset-password', {
+                    'email': email, 'otp': FAKE_OTP, 'new_password': 'loadtest-password'}), step, None)
+
+    threads = [threading.Thread(target=worker, args=(args.seed + n,), daemon=True) for n in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return records, time.perf_counter() - measure_from
+
+
+def summarize(outcomes, elapsed):
+    latencies = np.array([t for _, t in outcomes]) * 1000
+    errors = sum(1 for status, _ in outcomes if not 200 <= status < 300)
+    summary = {'requests': len(outcomes), 'throughput_rps': round(len(outcomes) / elapsed, 1),
+               'error_rate': round(errors / len(outcomes), 4) if outcomes else 0.0,
+               'status': {str(k): v for k, v in sorted(Counter(s for s, _ in outcomes).items())}}
+    if len(latencies):
+        for p in (50, 95, 99):
+            summary[f'p{p}_ms'] = round(float(np.percentile(latencies, p)), 2)
+        summary['max_ms'] = round(float(latencies.max()), 2)
+    return summary
+
+
+def report(records, elapsed):
+    results = {name: summarize(outcomes, elapsed) for name, outcomes in records.items() if outcomes}
+    results['all'] = summarize([o for outcomes in records.values() for o in outcomes], elapsed)
+    for name, s in results.items():
+        status = ' '.join(f'{k}:{v}' for k, v in s['status'].items())
+        print(f"   {name:<15} {s['throughput_rps']:>8} req/s  p50 {s.get('p50_ms', '-'):>8}  p95 {s.get('p95_ms', '-'):>8}  "
+              f"p99 {s.get('p99_ms', '-'):>8}  max {s.get('max_ms', '-'):>9} ms   errors {s['error_rate'] * 100:5.1f}%   [{status}]")
+    return results
+
+
+def start_server(args, workers):
+    port = free_port()
+    env = dict(os.environ, PYTHONUNBUFFERED='1', AQUAWISE_BENCH_AUTH_LATENCY_MS=str(args.auth_latency_ms))
+    if args.no_server_cache:
+        env['AQUAWISE_CACHE_SIZE'] = '0'
+    state_dir = None
+    if args.fake_auth and 'AQUAWISE_OTP_BACKEND' not in os.environ:
+        state_dir = tempfile.mkdtemp(prefix='aquawise-loadtest-')  # mode 0700, removed with the server
+        env['AQUAWISE_OTP_BACKEND'] = 'sqlite'
+        env['AQUAWISE_OTP_DB'] = os.path.join(state_dir, 'otp.sqlite3')
+    command = SERVERS[args.server]('benchmarks.fakes' if args.fake_auth else None, port, workers, args.server_arg)
+    log = open(args.server_log, 'a') if args.server_log else subprocess.DEVNULL
+    server = subprocess.Popen(command, env=env, stdout=log, stderr=log)
+    server.state_dir = state_dir
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_up(base_url)
+    except RuntimeError:
+        server.terminate()
+        raise
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='load an already running server instead of starting one')
+    parser.add_argument('--server', choices=list(SERVERS), default='gunicorn')
+    parser.add_argument('--workers', default='1', help='comma-separated worker counts to sweep, e.g. 1,2,4')
+    parser.add_argument('--server-arg', action='append', default=[], help='extra server argument (repeatable)')
+    parser.add_argument('--server-log', help='append server output to this file')
+    parser.add_argument('--no-server-cache', action='store_true', help='start the server with AQUAWISE_CACHE_SIZE=0')
+    parser.add_argument('--rps', type=float, default=0, help='open-loop request rate (0 = closed loop)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('predict'))
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--payloads', choices=['random', 'dataset'], default='random')
+    parser.add_argument('--fake-auth', action='store_true', help='serve benchmarks/fakes.py instead of real Firebase/SMTP')
+    parser.add_argument('--auth-latency-ms', type=float, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    if 'auth' in args.mix and not args.fake_auth and not args.url:
+        parser.error('the auth endpoints need --fake-auth (or --url for a server you set up yourself)')
+
+    readings = Readings(args.payloads)
+    load = f"{args.rps:g} req/s open-loop" if args.rps else "closed loop"
+    mix = ', '.join(f'{k}={v:g}' for k, v in args.mix.items())
+    print(f"\n🚦 {load}, {args.concurrency} clients, {args.duration:g}s (+{args.warmup:g}s warm-up), "
+          f"mix {mix}, {args.payloads} payloads")
+
+    runs = []
+    targets = [(args.url, None)] if args.url else [(None, int(w)) for w in args.workers.split(',')]
+    for url, workers in targets:
+        server = None
+        if url is None:
+            server, url = start_server(args, workers)
+        print(f"\n🎯 {url}" + (f" ({args.server}, {workers} worker(s))" if workers else ''))
+        try:
+            records, elapsed = run_load(url, args, readings)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+                if server.state_dir:
+                    shutil.rmtree(server.state_dir, ignore_errors=True)
+        runs.append({'url': url, 'server': args.server if workers else None, 'workers': workers,
+                     'results': report(records, elapsed)})
+
+    if args.json:
+        config = {**vars(args), 'mix': args.mix}
+        with open(args.json, 'w') as f:
+            json.dump({'config': config, 'runs': runs}, f, indent=2)
+        print(f"\n✅ Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
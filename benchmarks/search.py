@@ -0,0 +1,60 @@
+"""
+Hyperparameter search: the original GridSearchCV (nested n_jobs=-1) vs
+successive halving (halving_search.py) on the adapt_data.py training set.
+
+Reports wall-clock time, the chosen hyperparameters, the best cross-validated
+MAE and the MAE on the same 20% holdout for both searches.
+
+Usage:
+    python -m benchmarks.search [--rows 0]    # 0 = datasets/irrigation_dataset.csv as is;
+                                              # N = resample it to N raw rows first
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from sklearn.metrics import mean_absolute_error
+
+import adapt_data
+from benchmarks.data_pipeline import make_raw_csv
+
+
+def run(search, X_train, X_test, Y_train, Y_test):
+    started = time.perf_counter()
+    model = adapt_data.make_search(search, verbose=False)
+    model.fit(X_train, Y_train)
+    seconds = time.perf_counter() - started
+    holdout = mean_absolute_error(Y_test, model.best_estimator_.predict(X_test))
+    return {'seconds': seconds, 'params': model.best_params_, 'cv_mae': -model.best_score_, 'holdout_mae': holdout}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = adapt_data.INPUT_FILE
+        if args.rows:
+            source = os.path.join(tmp, 'raw.csv')
+            make_raw_csv(source, args.rows)
+        df_final = adapt_data.load_engineered(source)
+
+    X_train, X_test, Y_train, Y_test = adapt_data.split_features(df_final)
+    print(f"\n🔎 {len(X_train):,} training rows, {os.cpu_count()} CPU(s)\n")
+
+    results = {search: run(search, X_train, X_test, Y_train, Y_test) for search in ('grid', 'halving')}
+    for search, r in results.items():
+        short = {k.removeprefix('regressor__'): v for k, v in r['params'].items()}
+        print(f"{search:>8}  {r['seconds']:7.1f} s   CV MAE {r['cv_mae']:8.2f}   holdout MAE {r['holdout_mae']:8.2f}   {short}")
+
+    grid, halving = results['grid'], results['halving']
+    print(f"\n⚡ Halving is {grid['seconds'] / halving['seconds']:.1f}x faster; "
+          f"holdout MAE {halving['holdout_mae'] - grid['holdout_mae']:+.2f} vs grid "
+          f"({(halving['holdout_mae'] / grid['holdout_mae'] - 1) * 100:+.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
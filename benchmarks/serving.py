@@ -0,0 +1,156 @@
+"""
+Mixed-load comparison of the serving modes: gunicorn sync (Procfile) vs ASGI (uvicorn asgi:app).
+
+Each mode is started as a real server. Auth clients loop on /api/send-otp
+while prediction clients loop on /predict; Firebase and SMTP are replaced by
+the fakes in benchmarks/fakes.py, which sleep for --auth-latency-ms, so no
+external service is contacted.
+Reports prediction latency percentiles and throughput for both request types.
+
+Usage:
+    python -m benchmarks.serving [--duration 10] [--auth-clients 50] [--predict-clients 4]
+                                 [--auth-latency-ms 500] [--workers 1] [--json out.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+MODES = {
+    'gunicorn-sync': lambda port, workers: [
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+        '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'benchmarks.fakes:wsgi_app'],
+    'asgi-uvicorn': lambda port, workers: [
+        sys.executable, '-m', 'uvicorn', '--workers', str(workers), '--port', str(port),
+        '--log-level', 'warning', 'benchmarks.fakes:asgi_app'],
+}
+
+CROPS = ['rice', 'maize', 'banana', 'mango', 'watermelon']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def post(url, payload, timeout=60):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return ok, time.perf_counter() - started
+
+
+def wait_until_up(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + '/crop-info', timeout=1):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f'Server at {base_url} did not start')
+
+
+def run_load(base_url, duration, auth_clients, predict_clients):
+    stop = time.perf_counter() + duration
+    results = {'predict': [], 'auth': []}
+    lock = threading.Lock()
+
+    def predict_loop(seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < stop:
+            row = {'crop_type': rng.choice(CROPS), 'soil_moisture_percent': rng.uniform(10, 90),
+                   'temperature_celsius': rng.uniform(15, 40), 'humidity_percent': rng.uniform(20, 95),
+                   'rainfall_mm': rng.uniform(0, 300), 'crop_water_base': 5000}
+            outcome = post(base_url + '/predict', row)
+            with lock:
+                results['predict'].append(outcome)
+
+    def auth_loop(seed):
+        while time.perf_counter() < stop:
+            outcome = post(base_url + '/api/send-otp', {'email': f'user{seed}@example.com'})
+            with lock:
+                results['auth'].append(outcome)
+
+    threads = [threading.Thread(target=predict_loop, args=(i,)) for i in range(predict_clients)]
+    threads += [threading.Thread(target=auth_loop, args=(i,)) for i in range(auth_clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def summarize(outcomes, duration):
+    latencies = np.array([t for ok, t in outcomes if ok]) * 1000
+    summary = {'requests': len(outcomes), 'errors': sum(1 for ok, _ in outcomes if not ok),
+               'throughput_rps': round(len(latencies) / duration, 1)}
+    if len(latencies):
+        for p in (50, 95, 99):
+            summary[f'p{p}_ms'] = round(float(np.percentile(latencies, p)), 2)
+    return summary
+
+
+def bench_mode(mode, args):
+    port = free_port()
+    env = dict(os.environ, AQUAWISE_BENCH_AUTH_LATENCY_MS=str(args.auth_latency_ms),
+               AQUAWISE_CACHE_SIZE='0', PYTHONUNBUFFERED='1')
+    server = subprocess.Popen(MODES[mode](port, args.workers), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        wait_until_up(base_url)
+        results = run_load(base_url, args.duration, args.auth_clients, args.predict_clients)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return {kind: summarize(outcomes, args.duration) for kind, outcomes in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--auth-clients', type=int, default=50)
+    parser.add_argument('--predict-clients', type=int, default=4)
+    parser.add_argument('--auth-latency-ms', type=float, default=500)
+    parser.add_argument('--workers', type=int, default=1, help='server processes per mode')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    print(f"\n🚦 {args.auth_clients} auth clients ({args.auth_latency_ms:.0f} ms fake Firebase+SMTP) + "
+          f"{args.predict_clients} /predict clients, {args.duration:.0f}s, {args.workers} worker(s) per mode\n")
+    report = {}
+    for mode in args.modes:
+        report[mode] = bench_mode(mode, args)
+        p, a = report[mode]['predict'], report[mode]['auth']
+        print(f"{mode:>14}  /predict {p['throughput_rps']:>8} req/s  p50 {p.get('p50_ms', '-'):>8} ms  "
+              f"p95 {p.get('p95_ms', '-'):>8} ms  p99 {p.get('p99_ms', '-'):>8} ms  errors {p['errors']}")
+        print(f"{'':>14}  auth     {a['throughput_rps']:>8} req/s  p50 {a.get('p50_ms', '-'):>8} ms  "
+              f"errors {a['errors']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'results': report}, f, indent=2)
+        print(f"\n✅ Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Local SMTP stand-in for testing the OTP mail queue (mail_queue.py) without a real mail server.
+
+Accepts every message (no AUTH, no TLS) and counts it. It can also inject
+slowness and failures so the queue's retry and reconnect paths can be
+exercised. Needs aiosmtpd (pip install aiosmtpd).
+
+Usage:
+    python -m benchmarks.smtp_sink [--port 8025] [--delay-ms 200] [--fail-rate 0.1] [--drop-every 5]
+
+then start the server against it:
+    AQUAWISE_SMTP_HOST=127.0.0.1 AQUAWISE_SMTP_PORT=8025 AQUAWISE_SMTP_SECURITY=none python app.py
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:  # only needed for this tool
+    Controller = None
+
+
+class SinkHandler:
+    def __init__(self, delay_seconds=0.0, fail_rate=0.0, drop_every=0, seed=0):
+        self.delay_seconds = delay_seconds
+        self.fail_rate = fail_rate
+        self.drop_every = drop_every
+        self.received = 0
+        self.failed = 0
+        self.dropped = 0
+        self.recipients = []
+        self._rng = random.Random(seed)
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.delay_seconds:
+            await asyncio.sleep(self.delay_seconds)
+        if self.fail_rate and self._rng.random() < self.fail_rate:
+            self.failed += 1
+            return '451 Temporary failure, try again later'
+        self.received += 1
+        self.recipients.extend(envelope.rcpt_tos)
+        if self.drop_every and self.received % self.drop_every == 0:
+            # Accept this one, then hang up as an idle-timeout server would (once the 250 is written)
+            self.dropped += 1
+            asyncio.get_running_loop().call_soon(server.transport.close)
+        return '250 OK'
+
+
+def start(port=8025, hostname='127.0.0.1', **options):
+    """Start the sink in a background thread; returns (controller, handler). Call controller.stop()."""
+    if Controller is None:
+        raise RuntimeError('benchmarks.smtp_sink needs aiosmtpd: pip install aiosmtpd')
+    handler = SinkHandler(**options)
+    controller = Controller(handler, hostname=hostname, port=port)
+    controller.start()
+    return controller, handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--delay-ms', type=float, default=0, help='delay before answering each message')
+    parser.add_argument('--fail-rate', type=float, default=0, help='fraction of messages answered with 451')
+    parser.add_argument('--drop-every', type=int, default=0, help='close the connection after every Nth message')
+    args = parser.parse_args()
+
+    controller, handler = start(args.port, delay_seconds=args.delay_ms / 1000,
+                                fail_rate=args.fail_rate, drop_every=args.drop_every)
+    print(f"📮 SMTP sink on 127.0.0.1:{args.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"   received {handler.received}  temporary failures {handler.failed}  "
+                  f"connections dropped {handler.dropped}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        controller.stop()
+
+
+if __name__ == '__main__':
+    main()
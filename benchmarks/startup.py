@@ -0,0 +1,92 @@
+"""
+Cold-start cost per subsystem: import time and first-request latency.
+
+Every measurement runs in a fresh interpreter so module caches don't hide
+the cost. Compares the default lazy startup with AQUAWISE_EAGER_INIT=1.
+
+Usage:
+    python -m benchmarks.startup [--runs 3]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+# Each snippet prints a JSON dict of {label: milliseconds}
+IMPORT_SNIPPETS = {
+    'numpy': "import numpy",
+    'pandas': "import pandas",
+    'flask': "import flask, flask_cors",
+    'firebase_admin': "import firebase_admin; from firebase_admin import auth, credentials",
+    'forest model (unpickle + compile)': (
+        "import pickle; from forest_engine import compile_pipeline; "
+        "compile_pipeline(pickle.load(open('optimized_irrigation_model.pkl', 'rb')))"),
+    'nn model (model_advanced/)': "from nn_engine import load_nn_engine; load_nn_engine()",
+}
+
+FIRST_REQUEST_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import app
+out = {'import app': (time.perf_counter() - t0) * 1000}
+client = app.app.test_client()
+row = {'crop_type': 'rice', 'soil_moisture_percent': 45, 'temperature_celsius': 27.5,
+       'humidity_percent': 78, 'rainfall_mm': 180, 'crop_water_base': 6500}
+for label, call in [
+    ('first GET /', lambda: client.get('/')),
+    ('first POST /predict', lambda: client.post('/predict', json=row)),
+    ('second POST /predict', lambda: client.post('/predict', json={**row, 'rainfall_mm': 181})),
+    ('first POST /api/send-otp (Firebase init)', lambda: client.post('/api/send-otp', json={'email': 'nobody@example.com'})),
+]:
+    t = time.perf_counter()
+    call()
+    out[label] = (time.perf_counter() - t) * 1000
+print(json.dumps(out))
+"""
+
+
+def run_snippet(code, env):
+    wrapped = code if 'json.dumps' in code else (
+        "import json, time\nt = time.perf_counter()\n" + code +
+        "\nprint(json.dumps({'ms': (time.perf_counter() - t) * 1000}))")
+    result = subprocess.run([sys.executable, '-c', wrapped], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def median_of(code, env, runs):
+    samples = [run_snippet(code, env) for _ in range(runs)]
+    return {k: float(np.median([s[k] for s in samples])) for k in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters per measurement (median)')
+    args = parser.parse_args()
+
+    base_env = dict(os.environ, PYTHONPATH=os.getcwd())
+    modes = {
+        'lazy (default)': dict(base_env, AQUAWISE_EAGER_INIT='0'),
+        'eager': dict(base_env, AQUAWISE_EAGER_INIT='1'),
+    }
+
+    print("=" * 70)
+    print(f"🚀 Startup benchmark (median of {args.runs} fresh interpreters)")
+    print("=" * 70)
+    print("Import / load time per subsystem:")
+    for label, code in IMPORT_SNIPPETS.items():
+        print(f"   {label:<40} {median_of(code, base_env, args.runs)['ms']:8.1f} ms")
+
+    for mode, env in modes.items():
+        print(f"\nStartup mode: {mode}")
+        for label, ms in median_of(FIRST_REQUEST_SNIPPET, env, args.runs).items():
+            print(f"   {label:<40} {ms:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+"""
+Training-pipeline scaling benchmark on seeded synthetic datasets.
+
+Generates irrigation datasets (the datasets/irrigation_dataset.csv schema,
+crops from CROP_RULES_FULL with each crop's climate ranges taken from the
+real dataset) at several sizes, then runs every stage of the three training
+pipelines under a wall clock and tracemalloc:
+
+    adapt     adapt_data.py: imputation means pass, chunked engineering,
+              Random Forest Pipeline (max_depth=10), evaluate, pickle + artifact
+    retrain   retrain_model.py: dataset_cache cold build and warm memory-map,
+              x5.5 scaling + crop_water_base, its Random Forest Pipeline,
+              evaluate, pickle + artifact
+    advanced  train_model_advanced.py: dataset_cache, features.py transform +
+              StandardScaler, the same Keras MLP for --epochs, evaluate, save
+              (fit/evaluate/save are skipped when TensorFlow is not installed)
+
+Fitting 100 fully grown trees on millions of rows does not fit in memory, so
+the model stages use at most --max-model-rows rows (recorded per stage).
+tracemalloc sees Python and NumPy allocations, not memory maps or
+TensorFlow's own allocator; rss_mb is the process RSS after the stage.
+Stages that fail (e.g. MemoryError) are recorded with their error and the
+rest of that pipeline is skipped.
+
+Results go to benchmarks/results/training-<commit>.json; compare two runs with
+--baseline.
+
+Usage:
+    python -m benchmarks.training [--sizes 10k,1m,10m] [--pipelines adapt,retrain,advanced]
+                                  [--max-model-rows 100000] [--trees 100] [--epochs 1]
+                                  [--data-dir DIR] [--output FILE] [--baseline FILE]
+"""
+
+import argparse
+import gc
+import json
+import os
+import pickle
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import train_test_split
+
+import adapt_data
+from dataset_cache import DATASET_PATH, clean, load_dataset
+from features import FEATURE_COLUMNS, FeatureTransform
+from forest_engine import compile_pipeline, save_engine
+from metrics import process_memory
+
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+TARGET = 'water_requirement_liters_per_hectare'
+GENERATE_CHUNK = 1_000_000
+
+
+class StageFailed(Exception):
+    """A stage raised; the remaining stages of the pipeline are skipped."""
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def crop_envelopes():
+    """Per-crop (min, max) of each climate column in the real dataset, for crops in CROP_RULES_FULL."""
+    real, _ = clean(pd.read_csv(DATASET_PATH, dtype=str))
+    columns = ['temperature_celsius', 'humidity_percent', 'rainfall_mm']
+    bounds = real.groupby('crop_type')[columns].agg(['min', 'max'])
+    return {crop: {c: (float(bounds.loc[crop, (c, 'min')]), float(bounds.loc[crop, (c, 'max')])) for c in columns}
+            for crop in adapt_data.CROP_RULES_FULL if crop in bounds.index}
+
+
+def make_dataset(path, rows, seed=0):
+    """Write `rows` synthetic rows in the irrigation_dataset.csv schema, one chunk at a time."""
+    envelopes = crop_envelopes()
+    crops = np.array(list(envelopes))
+    base = np.array([adapt_data.CROP_RULES_FULL[c] for c in crops], dtype=np.float64)
+    bounds = {column: (np.array([envelopes[c][column][0] for c in crops]), np.array([envelopes[c][column][1] for c in crops]))
+              for column in ('temperature_celsius', 'humidity_percent', 'rainfall_mm')}
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, GENERATE_CHUNK):
+        n = min(GENERATE_CHUNK, rows - start)
+        index = rng.integers(0, len(crops), size=n)
+        chunk = {'crop_type': crops[index], 'soil_moisture_percent': np.round(rng.uniform(30.0, 70.0, n), 1)}
+        for column, (low, high) in bounds.items():
+            chunk[column] = np.round(rng.uniform(low[index], high[index]), 2)
+        # Same rule as adapt_data.py, in the raw CSV's units (retrain_model.py scales by 5.5)
+        water = (base[index] + chunk['temperature_celsius'] * 15 - chunk['soil_moisture_percent'] * 20
+                 - chunk['rainfall_mm'] * 50 + chunk['humidity_percent'] * 10 + rng.normal(0, 150, n))
+        chunk[TARGET] = np.round(np.maximum(water, 500) / 5.5, 2)
+        frame = pd.DataFrame(chunk)
+        # A few unparseable readings, as in real exports, so the cleaning/imputation paths run
+        bad = rng.choice(n, size=max(1, n // 10_000), replace=False)
+        frame['rainfall_mm'] = frame['rainfall_mm'].astype(object)
+        frame.loc[bad, 'rainfall_mm'] = 'n/a'
+        frame.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+
+def dataset_path(data_dir, rows, seed):
+    path = os.path.join(data_dir, f'irrigation-{rows}-seed{seed}.csv')
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        make_dataset(path + '.tmp', rows, seed)
+        os.replace(path + '.tmp', path)
+        print(f"   🧪 Generated {rows:,} rows in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+class Runner:
+    """Times stages, captures tracemalloc peaks and collects the result records."""
+
+    def __init__(self, trace=True):
+        self.trace = trace
+        self.results = []
+
+    def stage(self, pipeline, rows, stage, fn, **extra):
+        gc.collect()
+        if self.trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        error = None
+        try:
+            value = fn()
+        except Exception as e:  # recorded, not raised: a 10M-row MemoryError is a result too
+            value, error = None, f'{type(e).__name__}: {e}'
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if self.trace else None
+        if self.trace:
+            tracemalloc.stop()
+
+        record = {'pipeline': pipeline, 'rows': rows, 'stage': stage, 'seconds': round(seconds, 4),
+                  'peak_mb': None if peak is None else round(peak / 2**20, 2),
+                  'rss_mb': round(process_memory()['rss'] / 2**20, 1), **extra}
+        if error:
+            record['error'] = error
+        self.results.append(record)
+        peak_text = '' if peak is None else f"   peak {peak / 2**20:9.1f} MB"
+        print(f"   {pipeline:<9} {stage:<14} {seconds:9.2f} s{peak_text}   rss {record['rss_mb']:8.1f} MB"
+              + (f"   ❌ {error}" if error else ''))
+        if error:
+            raise StageFailed(error)
+        return value
+
+
+def _cap(X, y, limit):
+    return (X, y) if len(X) <= limit else (X[:limit], y[:limit])
+
+
+def save_forest(model, out_dir):
+    with open(os.path.join(out_dir, 'model.pkl'), 'wb') as f:
+        pickle.dump(model, f)
+    save_engine(compile_pipeline(model), os.path.join(out_dir, 'model.forest'), source_version='benchmark')
+
+
+def bench_adapt(run, path, rows, args, work):
+    means = run.stage('adapt', rows, 'load', lambda: adapt_data.column_means(path))
+    df = run.stage('adapt', rows, 'features',
+                   lambda: pd.concat(adapt_data.iter_engineered(path, means=means), ignore_index=True))
+    X_train, X_test, y_train, y_test = adapt_data.split_features(df)
+    del df
+    X_fit, y_fit = _cap(X_train, y_train, args.max_model_rows)
+    model = adapt_data.make_pipeline().set_params(regressor__n_estimators=args.trees, regressor__max_depth=10,
+                                                  regressor__min_samples_split=5)
+    run.stage('adapt', rows, 'fit', lambda: model.fit(X_fit, y_fit), model_rows=len(X_fit))
+    X_eval, y_eval = _cap(X_test, y_test, args.max_model_rows)
+    run.stage('adapt', rows, 'evaluate', lambda: mean_absolute_error(y_eval, model.predict(X_eval)),
+              model_rows=len(X_eval))
+    run.stage('adapt', rows, 'save', lambda: save_forest(model, work))
+
+
+def bench_retrain(run, path, rows, args, work):
+    from retrain_model import add_crop_water_base, build_pipeline
+
+    cache_dir = os.path.join(work, 'cache')
+    run.stage('retrain', rows, 'load', lambda: load_dataset(path, cache_dir=cache_dir, verbose=False))
+    df = run.stage('retrain', rows, 'load (cached)', lambda: load_dataset(path, cache_dir=cache_dir, verbose=False))
+
+    def features():
+        frame = df.copy()
+        frame[TARGET] = frame[TARGET] * 5.5
+        frame = add_crop_water_base(frame)
+        columns = ['crop_type', 'soil_moisture_percent', 'temperature_celsius', 'humidity_percent',
+                   'rainfall_mm', 'crop_water_base']
+        return train_test_split(frame[columns], frame[TARGET], test_size=0.2, random_state=42)
+
+    X_train, X_test, y_train, y_test = run.stage('retrain', rows, 'features', features)
+    X_fit, y_fit = _cap(X_train, y_train, args.max_model_rows)
+    model = build_pipeline(args.trees)
+    run.stage('retrain', rows, 'fit', lambda: model.fit(X_fit, y_fit), model_rows=len(X_fit))
+    X_eval, y_eval = _cap(X_test, y_test, args.max_model_rows)
+    run.stage('retrain', rows, 'evaluate', lambda: r2_score(y_eval, model.predict(X_eval)), model_rows=len(X_eval))
+    run.stage('retrain', rows, 'save', lambda: save_forest(model, work))
+
+
+def build_mlp(keras, n_features):
+    """The Sequential model train_model_advanced.py trains."""
+    model = keras.Sequential([
+        keras.layers.Input(shape=(n_features,)),
+        keras.layers.Dense(256, activation='relu'),
+        keras.layers.BatchNormalization(),
+        keras.layers.Dropout(0.4),
+        keras.layers.Dense(128, activation='relu'),
+        keras.layers.BatchNormalization(),
+        keras.layers.Dropout(0.3),
+        keras.layers.Dense(64, activation='relu'),
+        keras.layers.BatchNormalization(),
+        keras.layers.Dropout(0.2),
+        keras.layers.Dense(32, activation='relu'),
+        keras.layers.Dense(1, activation='linear')
+    ])
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate=0.001), loss='huber', metrics=['mae'])
+    return model
+
+
+def bench_advanced(run, path, rows, args, work):
+    from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+    cache_dir = os.path.join(work, 'cache')
+    df = run.stage('advanced', rows, 'load', lambda: load_dataset(path, cache_dir=cache_dir, verbose=False))
+
+    def features():
+        target = df[TARGET].to_numpy(dtype=np.float64).reshape(-1, 1) * 20.0
+        classes = LabelEncoder().fit(df['crop_type']).classes_.tolist()
+        X = FeatureTransform(FEATURE_COLUMNS, classes).transform(df, standardize=False)
+        X_train, X_test, y_train, y_test = train_test_split(X, target, test_size=0.2, random_state=42)
+        scaler_X, scaler_y = StandardScaler(), StandardScaler()
+        return (scaler_X.fit_transform(X_train), scaler_X.transform(X_test),
+                scaler_y.fit_transform(y_train), scaler_y.transform(y_test))
+
+    X_train, X_test, y_train, y_test = run.stage('advanced', rows, 'features', features)
+
+    try:
+        os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+        from tensorflow import keras
+    except ImportError:
+        for stage in ('fit', 'evaluate', 'save'):
+            run.results.append({'pipeline': 'advanced', 'rows': rows, 'stage': stage, 'skipped': 'tensorflow not installed'})
+        print("   advanced  fit/evaluate/save skipped (tensorflow not installed)")
+        return
+
+    X_fit, y_fit = _cap(X_train, y_train, args.max_model_rows)
+    model = build_mlp(keras, X_train.shape[1])
+    run.stage('advanced', rows, 'fit', lambda: model.fit(X_fit, y_fit, epochs=args.epochs, batch_size=32, verbose=0),
+              model_rows=len(X_fit), epochs=args.epochs)
+    X_eval, y_eval = _cap(X_test, y_test, args.max_model_rows)
+    run.stage('advanced', rows, 'evaluate', lambda: model.predict(X_eval, verbose=0, batch_size=1024),
+              model_rows=len(X_eval))
+    run.stage('advanced', rows, 'save', lambda: model.save(os.path.join(work, 'model.keras')))
+
+
+PIPELINES = {'adapt': bench_adapt, 'retrain': bench_retrain, 'advanced': bench_advanced}
+
+
+def environment():
+    def git(*cmd):
+        try:
+            return subprocess.run(['git', *cmd], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {
+        'commit': git('rev-parse', '--short', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline_path):
+    """Print seconds and peak memory against a previous results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r['pipeline'], r['rows'], r['stage']): r for r in baseline['results'] if 'seconds' in r}
+    print(f"\n📐 Against {baseline_path} (commit {baseline['environment'].get('commit')})")
+    for r in results:
+        old = previous.get((r['pipeline'], r['rows'], r['stage']))
+        if old is None or 'seconds' not in r or 'error' in r or 'error' in old:
+            continue
+        time_ratio = r['seconds'] / max(old['seconds'], 1e-9)
+        peak = ''
+        if r.get('peak_mb') is not None and old.get('peak_mb'):
+            peak = f"   peak x{r['peak_mb'] / old['peak_mb']:.2f}"
+        flag = '  ⚠️' if time_ratio > 1.2 else ''
+        print(f"   {r['pipeline']:<9} {r['rows']:>11,} {r['stage']:<14} time x{time_ratio:.2f}{peak}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10k,1m,10m')
+    parser.add_argument('--pipelines', default=','.join(PIPELINES))
+    parser.add_argument('--max-model-rows', type=int, default=100_000)
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', help='keep generated datasets here (default: a temporary directory)')
+    parser.add_argument('--no-tracemalloc', action='store_true', help='time only (tracemalloc slows pandas parsing)')
+    parser.add_argument('--output')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    sizes = [parse_size(s) for s in args.sizes.split(',')]
+    pipelines = [p.strip() for p in args.pipelines.split(',')]
+    unknown = [p for p in pipelines if p not in PIPELINES]
+    if unknown:
+        parser.error(f'unknown pipelines: {unknown}')
+
+    env = environment()
+    output = args.output or os.path.join(RESULTS_DIR, f"training-{env['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    settings = {**vars(args), 'sizes': sizes, 'pipelines': pipelines}
+
+    def write_results():
+        # Rewritten after every pipeline, so a run killed by the OOM killer still leaves its results
+        with open(output, 'w') as f:
+            json.dump({'environment': env, 'settings': settings, 'results': run.results}, f, indent=2)
+
+    run = Runner(trace=not args.no_tracemalloc)
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='aquawise-bench-')
+    os.makedirs(data_dir, exist_ok=True)
+    try:
+        for rows in sizes:
+            print(f"\n📦 {rows:,} rows")
+            path = dataset_path(data_dir, rows, args.seed)
+            for name in pipelines:
+                work = tempfile.mkdtemp(prefix=f'aquawise-{name}-')
+                try:
+                    PIPELINES[name](run, path, rows, args, work)
+                except StageFailed:
+                    pass
+                finally:
+                    shutil.rmtree(work, ignore_errors=True)
+                    gc.collect()
+                    write_results()
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(f"\n💾 Results written to '{output}'")
+    if args.baseline:
+        compare(run.results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Compaction stage: build smaller candidate models from the current forest and
+report what each one costs and how close it stays to the model it replaces.
+
+Candidates (all sklearn Pipelines with the same preprocessor, so app.py can load any of them):
+
+    * trees-N        the first N trees of the current forest, no retraining
+    * depth-D        a forest retrained on the base split with max_depth=D
+    * distilled-gbr  gradient boosting fit to the current model's predictions
+    * distilled-linear-gbr
+                     a linear model plus shallow boosted trees on its residuals,
+                     also fit to the current model's predictions
+
+Distilled students learn from the current model (the teacher) on the training
+rows plus jittered copies of them, so they copy its behaviour rather than the
+label noise. Forest candidates compile to the memory-mapped artifact; the
+boosted ones are served from the pickle by the sklearn Pipeline.
+
+For every candidate the report lists pickle and artifact size, load time,
+single-row and batch latency in its serving form, R²/MAE on the base holdout,
+and R²/MAE against the current model's predictions on the same rows. Nothing is
+deployed until one is picked:
+
+Usage:
+    python compact_model.py                      # build candidates + report
+    python compact_model.py --candidates trees-50 depth-10
+    python compact_model.py --deploy trees-50    # install a reported candidate
+"""
+
+import argparse
+import json
+import os
+import pickle
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.pipeline import Pipeline
+
+from forest_engine import UnsupportedPipelineError, artifact_version, compile_pipeline, load_engine, save_engine
+from observation_log import LEDGER_FILE, append_ledger, read_ledger
+from retrain_model import (FEATURE_COLS, MODEL_FILE, build_pipeline, load_base_split, load_model,
+                           print_reload_hint, save_model)
+
+CANDIDATE_DIR = 'compact_candidates'
+REPORT_FILE = os.path.join(CANDIDATE_DIR, 'report.json')
+
+DEFAULT_CANDIDATES = ['trees-50', 'trees-20', 'depth-12', 'depth-8', 'distilled-gbr', 'distilled-linear-gbr']
+NUMERIC_COLS = [c for c in FEATURE_COLS if c not in ('crop_type', 'crop_water_base')]
+
+# Teacher-labelled jittered copies of each training row used for distillation
+AUGMENT_COPIES = 10
+JITTER = 0.1  # fraction of each column's standard deviation
+BATCH_ROWS = 1000
+REPEAT = 200
+
+
+def _with_regressor(teacher, regressor):
+    """Unfitted Pipeline with the teacher's preprocessor spec and a new regressor."""
+    return Pipeline(steps=[
+        ('preprocessor', clone(teacher.named_steps['preprocessor'])),
+        ('regressor', regressor)
+    ])
+
+
+def distillation_set(teacher, X_train, copies=AUGMENT_COPIES, seed=42):
+    """Training rows plus jittered copies, all labelled by the teacher."""
+    rng = np.random.default_rng(seed)
+    X = X_train.reset_index(drop=True)
+    parts = [X]
+    std = X[NUMERIC_COLS].std().to_numpy()
+    for _ in range(copies):
+        jittered = X.copy()
+        noise = rng.normal(0.0, JITTER, size=(len(X), len(NUMERIC_COLS))) * std
+        jittered[NUMERIC_COLS] = np.clip(X[NUMERIC_COLS].to_numpy() + noise, 0, None)
+        parts.append(jittered)
+    X_aug = pd.concat(parts, ignore_index=True)
+    return X_aug, teacher.predict(X_aug)
+
+
+def build_candidate(name, teacher, X_train, y_train, distilled):
+    """Fit the named candidate; returns (model, description)."""
+    kind, _, arg = name.partition('-')
+    if kind == 'trees':
+        n = int(arg)
+        model = pickle.loads(pickle.dumps(teacher))
+        regressor = model.named_steps['regressor']
+        if n >= len(regressor.estimators_):
+            raise ValueError(f'{name}: the current forest only has {len(regressor.estimators_)} trees')
+        regressor.estimators_ = regressor.estimators_[:n]
+        regressor.set_params(n_estimators=n)
+        return model, f'first {n} of {len(teacher.named_steps["regressor"].estimators_)} trees'
+
+    if kind == 'depth':
+        model = build_pipeline()
+        model.set_params(regressor__max_depth=int(arg))
+        model.fit(X_train, y_train)
+        return model, f'100 trees retrained with max_depth={arg}'
+
+    if name == 'distilled-gbr':
+        model = _with_regressor(teacher, GradientBoostingRegressor(
+            n_estimators=200, max_depth=4, learning_rate=0.1, subsample=0.8, random_state=42))
+        model.fit(*distilled)
+        return model, '200 boosted depth-4 trees fit to the current model'
+
+    if name == 'distilled-linear-gbr':
+        # Boosting starts from the linear fit, so the trees only model its residuals
+        model = _with_regressor(teacher, GradientBoostingRegressor(
+            init=LinearRegression(), n_estimators=60, max_depth=3, learning_rate=0.1, random_state=42))
+        model.fit(*distilled)
+        return model, 'linear model + 60 depth-3 residual trees fit to the current model'
+
+    raise ValueError(f'Unknown candidate {name!r}; expected trees-N, depth-D, distilled-gbr or distilled-linear-gbr')
+
+
+def _p50(fn, repeat):
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)) * 1000
+
+
+def measure(model, X_test, y_test, reference, repeat=REPEAT):
+    """Size, load time, latency and accuracy of one model in the form app.py would serve it."""
+    blob = pickle.dumps(model)
+    result = {'pickle_bytes': len(blob), 'artifact_bytes': None}
+    result['unpickle_ms'] = _p50(lambda: pickle.loads(blob), max(3, repeat // 20))
+
+    try:
+        served = compile_pipeline(model)
+    except UnsupportedPipelineError:
+        served = model
+        result['serving'] = 'pickle'
+        result['load_ms'] = result['unpickle_ms']
+    else:
+        result['serving'] = 'memmap'
+        with tempfile.TemporaryDirectory() as tmp:
+            prefix = os.path.join(tmp, 'candidate')
+            result['artifact_bytes'] = save_engine(served, prefix)['data_size']
+            result['load_ms'] = _p50(lambda: load_engine(prefix, mmap=True), max(3, repeat // 20))
+        result['max_depth'] = int(served.arrays['max_depth'])
+
+    row = X_test.iloc[:1].reset_index(drop=True)
+    batch = X_test.sample(BATCH_ROWS, replace=True, random_state=0).reset_index(drop=True)
+    result['single_row_ms'] = _p50(lambda: served.predict(row), repeat)
+    result['batch_ms'] = _p50(lambda: served.predict(batch), max(5, repeat // 10))
+    result['batch_rows'] = BATCH_ROWS
+
+    predictions = served.predict(X_test)
+    result['holdout_r2'] = float(r2_score(y_test, predictions))
+    result['holdout_mae'] = float(mean_absolute_error(y_test, predictions))
+    result['vs_current_r2'] = float(r2_score(reference, predictions))
+    result['vs_current_mae'] = float(mean_absolute_error(reference, predictions))
+    return result
+
+
+def print_report(rows):
+    print(f"\n{'candidate':<22}{'pickle':>9}{'artifact':>10}{'load':>9}{'1 row':>9}{'batch':>10}"
+          f"{'R²':>8}{'MAE':>8}{'R² cur':>8}{'MAE cur':>9}")
+    print(f"{'':<22}{'KB':>9}{'KB':>10}{'ms':>9}{'ms':>9}{'ms':>10}{'':>8}{'L/ha':>8}{'':>8}{'L/ha':>9}")
+    for name, r in rows.items():
+        artifact = f"{r['artifact_bytes'] / 1024:.0f}" if r['artifact_bytes'] else '-'
+        print(f"{name:<22}{r['pickle_bytes'] / 1024:>9.0f}{artifact:>10}{r['load_ms']:>9.2f}"
+              f"{r['single_row_ms']:>9.3f}{r['batch_ms']:>10.2f}{r['holdout_r2']:>8.4f}{r['holdout_mae']:>8.1f}"
+              f"{r['vs_current_r2']:>8.4f}{r['vs_current_mae']:>9.1f}")
+
+
+def compact(names, repeat=REPEAT):
+    print("="*60)
+    print("🗜️  MODEL COMPACTION")
+    print("="*60)
+    teacher = load_model()
+    current_version = artifact_version(MODEL_FILE)
+    X_train, X_test, y_train, y_test = load_base_split()
+    reference = teacher.predict(X_test)
+
+    distilled = None
+    if any(n.startswith('distilled-') for n in names):
+        distilled = distillation_set(teacher, X_train)
+        print(f"🧪 Distillation set: {len(distilled[0])} rows labelled by version {current_version}")
+
+    os.makedirs(CANDIDATE_DIR, exist_ok=True)
+    print(f"📏 Measuring 'current' (version {current_version})...")
+    rows = {'current': measure(teacher, X_test, y_test, reference, repeat)}
+    rows['current']['description'] = f'deployed model {current_version}'
+    for name in names:
+        print(f"🔨 Building '{name}'...")
+        started = time.perf_counter()
+        model, description = build_candidate(name, teacher, X_train, y_train, distilled)
+        fit_seconds = time.perf_counter() - started
+        with open(os.path.join(CANDIDATE_DIR, name + '.pkl'), 'wb') as f:
+            pickle.dump(model, f)
+        rows[name] = measure(model, X_test, y_test, reference, repeat)
+        rows[name].update(description=description, fit_seconds=round(fit_seconds, 2))
+
+    print_report(rows)
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'current_version': current_version,
+        'holdout_rows': len(X_test),
+        'candidates': rows
+    }
+    with open(REPORT_FILE, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Report written to '{REPORT_FILE}'; candidates saved in '{CANDIDATE_DIR}/'")
+    print("👉 Deploy one with: python compact_model.py --deploy <candidate>")
+
+
+def deploy(name):
+    """Install a candidate from the last report as the served model and record it in the ledger."""
+    try:
+        with open(REPORT_FILE) as f:
+            report = json.load(f)
+    except OSError:
+        print(f"❌ No report at '{REPORT_FILE}'. Run 'python compact_model.py' first.")
+        return
+    if name not in report['candidates'] or name == 'current':
+        print(f"❌ '{name}' is not a candidate in '{REPORT_FILE}'.")
+        return
+    current_version = artifact_version(MODEL_FILE)
+    if current_version != report['current_version']:
+        print(f"❌ The report was built from version {report['current_version']}, "
+              f"but '{MODEL_FILE}' is now {current_version}. Re-run the compaction.")
+        return
+
+    with open(os.path.join(CANDIDATE_DIR, name + '.pkl'), 'rb') as f:
+        model = pickle.load(f)
+    stats = report['candidates'][name]
+    print(f"🚚 Deploying '{name}' ({stats['description']}) in place of version {current_version}...")
+    version = save_model(model)
+
+    # The candidate saw the same data as the model it replaces
+    parent = next((e for e in reversed(read_ledger(LEDGER_FILE)) if e['version'] == current_version), {})
+    regressor = model.named_steps['regressor']
+    append_ledger({
+        'version': version,
+        'parent': current_version,
+        'mode': 'compact',
+        'candidate': name,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'trees': len(getattr(regressor, 'estimators_', [])),
+        'dataset_sha256': parent.get('dataset_sha256'),
+        'observations_offset': parent.get('observations_offset', 0),
+        'observations_rows': parent.get('observations_rows', 0),
+        'base_holdout_mae': stats['holdout_mae'],
+        'vs_parent_mae': stats['vs_current_mae'],
+        'pickle_bytes': stats['pickle_bytes'],
+        'artifact_bytes': stats['artifact_bytes']
+    })
+    print(f"🧾 Recorded version {version} (parent {current_version}) in '{LEDGER_FILE}'")
+    print_reload_hint()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build and report smaller candidate models.")
+    parser.add_argument('--candidates', nargs='+', default=DEFAULT_CANDIDATES,
+                        help='trees-N, depth-D, distilled-gbr, distilled-linear-gbr')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='latency samples per candidate')
+    parser.add_argument('--deploy', metavar='CANDIDATE', help=f"install a candidate from '{REPORT_FILE}'")
+    args = parser.parse_args()
+    if args.deploy:
+        deploy(args.deploy)
+    else:
+        compact(args.candidates, args.repeat)
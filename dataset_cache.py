@@ -0,0 +1,161 @@
+"""
+Typed columnar cache for the training CSV.
+
+The CSV is parsed, cleaned and typed once:
+
+    * stray header rows (e.g. from concatenated files) are dropped
+    * numeric columns are coerced; rows with missing/non-numeric values are dropped
+    * crop_type is stripped and lowercased, then stored as a categorical
+    * exact duplicate rows are dropped
+
+and written as one .npy file per column plus manifest.json under
+datasets/.cache/<name>-<source hash>/. Training scripts call load_dataset(),
+which memory-maps the columns (no parsing, no copy) as long as the source
+file's hash still matches, and rebuilds the cache otherwise.
+
+Usage:
+    python dataset_cache.py [datasets/irrigation_dataset.csv]   # build/refresh and print the report
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+DATASET_PATH = 'datasets/irrigation_dataset.csv'
+CACHE_DIR = os.path.join('datasets', '.cache')
+CACHE_FORMAT = 1
+
+CATEGORICAL_COLUMNS = ['crop_type']
+NUMERIC_COLUMNS = [
+    'soil_moisture_percent',
+    'temperature_celsius',
+    'humidity_percent',
+    'rainfall_mm',
+    'water_requirement_liters_per_hectare'
+]
+
+
+def source_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_path(path, digest, cache_dir):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f'{name}-{digest[:16]}')
+
+
+def clean(raw, dedupe=True):
+    """
+    Clean and type a raw frame (all columns as text); returns (DataFrame, report dict).
+    With dedupe=False exact duplicate rows are kept (repeated field observations are real samples).
+    """
+    report = {'rows_read': len(raw)}
+
+    # Stray header rows (e.g. a second file's header after concatenation)
+    header_rows = (raw['crop_type'].astype(object).str.strip().str.lower() == 'crop_type').to_numpy(dtype=bool)
+    df = raw[~header_rows]
+    report['header_rows_dropped'] = int(header_rows.sum())
+
+    crops = df['crop_type'].astype(object).str.strip().str.lower()
+    numeric = {c: pd.to_numeric(df[c], errors='coerce').to_numpy(dtype=np.float64) for c in NUMERIC_COLUMNS}
+    valid = crops.notna().to_numpy() & np.logical_and.reduce([~np.isnan(v) for v in numeric.values()])
+    report['invalid_rows_dropped'] = int((~valid).sum())
+
+    typed = pd.DataFrame({'crop_type': crops.to_numpy()[valid], **{c: v[valid] for c, v in numeric.items()}})
+    duplicated = typed.duplicated().to_numpy() if dedupe else np.zeros(len(typed), dtype=bool)
+    typed = typed[~duplicated].reset_index(drop=True)
+    report['duplicate_rows_dropped'] = int(duplicated.sum())
+    report['rows'] = len(typed)
+    return typed, report
+
+
+def build_cache(path=DATASET_PATH, cache_dir=CACHE_DIR, digest=None):
+    """Parse `path` once and write the columnar cache; returns the manifest."""
+    digest = digest or source_hash(path)
+    target = _cache_path(path, digest, cache_dir)
+    df, report = clean(pd.read_csv(path, dtype=str, keep_default_na=True))
+
+    tmp = target + f'.tmp{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columns = {}
+    for column in CATEGORICAL_COLUMNS:
+        categorical = pd.Categorical(df[column])
+        codes = categorical.codes.astype(np.int16 if len(categorical.categories) > 127 else np.int8)
+        np.save(os.path.join(tmp, f'{column}.npy'), codes)
+        columns[column] = {'kind': 'categorical', 'dtype': str(codes.dtype),
+                           'categories': [str(c) for c in categorical.categories]}
+    for column in NUMERIC_COLUMNS:
+        np.save(os.path.join(tmp, f'{column}.npy'), np.ascontiguousarray(df[column].to_numpy(dtype=np.float64)))
+        columns[column] = {'kind': 'numeric', 'dtype': 'float64'}
+
+    manifest = {'format': CACHE_FORMAT, 'source': os.path.basename(path), 'source_sha256': digest,
+                'columns': columns, 'order': list(df.columns), 'report': report}
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Publish atomically, then drop caches built from older versions of the same source
+    if os.path.isdir(target):
+        shutil.rmtree(tmp)
+    else:
+        os.replace(tmp, target)
+    prefix = os.path.basename(_cache_path(path, '', cache_dir))
+    for entry in os.listdir(cache_dir):
+        stale = entry.startswith(prefix) and len(entry) == len(prefix) + 16 and entry != os.path.basename(target)
+        if stale:
+            shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+    return manifest
+
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+        return manifest if manifest.get('format') == CACHE_FORMAT else None
+    except (OSError, ValueError):
+        return None
+
+
+def load_dataset(path=DATASET_PATH, cache_dir=CACHE_DIR, verbose=True):
+    """
+    Cleaned, typed dataset as a DataFrame whose columns are read-only memory maps
+    of the cache. Rebuilds the cache first if the source changed.
+    """
+    digest = source_hash(path)
+    target = _cache_path(path, digest, cache_dir)
+    manifest = _read_manifest(target)
+    if manifest is None:
+        manifest = build_cache(path, cache_dir, digest)
+        if verbose:
+            r = manifest['report']
+            print(f"🗂️  Built dataset cache for '{path}': {r['rows']} rows "
+                  f"({r['header_rows_dropped']} header, {r['invalid_rows_dropped']} invalid, "
+                  f"{r['duplicate_rows_dropped']} duplicate rows dropped)")
+    elif verbose:
+        print(f"🗂️  Loaded '{path}' from the dataset cache ({manifest['report']['rows']} rows)")
+
+    data = {}
+    for column in manifest['order']:
+        spec = manifest['columns'][column]
+        values = np.load(os.path.join(target, f'{column}.npy'), mmap_mode='r')
+        if spec['kind'] == 'categorical':
+            values = pd.Categorical.from_codes(values, categories=spec['categories'])
+        data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else DATASET_PATH
+    manifest = build_cache(source)
+    print(f"✅ Cached '{source}' (sha256 {manifest['source_sha256'][:12]}) in '{CACHE_DIR}/'")
+    for key, value in manifest['report'].items():
+        print(f"   {key}: {value}")
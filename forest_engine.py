@@ -0,0 +1,404 @@
+"""
+Flattened, array-backed inference engine for the irrigation RandomForest Pipeline.
+
+The fitted sklearn Pipeline (ColumnTransformer + RandomForestRegressor) built by
+'retrain_model.py' / 'adapt_data.py' is compiled into a handful of contiguous
+NumPy arrays:
+
+    * the input plan: one-hot mapping for categorical inputs and an affine
+      (x - mean) / scale for numeric inputs, one entry per model feature
+    * every tree's nodes concatenated into flat feature / threshold /
+      left / right / value arrays, with per-tree root offsets
+
+Prediction then walks all trees at once with vectorized NumPy traversal.
+Results match Pipeline.predict bit-for-bit: features are cast to float32
+exactly like sklearn's tree code, and per-tree leaf values are summed in tree
+order before dividing by the number of trees, as RandomForestRegressor does.
+
+The compiled engine can be saved as a flat binary of all arrays plus a small
+JSON manifest (<prefix>.bin / <prefix>.json). 'app.py' loads it with
+numpy.memmap, so every gunicorn worker shares the same page-cache pages
+instead of unpickling a private copy of the forest.
+
+Usage:
+    python forest_engine.py  # compile optimized_irrigation_model.pkl, check parity, write the artifact
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Memory-mappable artifact written next to the pickle
+ARTIFACT_PREFIX = 'optimized_irrigation_model.forest'
+ARTIFACT_FORMAT = 'aquawise-forest-v1'
+_ALIGNMENT = 64
+
+# Column-plan kinds
+PLAN_NUMERIC = 0
+PLAN_ONEHOT = 1
+
+
+class UnsupportedPipelineError(ValueError):
+    """Raised when a fitted Pipeline uses a step the compiler cannot flatten."""
+
+
+def _resolve_columns(columns, feature_names_in):
+    # ColumnTransformer keeps the column spec as given (names, indices or a boolean mask)
+    if isinstance(columns, str):
+        return [columns]
+    columns = list(columns)
+    if columns and isinstance(columns[0], (bool, np.bool_)):
+        return [name for name, keep in zip(feature_names_in, columns) if keep]
+    if columns and isinstance(columns[0], (int, np.integer)):
+        return [feature_names_in[i] for i in columns]
+    return [str(c) for c in columns]
+
+
+def _is_passthrough(transformer):
+    if isinstance(transformer, str):
+        return transformer == 'passthrough'
+    # Newer sklearn stores 'passthrough' as an identity FunctionTransformer
+    return type(transformer).__name__ == 'FunctionTransformer' and transformer.func is None
+
+
+def _compile_preprocessor(preprocessor):
+    """
+    Flatten a fitted ColumnTransformer into a per-output-column plan.
+
+    Returns (input_names, plan) where plan holds, for every model feature,
+    the plan kind, the index of the source input column, and either the
+    (mean, scale) pair or the category that switches the column to 1.0.
+    """
+    feature_names_in = [str(n) for n in preprocessor.feature_names_in_]
+    kinds, sources, means, scales, categories = [], [], [], [], []
+
+    for name, transformer, columns in preprocessor.transformers_:
+        if isinstance(transformer, str) and transformer == 'drop':
+            continue
+        columns = _resolve_columns(columns, feature_names_in)
+        if not columns:
+            continue
+
+        if _is_passthrough(transformer):
+            for col in columns:
+                kinds.append(PLAN_NUMERIC)
+                sources.append(feature_names_in.index(col))
+                means.append(0.0)
+                scales.append(1.0)
+                categories.append(None)
+
+        elif type(transformer).__name__ == 'StandardScaler':
+            mean = transformer.mean_ if transformer.with_mean else np.zeros(len(columns))
+            scale = transformer.scale_ if transformer.with_std else np.ones(len(columns))
+            for col, m, s in zip(columns, mean, scale):
+                kinds.append(PLAN_NUMERIC)
+                sources.append(feature_names_in.index(col))
+                means.append(float(m))
+                scales.append(float(s))
+                categories.append(None)
+
+        elif type(transformer).__name__ == 'OneHotEncoder':
+            if transformer.drop is not None:
+                raise UnsupportedPipelineError(f"OneHotEncoder '{name}' uses drop={transformer.drop!r}")
+            if transformer.handle_unknown != 'ignore':
+                raise UnsupportedPipelineError(f"OneHotEncoder '{name}' must use handle_unknown='ignore'")
+            for col, cats in zip(columns, transformer.categories_):
+                for cat in cats:
+                    kinds.append(PLAN_ONEHOT)
+                    sources.append(feature_names_in.index(col))
+                    means.append(0.0)
+                    scales.append(1.0)
+                    categories.append(cat)
+
+        else:
+            raise UnsupportedPipelineError(f"Transformer '{name}' ({type(transformer).__name__}) is not supported")
+
+    plan = {
+        'plan_kind': np.asarray(kinds, dtype=np.int8),
+        'plan_source': np.asarray(sources, dtype=np.int64),
+        'plan_mean': np.asarray(means, dtype=np.float64),
+        'plan_scale': np.asarray(scales, dtype=np.float64),
+    }
+    return feature_names_in, plan, categories
+
+
+def _compile_forest(forest):
+    """Concatenate every tree's node arrays, rebasing child indices to global offsets."""
+    if type(forest).__name__ not in ('RandomForestRegressor', 'ExtraTreesRegressor'):
+        raise UnsupportedPipelineError(f'Regressor {type(forest).__name__} is not a forest')
+    if getattr(forest, 'n_outputs_', 1) != 1:
+        raise UnsupportedPipelineError('Only single-output forests are supported')
+
+    trees = [est.tree_ for est in forest.estimators_]
+    offsets = np.zeros(len(trees), dtype=np.int64)
+    total = 0
+    for i, tree in enumerate(trees):
+        offsets[i] = total
+        total += tree.node_count
+
+    feature = np.zeros(total, dtype=np.int64)
+    threshold = np.zeros(total, dtype=np.float64)
+    left = np.zeros(total, dtype=np.int64)
+    right = np.zeros(total, dtype=np.int64)
+    value = np.zeros(total, dtype=np.float64)
+    missing_left = np.zeros(total, dtype=bool)
+
+    for offset, tree in zip(offsets, trees):
+        n = tree.node_count
+        span = slice(offset, offset + n)
+        nodes = np.arange(offset, offset + n)
+        is_leaf = tree.children_left == -1
+
+        # Leaves point at themselves, which is how the engine recognises them
+        feature[span] = np.where(is_leaf, 0, tree.feature)
+        threshold[span] = np.where(is_leaf, np.inf, tree.threshold)
+        left[span] = np.where(is_leaf, nodes, tree.children_left + offset)
+        right[span] = np.where(is_leaf, nodes, tree.children_right + offset)
+        value[span] = tree.value[:, 0, 0]
+        if getattr(tree, 'missing_go_to_left', None) is not None:
+            missing_left[span] = np.asarray(tree.missing_go_to_left, dtype=bool)
+
+    return {
+        'tree_offsets': offsets,
+        'node_feature': feature,
+        'node_threshold': threshold,
+        'node_left': left,
+        'node_right': right,
+        'node_value': value,
+        'node_missing_left': missing_left,
+        'max_depth': np.int64(max(tree.max_depth for tree in trees)),
+    }
+
+
+def compile_pipeline(pipeline):
+    """Compile a fitted Pipeline(preprocessor, RandomForestRegressor) into a ForestEngine."""
+    steps = dict(pipeline.named_steps) if hasattr(pipeline, 'named_steps') else {}
+    if 'preprocessor' not in steps or 'regressor' not in steps:
+        raise UnsupportedPipelineError("Expected a Pipeline with 'preprocessor' and 'regressor' steps")
+
+    input_names, arrays, categories = _compile_preprocessor(steps['preprocessor'])
+    arrays.update(_compile_forest(steps['regressor']))
+
+    n_features = getattr(steps['regressor'], 'n_features_in_', len(categories))
+    if len(categories) != n_features:
+        raise UnsupportedPipelineError(
+            f'Preprocessor yields {len(categories)} features but the forest expects {n_features}')
+
+    return ForestEngine(arrays, input_names, categories)
+
+
+def artifact_version(*paths):
+    """Short content hash of the model file(s); changes whenever the model is retrained."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def _plain(value):
+    # numpy scalars (e.g. np.str_ categories) -> JSON-friendly Python values
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def save_engine(engine, prefix=ARTIFACT_PREFIX, source_version=None):
+    """
+    Write <prefix>.bin (every array back to back, 64-byte aligned) and <prefix>.json.
+
+    Both files are written to temporaries and renamed into place, binary first,
+    so a reader never sees a manifest pointing at a half-written binary.
+    Returns the manifest dict.
+    """
+    bin_path, manifest_path = prefix + '.bin', prefix + '.json'
+    entries, offset = {}, 0
+    for name, array in engine.arrays.items():
+        array = np.ascontiguousarray(array)
+        offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+        entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+
+    tmp_bin = bin_path + '.tmp'
+    with open(tmp_bin, 'wb') as f:
+        for name, array in engine.arrays.items():
+            f.seek(entries[name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(offset)
+
+    manifest = {
+        'format': ARTIFACT_FORMAT,
+        'source_version': source_version,
+        'data_file': os.path.basename(bin_path),
+        'data_size': offset,
+        'data_version': artifact_version(tmp_bin),
+        'n_trees': engine.n_trees,
+        'input_names': engine.input_names,
+        'categories': [_plain(c) for c in engine.categories],
+        'arrays': entries
+    }
+    tmp_manifest = manifest_path + '.tmp'
+    with open(tmp_manifest, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(tmp_bin, bin_path)
+    os.replace(tmp_manifest, manifest_path)
+    return manifest
+
+
+def read_manifest(prefix=ARTIFACT_PREFIX):
+    with open(prefix + '.json') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != ARTIFACT_FORMAT:
+        raise UnsupportedPipelineError(f"Unknown artifact format {manifest.get('format')!r}")
+    return manifest
+
+
+def load_engine(prefix=ARTIFACT_PREFIX, mmap=True):
+    """
+    Load a saved ForestEngine. With mmap=True the arrays are read-only views
+    of one numpy.memmap, shared through the page cache by every process.
+    """
+    manifest = read_manifest(prefix)
+    bin_path = os.path.join(os.path.dirname(prefix), manifest['data_file'])
+    if os.path.getsize(bin_path) != manifest['data_size']:
+        raise UnsupportedPipelineError(f"'{bin_path}' does not match its manifest (size differs)")
+
+    if mmap:
+        data = np.memmap(bin_path, dtype=np.uint8, mode='r')
+    else:
+        data = np.fromfile(bin_path, dtype=np.uint8)
+
+    arrays = {}
+    for name, spec in manifest['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        start = spec['offset']
+        view = data[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+        arrays[name] = np.asarray(view)  # plain ndarray view, still backed by the mapping
+
+    engine = ForestEngine(arrays, manifest['input_names'], manifest['categories'])
+    engine.manifest = manifest
+    return engine
+
+
+class ForestEngine:
+    """Vectorized RandomForest inference over flat node arrays."""
+
+    def __init__(self, arrays, input_names, categories):
+        self.arrays = arrays
+        self.manifest = None  # set when loaded from a saved artifact
+        self.input_names = list(input_names)
+        self.categories = list(categories)
+
+        self._kind = arrays['plan_kind']
+        self._source = arrays['plan_source']
+        self._mean = arrays['plan_mean']
+        self._scale = arrays['plan_scale']
+        self._roots = arrays['tree_offsets']
+        self._feature = arrays['node_feature']
+        self._threshold = arrays['node_threshold']
+        self._left = arrays['node_left']
+        self._right = arrays['node_right']
+        self._value = arrays['node_value']
+        self._missing_left = arrays['node_missing_left']
+        self._is_leaf = self._left == np.arange(len(self._left))
+
+        self.n_trees = len(self._roots)
+        self.n_features = len(self._kind)
+        self._numeric_cols = np.flatnonzero(self._kind == PLAN_NUMERIC)
+        # One-hot mapping per categorical input: (input index, categories, output columns)
+        self._onehot = []
+        for source in np.unique(self._source[self._kind == PLAN_ONEHOT]):
+            cols = np.flatnonzero((self._kind == PLAN_ONEHOT) & (self._source == source))
+            cats = np.array([self.categories[c] for c in cols], dtype=object)
+            self._onehot.append((int(source), cats, cols))
+
+    def transform(self, X):
+        """
+        Build the float32 model matrix from a DataFrame or a mapping of column -> values.
+
+        Mirrors ColumnTransformer output (float64) followed by the tree's cast to float32.
+        """
+        columns = [np.asarray(X[name]) for name in self.input_names]
+        n_rows = len(columns[0]) if columns else 0
+        out = np.zeros((n_rows, self.n_features), dtype=np.float64)
+
+        for col in self._numeric_cols:
+            raw = columns[self._source[col]].astype(np.float64, copy=False)
+            out[:, col] = (raw - self._mean[col]) / self._scale[col]
+
+        for source, cats, cols in self._onehot:
+            values = columns[source].astype(object, copy=False)
+            hits = values[:, None] == cats[None, :]
+            # Unknown categories match nothing and stay all-zero (handle_unknown='ignore')
+            out[:, cols] = hits
+
+        return out.astype(np.float32)
+
+    def predict_matrix(self, X32):
+        """Predict from an already-transformed float32 feature matrix."""
+        n_rows = X32.shape[0]
+        flat = np.ascontiguousarray(X32).ravel()
+        has_nan = bool(np.isnan(flat).any())
+
+        # One traversal path per (row, tree), flattened row-major
+        node = np.tile(self._roots, n_rows)
+        row_base = np.repeat(np.arange(n_rows, dtype=np.int64) * self.n_features, self.n_trees)
+
+        # Only paths that have not reached a leaf are advanced; the active set shrinks each level
+        active = np.flatnonzero(~self._is_leaf[node])
+        while active.size:
+            current = node[active]
+            x = flat[row_base[active] + self._feature[current]]
+            go_left = x <= self._threshold[current]
+            if has_nan:
+                go_left = np.where(np.isnan(x), self._missing_left[current], go_left)
+            current = np.where(go_left, self._left[current], self._right[current])
+            node[active] = current
+            active = active[~self._is_leaf[current]]
+
+        # Sequential accumulation in tree order (cumsum) keeps the float sum identical to sklearn's
+        leaf_values = self._value[node].reshape(n_rows, self.n_trees)
+        return np.cumsum(leaf_values, axis=1)[:, -1] / self.n_trees
+
+    def predict(self, X):
+        """Drop-in replacement for Pipeline.predict."""
+        return self.predict_matrix(self.transform(X))
+
+
+if __name__ == '__main__':
+    import pickle
+    import time
+    import pandas as pd
+
+    MODEL_FILE = 'optimized_irrigation_model.pkl'
+    DATASET_PATH = 'datasets/irrigation_dataset.csv'
+
+    with open(MODEL_FILE, 'rb') as f:
+        pipeline = pickle.load(f)
+
+    start = time.perf_counter()
+    engine = compile_pipeline(pipeline)
+    print(f"✅ Compiled {engine.n_trees} trees ({len(engine._feature):,} nodes) in {(time.perf_counter() - start)*1000:.1f} ms")
+
+    df = pd.read_csv(DATASET_PATH)
+    df = df[df['crop_type'] != 'crop_type'].reset_index(drop=True)
+    for c in ['soil_moisture_percent', 'temperature_celsius', 'humidity_percent', 'rainfall_mm']:
+        df[c] = pd.to_numeric(df[c])
+    df['crop_water_base'] = df['crop_type'].str.strip().map(
+        {'rice': 6500, 'maize': 5000, 'pomegranate': 4400, 'banana': 5100,
+         'mango': 4600, 'watermelon': 4700, 'papaya': 4850}).fillna(4000)
+    X = df[engine.input_names]
+
+    expected = pipeline.predict(X)
+    actual = engine.predict(X)
+    mismatches = int(np.sum(expected != actual))
+    print(f"{'✅' if mismatches == 0 else '❌'} Parity on {len(X)} rows: {mismatches} mismatches")
+
+    manifest = save_engine(engine, ARTIFACT_PREFIX, source_version=artifact_version(MODEL_FILE))
+    mapped = load_engine(ARTIFACT_PREFIX)
+    mismatches = int(np.sum(expected != mapped.predict(X)))
+    print(f"💾 Wrote '{ARTIFACT_PREFIX}.bin' ({manifest['data_size'] / 1e6:.1f} MB) + '{ARTIFACT_PREFIX}.json'")
+    print(f"{'✅' if mismatches == 0 else '❌'} Memory-mapped artifact parity: {mismatches} mismatches")
@@ -0,0 +1,27 @@
+"""
+Gunicorn settings (used by the Procfile: gunicorn -c gunicorn.conf.py app:app).
+
+The app (and the model) is loaded once in the master before workers fork, so
+every worker shares the model's memory pages copy-on-write instead of
+unpickling its own copy. Firebase stays uninitialized until a worker serves
+its first auth request (see get_firebase() in app.py), so no gRPC state is
+created before the fork.
+"""
+
+import gc
+
+preload_app = True
+
+
+def when_ready(server):
+    # Freeze everything loaded in the master so the workers' garbage collector
+    # never writes to (and un-shares) those objects.
+    gc.freeze()
+    server.log.info("Model preloaded in master; %d objects frozen for copy-on-write sharing", gc.get_freeze_count())
+
+
+def post_worker_init(worker):
+    # PSS splits shared pages across the workers mapping them; compare it with RSS
+    # to see how much of the model each worker actually owns.
+    from metrics import format_memory
+    worker.log.info("Worker %s memory after init: %s", worker.pid, format_memory())
@@ -0,0 +1,130 @@
+"""
+Successive-halving hyperparameter search for the Random Forest Pipeline.
+
+Drop-in alternative to GridSearchCV in 'adapt_data.py' (--search halving):
+
+    * every candidate starts on a small subsample with few trees; after each
+      rung only the best 1/factor survive, and both the training rows and
+      n_estimators grow by `factor` until the last rung uses all rows and
+      the full tree count
+    * parallelism lives at one level: the (candidate, fold) fits of a rung
+      run as joblib jobs and every forest inside them is single-threaded,
+      so cores are never oversubscribed; only the final refit uses n_jobs=-1
+    * the Pipeline gets a joblib.Memory, so the fitted ColumnTransformer is
+      cached per fold and reused by every candidate evaluated on that fold
+    * the training arrays are handed to the worker processes as read-only
+      memory maps (joblib's shared-memory memmapping) instead of being
+      pickled into every job
+
+Exposes the GridSearchCV attributes adapt_data.py reads (best_params_,
+best_score_, best_estimator_) plus a per-rung history.
+"""
+
+import math
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Memory, Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import KFold, ParameterGrid
+
+# Arrays at least this large are passed to workers as shared memory maps
+MEMMAP_THRESHOLD = '64K'
+
+
+def _frame(numeric, crop_codes, crop_categories, numeric_columns, rows):
+    """Rebuild the Pipeline's input DataFrame for `rows` from the shared arrays."""
+    frame = pd.DataFrame(numeric[rows], columns=numeric_columns)
+    frame.insert(0, 'crop_type', crop_categories[crop_codes[rows]])
+    return frame
+
+
+def _fit_and_score(estimator, params, data, y, train_rows, test_rows):
+    numeric, crop_codes, crop_categories, numeric_columns = data
+    model = clone(estimator).set_params(**params)
+    model.fit(_frame(numeric, crop_codes, crop_categories, numeric_columns, train_rows), y[train_rows])
+    predictions = model.predict(_frame(numeric, crop_codes, crop_categories, numeric_columns, test_rows))
+    return -mean_absolute_error(y[test_rows], predictions)
+
+
+class SuccessiveHalvingSearch:
+    """Successive halving over (training rows, n_estimators) with a cached preprocessor."""
+
+    def __init__(self, estimator, param_grid, resource_param='regressor__n_estimators', factor=3,
+                 cv=3, min_samples=100, min_resource=10, n_jobs=-1, random_state=42, verbose=True):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.resource_param = resource_param
+        self.factor = factor
+        self.cv = cv
+        self.min_samples = min_samples
+        self.min_resource = min_resource
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.verbose = verbose
+
+    def _schedule(self, n_candidates, n_samples, max_resource):
+        """(rows, n_estimators) per rung; the last rung uses everything."""
+        n_rungs = max(1, math.ceil(math.log(max(n_candidates, 1), self.factor)) + 1)
+        schedule = []
+        for rung in range(n_rungs):
+            fraction = self.factor ** (rung - n_rungs + 1)
+            schedule.append((max(min(self.min_samples, n_samples), int(n_samples * fraction)),
+                             max(min(self.min_resource, max_resource), int(round(max_resource * fraction)))))
+        return schedule
+
+    def fit(self, X, y):
+        started = time.perf_counter()
+        grid = dict(self.param_grid)
+        max_resource = max(grid.pop(self.resource_param, [100]))
+        candidates = list(ParameterGrid(grid))
+        y = np.asarray(y, dtype=np.float64)
+
+        # Shared read-only arrays: numeric block, crop codes and category labels
+        numeric_columns = [c for c in X.columns if c != 'crop_type']
+        crop = pd.Categorical(X['crop_type'])
+        data = (np.ascontiguousarray(X[numeric_columns].to_numpy(dtype=np.float64)),
+                crop.codes.astype(np.int16), np.asarray(crop.categories, dtype=object), numeric_columns)
+
+        # Rows are visited in one fixed random order, so every rung's subsample contains the previous one
+        order = np.random.default_rng(self.random_state).permutation(len(y))
+        cache_dir = tempfile.mkdtemp(prefix='aquawise-search-')
+        estimator = clone(self.estimator).set_params(memory=Memory(cache_dir, verbose=0),
+                                                     regressor__n_jobs=1)
+        self.history_ = []
+        try:
+            with Parallel(n_jobs=self.n_jobs, max_nbytes=MEMMAP_THRESHOLD, mmap_mode='r') as parallel:
+                for rows, resource in self._schedule(len(candidates), len(y), max_resource):
+                    subset = order[:rows]
+                    folds = list(KFold(self.cv, shuffle=True, random_state=self.random_state).split(subset))
+                    jobs = [(i, {**params, self.resource_param: resource}, subset[train], subset[test])
+                            for i, params in enumerate(candidates) for train, test in folds]
+                    scores = parallel(delayed(_fit_and_score)(estimator, params, data, y, train, test)
+                                      for _, params, train, test in jobs)
+                    mean_scores = np.asarray(scores).reshape(len(candidates), len(folds)).mean(axis=1)
+
+                    self.history_.append({'rows': int(rows), self.resource_param: int(resource),
+                                          'candidates': [{**p, 'score': float(s)} for p, s in zip(candidates, mean_scores)]})
+                    if self.verbose:
+                        print(f"   rung {len(self.history_)}: {len(candidates)} candidates x {len(folds)} folds, "
+                              f"{rows} rows, {resource} trees, best MAE {-mean_scores.max():.2f}")
+
+                    keep = max(1, math.ceil(len(candidates) / self.factor))
+                    ranked = np.argsort(-mean_scores, kind='stable')
+                    best_score = float(mean_scores[ranked[0]])
+                    candidates = [candidates[i] for i in ranked[:keep]]
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+        self.best_params_ = {**candidates[0], self.resource_param: max_resource}
+        self.best_score_ = best_score
+
+        # Final refit on all rows; nothing else is running now, so the forest may use every core
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_, regressor__n_jobs=-1)
+        self.best_estimator_.fit(X, y)
+        self.elapsed_seconds_ = time.perf_counter() - started
+        return self
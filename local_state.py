@@ -0,0 +1,88 @@
+"""
+Private files for state shared between the workers on one host.
+
+otp_store.py and admission.py can keep their state in SQLite files that every
+gunicorn worker opens. Those files hold password-reset codes and limiter
+state, so they must not be readable, replaceable or pre-created by other
+local users:
+
+    * the default location is a per-user directory in the temp directory,
+      created with mode 0700 and refused if it is a symlink, owned by someone
+      else or open to group/other
+    * the database file (and SQLite's -wal / -shm files) must be a regular
+      file owned by this user; it is created with mode 0600, and looser modes
+      on an existing file are tightened
+
+Anything that fails these checks raises PermissionError at start-up.
+"""
+
+import os
+import stat
+import tempfile
+
+
+def state_dir():
+    """This user's private state directory, created with mode 0700 if needed."""
+    path = os.path.join(tempfile.gettempdir(), f'aquawise-{os.getuid()}')
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"'{path}' is not a directory owned by this user; refusing to keep state there")
+    if info.st_mode & 0o077:
+        raise PermissionError(f"'{path}' is accessible to other users (mode {stat.S_IMODE(info.st_mode):o})")
+    return path
+
+
+def _check_owned(path):
+    info = os.lstat(path)
+    if not stat.S_ISREG(info.st_mode):
+        raise PermissionError(f"'{path}' is not a regular file (symlink?); refusing to open it")
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"'{path}' is owned by uid {info.st_uid}, not this user; refusing to open it")
+    if info.st_mode & 0o077:
+        os.chmod(path, 0o600)
+
+
+def private_file(path):
+    """Create path with mode 0600 if missing, and check that it (and any SQLite sidecars) belong to this user."""
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_NOFOLLOW', 0), 0o600))
+    except FileExistsError:
+        pass
+    _check_owned(path)
+    for suffix in ('-wal', '-shm'):
+        if os.path.lexists(path + suffix):
+            _check_owned(path + suffix)
+    return path
+
+
+def state_path(configured, filename):
+    """The configured path, or filename in state_dir(); either way checked by private_file()."""
+    return private_file(configured or os.path.join(state_dir(), filename))
+
+
+def secret_key(configured, path):
+    """
+    Bytes key for HMACs: the configured secret, or a random key kept in path
+    (created 0600 on first use, so all workers on the host share it).
+    """
+    if configured:
+        return configured.encode()
+    if not os.path.lexists(path):
+        # Written to a temporary (mkstemp: mode 0600) and linked into place, so no worker
+        # ever reads a half-written key; link() fails if another worker got there first
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(os.urandom(32).hex())
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp)
+    _check_owned(path)
+    with open(path) as f:
+        return bytes.fromhex(f.read().strip())
@@ -0,0 +1,179 @@
+"""
+Background delivery queue for outgoing email (OTP codes).
+
+'/api/send-otp' used to open an SMTP_SSL connection, log in, send and quit
+inside the request. Now it only builds the message and puts it on a bounded
+queue; a small pool of sender threads delivers it:
+
+    * each sender keeps one authenticated SMTP connection open and reuses it
+      for every message; it is closed after AQUAWISE_SMTP_IDLE_SECONDS without
+      mail (servers drop idle clients anyway) and reopened on demand
+    * a dropped connection or a temporary (4xx) failure closes the connection
+      and retries with exponential backoff, up to AQUAWISE_SMTP_MAX_ATTEMPTS
+    * permanent (5xx) rejections, including every recipient refused with a
+      5xx, are not retried
+    * a message still undelivered at its deadline (the OTP has expired) is dropped
+    * when AQUAWISE_SMTP_QUEUE messages are already waiting, submit() returns
+      False right away so the endpoint can answer 503 instead of piling up work
+
+Sender threads start on the first submit() in each process, so a gunicorn
+master that preloads the app never owns them. Delivery latency, attempts and
+outcomes are exported in metrics.REGISTRY.
+
+Configuration (environment):
+    AQUAWISE_SMTP_QUEUE           max queued messages (default 1000)
+    AQUAWISE_SMTP_CONNECTIONS     sender threads / open connections (default 2)
+    AQUAWISE_SMTP_MAX_ATTEMPTS    delivery attempts per message (default 5)
+    AQUAWISE_SMTP_BACKOFF_MS      first retry delay, doubled per attempt (default 500, max 30 s)
+    AQUAWISE_SMTP_IDLE_SECONDS    close a connection after this long without mail (default 60)
+"""
+
+import os
+import queue
+import smtplib
+import threading
+import time
+
+from metrics import REGISTRY
+
+DELIVERY_SECONDS = REGISTRY.histogram(
+    'aquawise_smtp_delivery_seconds', 'Time from queueing an email until the SMTP server accepted it',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+SEND_SECONDS = REGISTRY.histogram(
+    'aquawise_smtp_send_seconds', 'Duration of one delivery attempt (connect and login included when needed)',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+MESSAGES = REGISTRY.counter(
+    'aquawise_smtp_messages_total', 'Emails by outcome (sent, failed, expired, rejected: queue full)', ['outcome'])
+RETRIES = REGISTRY.counter('aquawise_smtp_retries_total', 'Delivery attempts that failed and were retried')
+CONNECTS = REGISTRY.counter('aquawise_smtp_connections_total', 'SMTP connections opened (including reconnects)')
+QUEUE_DEPTH = REGISTRY.gauge('aquawise_smtp_queue_depth', 'Emails waiting for a sender thread')
+
+MAX_BACKOFF_SECONDS = 30.0
+
+
+def _is_permanent(error):
+    # 5xx replies (bad recipient, rejected content, bad credentials) will not succeed on retry
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        # One (code, message) per refused recipient; a 4xx (mailbox busy, greylisting) may pass later
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class _Envelope:
+    __slots__ = ('message', 'queued_at', 'deadline')
+
+    def __init__(self, message, deadline):
+        self.message = message
+        self.queued_at = time.perf_counter()
+        self.deadline = deadline
+
+
+class MailQueue:
+    """Bounded queue of EmailMessages delivered by threads over persistent SMTP connections."""
+
+    def __init__(self, connect, max_size=1000, connections=2, max_attempts=5,
+                 backoff_seconds=0.5, idle_seconds=60.0):
+        self.connect = connect  # () -> logged-in smtplib client
+        self.max_size = max_size
+        self.connections = connections
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.idle_seconds = idle_seconds
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._pid = None  # process that owns the sender threads
+
+    @classmethod
+    def from_env(cls, connect):
+        return cls(
+            connect,
+            max_size=int(os.environ.get('AQUAWISE_SMTP_QUEUE', 1000)),
+            connections=int(os.environ.get('AQUAWISE_SMTP_CONNECTIONS', 2)),
+            max_attempts=int(os.environ.get('AQUAWISE_SMTP_MAX_ATTEMPTS', 5)),
+            backoff_seconds=float(os.environ.get('AQUAWISE_SMTP_BACKOFF_MS', 500)) / 1000,
+            idle_seconds=float(os.environ.get('AQUAWISE_SMTP_IDLE_SECONDS', 60)),
+        )
+
+    def _ensure_senders(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked: the parent's queue and threads are not ours
+                self._queue = queue.Queue(maxsize=self.max_size)
+            for i in range(self.connections):
+                threading.Thread(target=self._sender, name=f'smtp-sender-{i}', daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, message, deadline=None):
+        """
+        Queue an EmailMessage; returns False if the queue is full. `deadline`
+        (time.time() value) drops the message if it cannot be sent before then.
+        """
+        self._ensure_senders()
+        try:
+            self._queue.put_nowait(_Envelope(message, deadline))
+        except queue.Full:
+            MESSAGES.inc(outcome='rejected')
+            return False
+        QUEUE_DEPTH.set(self._queue.qsize())
+        return True
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def _sender(self):
+        server = None
+        while True:
+            try:
+                envelope = self._queue.get(timeout=self.idle_seconds if server is not None else None)
+            except queue.Empty:
+                server = self._close(server)  # idle: let the connection go
+                continue
+            QUEUE_DEPTH.set(self._queue.qsize())
+            server = self._deliver(server, envelope)
+
+    def _deliver(self, server, envelope):
+        """Send one message with retries; returns the connection to keep using (or None)."""
+        recipient = envelope.message.get('To')
+        for attempt in range(1, self.max_attempts + 1):
+            if envelope.deadline is not None and time.time() > envelope.deadline:
+                MESSAGES.inc(outcome='expired')
+                print(f"⚠️ [SMTP] Dropped expired email to {recipient}")
+                return server
+            started = time.perf_counter()
+            try:
+                if server is None:
+                    server = self.connect()
+                    CONNECTS.inc()
+                server.send_message(envelope.message)
+            except (smtplib.SMTPException, OSError) as e:
+                SEND_SECONDS.observe(time.perf_counter() - started)
+                server = self._close(server)
+                if _is_permanent(e) or attempt == self.max_attempts:
+                    MESSAGES.inc(outcome='failed')
+                    print(f"❌ SMTP Error for {recipient} (attempt {attempt}): {e}")
+                    return server
+                RETRIES.inc()
+                if attempt > 1 or not isinstance(e, smtplib.SMTPServerDisconnected):
+                    # A connection the server dropped while idle is retried at once; anything else backs off
+                    time.sleep(min(self.backoff_seconds * 2 ** (attempt - 1), MAX_BACKOFF_SECONDS))
+                continue
+            now = time.perf_counter()
+            SEND_SECONDS.observe(now - started)
+            DELIVERY_SECONDS.observe(now - envelope.queued_at)
+            MESSAGES.inc(outcome='sent')
+            print(f"✅ OTP sent to {recipient}")
+            return server
+        return server
+
+    @staticmethod
+    def _close(server):
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+        return None
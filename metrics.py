@@ -0,0 +1,222 @@
+"""
+Minimal in-process metrics registry with Prometheus text exposition.
+
+Counters, gauges and histograms are plain Python objects guarded by a lock,
+cheap enough to stay enabled in production. Values that already live
+elsewhere (e.g. cache counters) are exported through callbacks instead of
+being copied. 'app.py' serves REGISTRY.render() on GET /metrics.
+"""
+
+import math
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds (0.5 ms .. 10 s)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}' for k, v in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the with-block (also when it raises)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(state[-2])}')
+            lines.append(f'{self.name}_count{labels} {state[-1]}')
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Counter or gauge whose value is read from a callback at scrape time."""
+
+    def __init__(self, name, documentation, kind, callback):
+        super().__init__(name, documentation)
+        self.kind = kind
+        self._callback = callback
+
+    def samples(self):
+        return [f'{self.name} {_format_value(self._callback())}']
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Re-registering (e.g. a module re-import) hands back the original metric
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, callback, kind='gauge'):
+        return self._register(CallbackMetric(name, documentation, kind, callback))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+def process_memory():
+    """
+    Memory of this process in bytes: rss, pss (proportional share of pages
+    shared with other processes), shared and private. Reads
+    /proc/self/smaps_rollup on Linux; elsewhere only peak rss is available.
+    """
+    try:
+        fields = {}
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                parts = rest.split()
+                if len(parts) == 2 and parts[1] == 'kB':
+                    fields[key] = int(parts[0]) * 1024
+        return {
+            'rss': fields.get('Rss', 0),
+            'pss': fields.get('Pss', 0),
+            'shared': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+            'private': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+        }
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return {'rss': 0, 'pss': 0, 'shared': 0, 'private': 0}
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # bytes on macOS, kB elsewhere
+    return {'rss': peak if sys.platform == 'darwin' else peak * 1024, 'pss': 0, 'shared': 0, 'private': 0}
+
+
+def format_memory(mem=None):
+    mem = mem or process_memory()
+    return ', '.join(f"{k.upper()} {v / 2**20:.1f} MB" for k, v in mem.items() if v) or 'n/a'
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,138 @@
+"""
+Micro-batching scheduler for single-row predictions.
+
+Concurrent '/predict' requests (threaded gunicorn workers) each submit one
+row. A background thread collects rows arriving within a short window (or up
+to a maximum batch size), runs one vectorized predict on the whole batch and
+hands every result back to its waiting request.
+
+    * backpressure: the queue is bounded; submit() raises BatcherOverloaded
+      when it is full instead of queueing unbounded work
+    * timeouts: submit() gives up after timeout_seconds; a row whose caller
+      already gave up is skipped when its batch is formed
+    * metrics: batch-size and queue-wait histograms in metrics.REGISTRY
+
+Configuration (environment, read by 'app.py'):
+    AQUAWISE_MICROBATCH              "1" to enable (default off)
+    AQUAWISE_MICROBATCH_WINDOW_MS    collection window (default 2)
+    AQUAWISE_MICROBATCH_MAX_SIZE     rows per batch (default 64)
+    AQUAWISE_MICROBATCH_QUEUE        max queued rows (default 1024)
+    AQUAWISE_MICROBATCH_TIMEOUT_MS   per-request wait limit (default 1000)
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from metrics import REGISTRY
+
+BATCH_SIZE = REGISTRY.histogram(
+    'aquawise_microbatch_size', 'Rows per micro-batch predict call', ['engine'],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+QUEUE_WAIT = REGISTRY.histogram(
+    'aquawise_microbatch_queue_wait_seconds', 'Time a row waited in the queue before its batch ran', ['engine'],
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+REJECTED = REGISTRY.counter(
+    'aquawise_microbatch_rejected_total', 'Rows rejected by the micro-batcher', ['engine', 'reason'])
+
+
+class BatcherOverloaded(RuntimeError):
+    """The micro-batch queue is full."""
+
+
+class BatcherTimeout(TimeoutError):
+    """The row was not predicted within the per-request timeout."""
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-row predictions into vectorized batches."""
+
+    def __init__(self, name, predict_fn, window_seconds=0.002, max_batch_size=64,
+                 max_queue=1024, timeout_seconds=1.0):
+        self.name = name
+        self.predict_fn = predict_fn  # DataFrame -> array of predictions
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self.timeout_seconds = timeout_seconds
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, name, predict_fn, environ=os.environ):
+        return cls(
+            name, predict_fn,
+            window_seconds=float(environ.get('AQUAWISE_MICROBATCH_WINDOW_MS', 2)) / 1000,
+            max_batch_size=int(environ.get('AQUAWISE_MICROBATCH_MAX_SIZE', 64)),
+            max_queue=int(environ.get('AQUAWISE_MICROBATCH_QUEUE', 1024)),
+            timeout_seconds=float(environ.get('AQUAWISE_MICROBATCH_TIMEOUT_MS', 1000)) / 1000
+        )
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so each gunicorn worker starts its own on first use
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=f'microbatch-{self.name}', daemon=True)
+                self._thread.start()
+
+    def submit(self, row):
+        """Queue one row (dict of input fields) and block until its prediction is ready."""
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put_nowait((row, future, time.perf_counter()))
+        except queue.Full:
+            REJECTED.inc(engine=self.name, reason='queue_full')
+            raise BatcherOverloaded('Prediction queue is full, please retry shortly') from None
+
+        try:
+            return future.result(timeout=self.timeout_seconds)
+        except FutureTimeout:
+            future.cancel()
+            REJECTED.inc(engine=self.name, reason='timeout')
+            raise BatcherTimeout(f'Prediction not ready within {self.timeout_seconds * 1000:.0f} ms') from None
+
+    def _collect(self):
+        """Block for the first row, then gather more until the window closes or the batch is full."""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        import pandas as pd
+
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            # Skip rows whose callers already timed out
+            live = [(row, fut, queued) for row, fut, queued in batch if fut.set_running_or_notify_cancel()]
+            if not live:
+                continue
+
+            for _, _, queued in live:
+                QUEUE_WAIT.observe(started - queued, engine=self.name)
+            BATCH_SIZE.observe(len(live), engine=self.name)
+
+            try:
+                predictions = self.predict_fn(pd.DataFrame([row for row, _, _ in live]))
+            except Exception as e:
+                for _, fut, _ in live:
+                    fut.set_exception(e)
+                continue
+
+            for (_, fut, _), prediction in zip(live, predictions):
+                fut.set_result(prediction)
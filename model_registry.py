@@ -0,0 +1,307 @@
+"""
+Versioned model slots with background reload, canary validation and rollback.
+
+Each engine ('forest', 'nn') has a ModelRegistry holding an immutable
+ModelSlot (model + version + load time). Requests read `registry.active`
+once and keep using that slot, so a swap never affects a request that is
+already running. A reload:
+
+    1. loads the new model in a background thread (requests keep being served)
+    2. validates it on a canary batch (right shape, finite, non-negative, and
+       no prediction moving by more than `max_change` relative to the active
+       model's, unless the reload is forced)
+    3. atomically replaces `active` and keeps the old slot for rollback
+
+Reloads are triggered from the admin endpoints in 'app.py' or by the file
+watcher, which polls the model artifact for changes.
+
+Each gunicorn worker has its own registry, and an admin request reaches only
+one of them. So the admin endpoints also publish the command to a small
+control file (`control_path`). Every worker's watcher polls that file and
+applies any command newer than the last one it has seen. A reload loads the
+files on disk; a rollback swaps back to the version the publishing worker
+rolled back to, if this worker still has it in memory.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from metrics import REGISTRY
+
+MODEL_INFO = REGISTRY.gauge('aquawise_model_info', 'Loaded model versions per engine (1 = active, 0 = replaced)', ['engine', 'version'])
+MODEL_LOAD_SECONDS = REGISTRY.gauge('aquawise_model_load_seconds', 'Time taken to load the active model', ['engine'])
+MODEL_LOADED_AT = REGISTRY.gauge('aquawise_model_loaded_timestamp_seconds', 'Unix time the active model was loaded', ['engine'])
+MODEL_RELOADS = REGISTRY.counter('aquawise_model_reloads_total', 'Model reload attempts', ['engine', 'result'])
+
+
+class ModelSlot:
+    """One loaded model version. Never mutated after creation."""
+
+    __slots__ = ('model', 'version', 'source', 'loaded_at', 'load_seconds')
+
+    def __init__(self, model, version, source, loaded_at, load_seconds):
+        self.model = model
+        self.version = version
+        self.source = source
+        self.loaded_at = loaded_at
+        self.load_seconds = load_seconds
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'source': self.source,
+            'loaded_at': self.loaded_at,
+            'load_seconds': round(self.load_seconds, 4)
+        }
+
+
+class ReloadInProgress(RuntimeError):
+    """Another reload of the same engine is still running."""
+
+
+class CanaryRejected(ValueError):
+    """The candidate's canary predictions moved too far from the active model's."""
+
+
+class ModelRegistry:
+    """Holds the active model for one engine and swaps in new versions without blocking requests."""
+
+    def __init__(self, name, loader, canary=None, history=1, max_change=None, control_path=None):
+        self.name = name
+        self.loader = loader    # () -> (model, version, source)
+        self.canary = canary    # () -> batch used to validate a candidate before it goes live
+        self.max_change = max_change  # max relative canary change vs the active model; None = unchecked
+        self.active = None      # ModelSlot or None; read without locking
+        self.previous = deque(maxlen=max(1, history))
+        self.last_reload = None
+        self.control_path = control_path  # JSON file that carries admin commands to the other workers
+        self._control_seen = None         # id of the newest command applied (or present at startup)
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._watcher_pid = None
+        self._watcher_lock = threading.Lock()
+
+    # --- loading ---
+
+    def _load_slot(self):
+        started = time.perf_counter()
+        model, version, source = self.loader()
+        return ModelSlot(model, version, source, time.time(), time.perf_counter() - started)
+
+    def _validate(self, slot):
+        """Run the canary batch; returns the max relative change against the active model (or None)."""
+        if self.canary is None:
+            return None
+        batch = self.canary()
+        predictions = np.asarray(slot.model.predict(batch), dtype=np.float64)
+        if predictions.shape != (len(batch),):
+            raise ValueError(f'Canary predictions have shape {predictions.shape}, expected ({len(batch)},)')
+        if not np.all(np.isfinite(predictions)) or np.any(predictions < 0):
+            raise ValueError('Canary predictions contain NaN, infinite or negative values')
+        current = self.active
+        if current is None:
+            return None
+        baseline = np.asarray(current.model.predict(batch), dtype=np.float64)
+        return float(np.max(np.abs(predictions - baseline) / np.maximum(np.abs(baseline), 1.0)))
+
+    def _activate(self, slot):
+        old = self.active
+        self.active = slot  # single reference assignment: atomic for concurrent readers
+        if old is not None:
+            self.previous.append(old)
+            MODEL_INFO.set(0, engine=self.name, version=old.version)
+        MODEL_INFO.set(1, engine=self.name, version=slot.version)
+        MODEL_LOAD_SECONDS.set(slot.load_seconds, engine=self.name)
+        MODEL_LOADED_AT.set(slot.loaded_at, engine=self.name)
+
+    def load_initial(self):
+        """Synchronous first load at startup; errors propagate to the caller."""
+        slot = self._load_slot()
+        self._activate(slot)
+        # Commands published before this process started describe older models
+        command = self._read_control()
+        self._control_seen = command.get('id') if command else None
+        return slot
+
+    def reload(self, wait=False, force=False, publish=False):
+        """
+        Load, validate and swap in the model currently on disk.
+
+        Runs in a background thread unless wait=True. Raises ReloadInProgress if a
+        reload of this engine is already running. Returns the reload record
+        (a dict updated in place by the background thread). force=True skips the
+        max_change check (for a deliberately different model); the other checks still run.
+        publish=True tells the other workers to reload too, once this one has the new
+        model live (activated or already unchanged); a failed or rejected reload is not passed on.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            raise ReloadInProgress(f"A reload of '{self.name}' is already running")
+
+        record = {'status': 'running', 'started_at': time.time()}
+        self.last_reload = record
+
+        def run():
+            try:
+                slot = self._load_slot()
+                if self.active is not None and slot.version == self.active.version:
+                    record.update(status='unchanged', version=slot.version)
+                    MODEL_RELOADS.inc(engine=self.name, result='unchanged')
+                    if publish:
+                        self.publish('reload', force=force)
+                    return
+                change = record['canary_max_relative_change'] = self._validate(slot)
+                if change is not None and self.max_change is not None and change > self.max_change and not force:
+                    raise CanaryRejected(f'Canary predictions changed by up to {change:.1%} '
+                                         f'(limit {self.max_change:.1%}); reload with force to accept')
+                self._activate(slot)
+                record.update(status='activated', version=slot.version, load_seconds=round(slot.load_seconds, 4))
+                MODEL_RELOADS.inc(engine=self.name, result='activated')
+                print(f"🔄 [{self.name}] Model {slot.version} activated ({slot.source}, {slot.load_seconds * 1000:.0f} ms)")
+                if publish:
+                    self.publish('reload', force=force)
+            except CanaryRejected as e:
+                record.update(status='rejected', version=slot.version, error=str(e))
+                MODEL_RELOADS.inc(engine=self.name, result='rejected')
+                print(f"🛑 [{self.name}] Model {slot.version} rejected, keeping the current version: {e}")
+            except Exception as e:
+                record.update(status='failed', error=str(e))
+                MODEL_RELOADS.inc(engine=self.name, result='failed')
+                print(f"❌ [{self.name}] Model reload failed, keeping the current version: {e}")
+            finally:
+                record['finished_at'] = time.time()
+                self._reload_lock.release()
+
+        if wait:
+            run()
+        else:
+            threading.Thread(target=run, name=f'model-reload-{self.name}', daemon=True).start()
+        return record
+
+    def rollback(self, version=None):
+        """
+        Swap a previous version back in (the most recent one, or the given version);
+        returns the new active slot. Raises LookupError if it is not kept in memory.
+        """
+        with self._reload_lock:
+            if version is not None and self.active is not None and self.active.version == version:
+                return self.active
+            candidates = [slot for slot in self.previous if version is None or slot.version == version]
+            if not candidates:
+                wanted = f"version {version} of '{self.name}'" if version else f"previous '{self.name}' model"
+                raise LookupError(f"No {wanted} kept in memory")
+            target = candidates[-1]
+            self.previous.remove(target)
+            current = self.active
+            self.active = target
+            if current is not None:
+                self.previous.append(current)
+                MODEL_INFO.set(0, engine=self.name, version=current.version)
+            MODEL_INFO.set(1, engine=self.name, version=target.version)
+            MODEL_LOAD_SECONDS.set(target.load_seconds, engine=self.name)
+            MODEL_LOADED_AT.set(target.loaded_at, engine=self.name)
+            MODEL_RELOADS.inc(engine=self.name, result='rollback')
+            print(f"↩️  [{self.name}] Rolled back to model {target.version}")
+            return target
+
+    # --- commands for the other workers ---
+
+    def publish(self, action, **fields):
+        """Write an admin command ('reload' or 'rollback') for the other workers' watchers."""
+        if not self.control_path:
+            return None
+        command = {'id': time.time_ns(), 'action': action, 'pid': os.getpid(), **fields}
+        tmp_path = f'{self.control_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(command, f)
+        os.replace(tmp_path, self.control_path)  # readers never see half a file
+        self._control_seen = command['id']
+        return command
+
+    def _read_control(self):
+        if not self.control_path:
+            return None
+        try:
+            with open(self.control_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _apply_control(self):
+        command = self._read_control()
+        if not command or command.get('id') == self._control_seen:
+            return
+        if self._control_seen is not None and command['id'] < self._control_seen:
+            return
+        self._control_seen = command['id']
+        if command.get('pid') == os.getpid():
+            return  # published by this worker, which already applied it
+        try:
+            if command['action'] == 'reload':
+                self.reload(wait=True, force=bool(command.get('force')))
+            elif command['action'] == 'rollback':
+                self.rollback(command.get('version'))
+        except (ReloadInProgress, LookupError) as e:
+            print(f"⚠️  [{self.name}] Could not apply '{command['action']}' from worker {command.get('pid')}: {e}")
+
+    # --- file watching ---
+
+    def watch(self, paths, interval_seconds):
+        """
+        Poll `paths` every interval and reload once they change and have stopped
+        changing; also apply commands published to control_path by other workers.
+        Safe to call on every request: starts one thread per process.
+        """
+        if interval_seconds <= 0:
+            return
+        if self._watcher is not None and self._watcher_pid == os.getpid() and self._watcher.is_alive():
+            return
+        with self._watcher_lock:
+            if self._watcher is not None and self._watcher_pid == os.getpid() and self._watcher.is_alive():
+                return
+            self._watcher_pid = os.getpid()
+            self._watcher = threading.Thread(target=self._watch_loop, args=(list(paths), interval_seconds),
+                                             name=f'model-watch-{self.name}', daemon=True)
+            self._watcher.start()
+
+    @staticmethod
+    def _signature(paths):
+        sig = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                sig.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                sig.append((path, None, None))
+        return tuple(sig)
+
+    def _watch_loop(self, paths, interval_seconds):
+        seen = self._signature(paths)
+        pending = None
+        while True:
+            time.sleep(interval_seconds)
+            self._apply_control()
+            current = self._signature(paths)
+            if current == seen:
+                pending = None
+                continue
+            if current != pending:
+                pending = current  # still being written; wait for one quiet interval
+                continue
+            seen, pending = current, None
+            try:
+                self.reload(wait=True)
+            except ReloadInProgress:
+                pass
+
+    def status(self):
+        return {
+            'engine': self.name,
+            'active': self.active.describe() if self.active else None,
+            'previous': [slot.describe() for slot in reversed(self.previous)],
+            'last_reload': dict(self.last_reload) if self.last_reload else None
+        }
@@ -0,0 +1,257 @@
+"""
+Server-side NumPy inference for the 'model_advanced' neural network.
+
+Loads the TensorFlow.js export written by 'train_model_advanced.py'
+(model.json + weight shards + scalers.json) without importing TensorFlow:
+
+    * the weight shard is memory-mapped and sliced into per-tensor views;
+      float16 / uint8 quantized weights (quantize_nn.py) are dequantized
+    * the Sequential topology is parsed from model.json
+    * BatchNormalization layers are folded into the adjacent Dense weights at
+      load time (into the following Dense when a non-linear activation sits in
+      between, otherwise into the preceding one); Dropout is dropped
+    * inputs go through the same feature transform and StandardScaler as
+      training ('features.py')
+
+The forward pass is a handful of batched float32 matmuls.
+
+Usage:
+    python nn_engine.py  # load model_advanced/ and predict a sample row
+"""
+
+import json
+import os
+
+import numpy as np
+
+from features import FeatureTransform
+
+MODEL_DIR = 'model_advanced'
+
+# Raw inputs the engine needs (crop_water_base is not part of the NN feature set)
+INPUT_FIELDS = [
+    'crop_type',
+    'soil_moisture_percent',
+    'temperature_celsius',
+    'humidity_percent',
+    'rainfall_mm'
+]
+
+_DTYPES = {'float32': np.float32, 'int32': np.int32}
+# Storage dtypes of TF.js weight quantization ('quantization': {'dtype': ...})
+_QUANTIZED_DTYPES = {'float16': np.float16, 'uint8': np.uint8, 'uint16': np.uint16}
+
+_ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+    'tanh': np.tanh,
+}
+
+
+class UnsupportedModelError(ValueError):
+    """Raised when model.json contains a layer or dtype the engine cannot run."""
+
+
+def _map_weights(model_dir, manifest):
+    """Memory-map every shard and return {weight name: ndarray view}."""
+    weights = {}
+    for group in manifest:
+        shards = [np.memmap(os.path.join(model_dir, p), dtype=np.uint8, mode='r') for p in group['paths']]
+        data = shards[0] if len(shards) == 1 else np.concatenate(shards)  # weights may span shards
+        offset = 0
+        for spec in group['weights']:
+            dtype = _DTYPES.get(spec['dtype'])
+            if dtype is None:
+                raise UnsupportedModelError(f"Unsupported dtype {spec['dtype']!r} for '{spec['name']}'")
+            quantization = spec.get('quantization')
+            stored = _QUANTIZED_DTYPES.get(quantization['dtype']) if quantization else dtype
+            if stored is None:
+                raise UnsupportedModelError(
+                    f"Unsupported quantization {quantization['dtype']!r} for '{spec['name']}'")
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            nbytes = count * np.dtype(stored).itemsize
+            values = data[offset:offset + nbytes].view(stored).reshape(spec['shape'])
+            if quantization:
+                values = _dequantize(values, quantization, dtype)
+            weights[spec['name']] = values
+            offset += nbytes
+    return weights
+
+
+def _dequantize(values, quantization, dtype):
+    """Undo TF.js weight quantization: float16 is widened, uint8/uint16 are q * scale + min."""
+    if quantization['dtype'] == 'float16':
+        return values.astype(dtype)
+    return (values.astype(np.float64) * quantization['scale'] + quantization['min']).astype(dtype)
+
+
+def select_variant(model_dir=MODEL_DIR, max_deviation=None):
+    """
+    Directory of the smallest exported variant (see quantize_nn.py) whose predictions on
+    the test split are never further from the original model's than `max_deviation`
+    (a fraction of the mean prediction, e.g. 0.005 = 0.5%). Returns model_dir itself when
+    no limit is set or no variant qualifies (variants exported without deviation figures
+    never do).
+    """
+    if max_deviation is None:
+        return model_dir
+    try:
+        with open(os.path.join(model_dir, 'scalers.json')) as f:
+            variants = json.load(f).get('quantization', {}).get('variants', {})
+    except OSError:
+        return model_dir
+    fitting = [v for v in variants.values()
+               if v.get('max_relative_diff', float('inf')) <= max_deviation and os.path.exists(os.path.join(model_dir, v['path'], 'model.json'))]
+    if not fitting:
+        return model_dir
+    return os.path.join(model_dir, min(fitting, key=lambda v: v['weight_bytes'])['path'])
+
+
+def _layer_configs(topology):
+    config = topology['model_config']['config']
+    # Keras 2 nests the layer list under 'layers'; very old exports store the list directly
+    return config['layers'] if isinstance(config, dict) else config
+
+
+def _build_layers(topology, weights, fold_batchnorm=True):
+    """
+    Turn the Keras layer list into [(kind, kernel, bias, activation name)].
+
+    With fold_batchnorm=False the BatchNormalization layers are kept as
+    separate ('batchnorm', scale, shift) steps; used to check the folding.
+    """
+    steps = []
+    for layer in _layer_configs(topology):
+        kind, cfg = layer['class_name'], layer['config']
+        name = cfg['name']
+
+        if kind in ('InputLayer', 'Dropout'):
+            continue
+
+        if kind == 'Dense':
+            kernel = np.asarray(weights[f'{name}/kernel'], dtype=np.float64)
+            if cfg.get('use_bias', True):
+                bias = np.asarray(weights[f'{name}/bias'], dtype=np.float64)
+            else:
+                bias = np.zeros(kernel.shape[1])
+            activation = cfg.get('activation', 'linear')
+            if activation not in _ACTIVATIONS:
+                raise UnsupportedModelError(f"Unsupported activation {activation!r} in '{name}'")
+            steps.append(['dense', kernel, bias, activation])
+
+        elif kind == 'BatchNormalization':
+            # Inference-time BN is a per-channel affine map: y = a * x + b
+            eps = cfg.get('epsilon', 1e-3)
+            mean = np.asarray(weights[f'{name}/moving_mean'], dtype=np.float64)
+            var = np.asarray(weights[f'{name}/moving_variance'], dtype=np.float64)
+            gamma = np.asarray(weights[f'{name}/gamma'], dtype=np.float64) if cfg.get('scale', True) else 1.0
+            beta = np.asarray(weights[f'{name}/beta'], dtype=np.float64) if cfg.get('center', True) else 0.0
+            a = gamma / np.sqrt(var + eps)
+            b = beta - mean * a
+            steps.append(['batchnorm', a, b, None])
+
+        else:
+            raise UnsupportedModelError(f"Unsupported layer type {kind!r} ('{name}')")
+
+    if fold_batchnorm:
+        steps = _fold_batchnorm(steps)
+
+    return [(kind, np.ascontiguousarray(w, dtype=np.float32), np.ascontiguousarray(b, dtype=np.float32), act)
+            for kind, w, b, act in steps]
+
+
+def _fold_batchnorm(steps):
+    folded = []
+    pending = None  # BN (a, b) waiting to be folded into the next Dense
+    for kind, w, b, act in steps:
+        if kind == 'batchnorm':
+            prev = folded[-1] if folded else None
+            if pending is None and prev is not None and prev[0] == 'dense' and prev[3] == 'linear':
+                # Dense(linear) -> BN: scale the Dense outputs directly
+                prev[1] = prev[1] * w[None, :]
+                prev[2] = prev[2] * w + b
+            elif pending is None:
+                pending = (w, b)
+            else:
+                pending = (pending[0] * w, pending[1] * w + b)
+            continue
+
+        if pending is not None:
+            # BN -> Dense: W' = diag(a) W, c' = b W + c
+            a, shift = pending
+            b = shift @ w + b
+            w = w * a[:, None]
+            pending = None
+        folded.append([kind, w, b, act])
+
+    if pending is not None:
+        folded.append(['batchnorm', pending[0], pending[1], None])
+    return folded
+
+
+class NNEngine:
+    """Batched NumPy forward pass for the exported Keras MLP."""
+
+    def __init__(self, layers, scalers):
+        self.layers = layers
+        self.crop_classes = list(scalers['crop_classes'])
+        self.feature_columns = list(scalers['feature_columns'])
+        # Same transform as training (features.py), driven by scalers.json's feature_columns
+        self.features = FeatureTransform.from_scalers(scalers)
+        self._y_mean = float(scalers['scaler_y_mean'][0])
+        self._y_scale = float(scalers['scaler_y_scale'][0])
+        self.input_names = INPUT_FIELDS
+
+    def known_crops(self, crops):
+        """Boolean mask of crops the network was trained on."""
+        return self.features.encode_crops(crops)[1]
+
+    def transform(self, X):
+        """Raw inputs (DataFrame or mapping of column -> values) -> scaled float32 matrix."""
+        return self.features.transform(X)
+
+    def forward(self, X32):
+        """Run the network on an already-scaled float32 matrix; returns scaled outputs."""
+        h = X32
+        for kind, w, b, act in self.layers:
+            if kind == 'batchnorm':
+                h = h * w + b
+            else:
+                h = _ACTIVATIONS[act](h @ w + b)
+        return h
+
+    def predict(self, X):
+        """Water requirement in L/ha for each row (same interface as Pipeline.predict)."""
+        scaled = self.forward(self.transform(X))[:, 0].astype(np.float64)
+        return scaled * self._y_scale + self._y_mean
+
+
+def load_nn_engine(model_dir=MODEL_DIR, fold_batchnorm=True):
+    """Load model.json, memory-map its weights and build an NNEngine."""
+    with open(os.path.join(model_dir, 'model.json')) as f:
+        model_json = json.load(f)
+    with open(os.path.join(model_dir, 'scalers.json')) as f:
+        scalers = json.load(f)
+
+    weights = _map_weights(model_dir, model_json['weightsManifest'])
+    layers = _build_layers(model_json['modelTopology'], weights, fold_batchnorm=fold_batchnorm)
+    return NNEngine(layers, scalers)
+
+
+if __name__ == '__main__':
+    engine = load_nn_engine()
+    print(f"✅ Loaded '{MODEL_DIR}' as {len(engine.layers)} folded layers "
+          f"({' -> '.join(str(w.shape[1]) for _, w, _, _ in engine.layers)})")
+
+    sample = {
+        'crop_type': ['rice', 'maize'],
+        'soil_moisture_percent': [45.0, 60.0],
+        'temperature_celsius': [27.5, 22.0],
+        'humidity_percent': [78.0, 65.0],
+        'rainfall_mm': [180.0, 90.0],
+    }
+    folded = engine.predict(sample)
+    unfolded = load_nn_engine(fold_batchnorm=False).predict(sample)
+    print(f"   Predictions (L/ha): {np.round(folded, 2).tolist()}")
+    print(f"   Max |folded - unfolded| BatchNorm difference: {np.max(np.abs(folded - unfolded)):.6f} L/ha")
@@ -0,0 +1,135 @@
+"""
+Append-only log of newly labeled observations and the model ledger.
+
+datasets/new_observations.csv collects labeled readings from the field
+(crop_type, the four sensor values and the measured
+water_requirement_liters_per_hectare in L/ha, the unit /predict returns).
+Rows are only ever appended, so a byte offset identifies exactly which rows
+a model has been trained on.
+
+optimized_irrigation_model.ledger.jsonl has one JSON line per model written
+by 'retrain_model.py': its version, parent version, the log offset and row
+count it has seen, and the drift report of the update.
+
+Rows arrive through append_observations() (POST /admin/observations in
+'app.py') or from the command line:
+
+    python observation_log.py new_rows.csv
+"""
+
+import io
+import json
+import math
+import os
+import sys
+import threading
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock; the process-local lock still serializes threads
+    fcntl = None
+
+from dataset_cache import clean
+
+OBSERVATION_LOG = os.path.join('datasets', 'new_observations.csv')
+LEDGER_FILE = 'optimized_irrigation_model.ledger.jsonl'
+
+COLUMNS = [
+    'crop_type',
+    'soil_moisture_percent',
+    'temperature_celsius',
+    'humidity_percent',
+    'rainfall_mm',
+    'water_requirement_liters_per_hectare'
+]
+
+_append_lock = threading.Lock()
+
+
+def validate_row(row):
+    """Return an error message for an invalid row, or None."""
+    if not isinstance(row, dict):
+        return 'Row must be an object'
+    missing = [c for c in COLUMNS if row.get(c) in (None, '')]
+    if missing:
+        return f'Missing fields: {missing}'
+    invalid = []
+    for column in COLUMNS[1:]:
+        try:
+            if not math.isfinite(float(row[column])):
+                invalid.append(column)
+        except (TypeError, ValueError):
+            invalid.append(column)
+    if invalid:
+        return f'Invalid values for fields: {invalid}'
+    return None
+
+
+def append_observations(rows, path=OBSERVATION_LOG):
+    """Validate and append labeled rows; returns (number appended, {row index: error})."""
+    errors = {i: e for i, row in enumerate(rows) if (e := validate_row(row))}
+    valid = [row for i, row in enumerate(rows) if i not in errors]
+    if not valid:
+        return 0, errors
+
+    frame = pd.DataFrame([{c: row[c] for c in COLUMNS} for row in valid], columns=COLUMNS)
+    frame['crop_type'] = frame['crop_type'].astype(str).str.strip().str.lower()
+    with _append_lock, open(path, 'a', newline='') as f:
+        # The file lock covers other gunicorn workers: only the first writer to an empty log adds the header
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        new_file = os.fstat(f.fileno()).st_size == 0
+        # One write per batch, so a reader never sees half a batch's lines interleaved with another
+        f.write(frame.to_csv(index=False, header=new_file, lineterminator='\n'))
+        f.flush()
+    return len(valid), errors
+
+
+def read_observations(path=OBSERVATION_LOG, start_offset=0):
+    """
+    Rows appended after `start_offset` (bytes), cleaned like the training set
+    except that repeated rows are kept: a station sending the same reading and
+    label again is another real sample.
+
+    Returns (DataFrame, end offset, raw row count). Only complete lines are
+    read, so a batch that is still being written is picked up next time.
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=COLUMNS), 0, 0
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(max(start_offset, len(header)))
+        data = f.read()
+    complete = data[:data.rfind(b'\n') + 1]
+    end_offset = max(start_offset, len(header)) + len(complete)
+    if not complete:
+        return pd.DataFrame(columns=COLUMNS), end_offset, 0
+
+    raw = pd.read_csv(io.BytesIO(header + complete), dtype=str)
+    df, report = clean(raw, dedupe=False)
+    return df, end_offset, report['rows_read']
+
+
+def read_ledger(path=LEDGER_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_ledger(entry, path=LEDGER_FILE):
+    with open(path, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python observation_log.py new_rows.csv")
+        sys.exit(1)
+    incoming = pd.read_csv(sys.argv[1], dtype=str).to_dict('records')
+    appended, errors = append_observations(incoming)
+    print(f"✅ Appended {appended} of {len(incoming)} rows to '{OBSERVATION_LOG}'")
+    for index, error in sorted(errors.items()):
+        print(f"   ⚠️ row {index}: {error}")
@@ -0,0 +1,205 @@
+"""
+Bounded, expiring storage for password-reset OTPs.
+
+'app.py' used to keep OTPs in a plain dict. Unverified codes were never
+removed, and each gunicorn worker had its own dict, so a code issued by one
+worker was unknown to the others. Both stores here hold at most `capacity`
+codes, expire them in expiry order without scanning, and evict the code
+closest to expiry when full:
+
+    MemoryOTPStore   per process; a dict plus a min-heap of expiry times.
+                     Each set() pops only the heap entries that have expired.
+    SQLiteOTPStore   one SQLite database in WAL mode shared by every worker
+                     on the host. Expiry and eviction are range deletes on an
+                     index over expires_at; the row count is kept by triggers,
+                     so the capacity check is one lookup.
+
+Codes are never stored, only HMAC-SHA256(key, email + code). check() tells
+a valid code from a wrong, expired (but not yet purged) or never requested
+one. The memory store uses a random key per process. The SQLite store uses
+AQUAWISE_OTP_SECRET or a random key in a 0600 file next to the database.
+That file and the database are private to the server's user; see
+local_state.py.
+
+Configuration (environment):
+    AQUAWISE_OTP_BACKEND    'memory' (default) or 'sqlite'
+    AQUAWISE_OTP_DB         SQLite file (default: otp.sqlite3 in a private per-user temp directory)
+    AQUAWISE_OTP_SECRET     HMAC key for stored codes (default: random, kept in <AQUAWISE_OTP_DB>.key)
+    AQUAWISE_OTP_CAPACITY   max stored OTPs (default 10000)
+"""
+
+import hashlib
+import heapq
+import hmac
+import os
+import sqlite3
+import threading
+import time
+
+from local_state import secret_key, state_path
+from metrics import REGISTRY
+
+REMOVED = REGISTRY.counter(
+    'aquawise_otp_removed_total', 'OTPs dropped by the store before use (expired, evicted: store full)', ['reason'])
+
+
+class _OTPStore:
+    def digest(self, email, otp):
+        return hmac.new(self._key, f'{email}\0{otp}'.encode(), hashlib.sha256).hexdigest()
+
+    def check(self, email, otp):
+        """'valid', 'invalid', 'expired' or 'missing' (no code requested, or already purged)."""
+        record = self._lookup(email)
+        if record is None:
+            return 'missing'
+        digest, expires_at = record
+        if self._clock() > expires_at:
+            return 'expired'
+        return 'valid' if hmac.compare_digest(digest, self.digest(email, str(otp))) else 'invalid'
+
+
+class MemoryOTPStore(_OTPStore):
+    """OTPs in this process: dict lookups, heap-ordered expiry."""
+
+    backend = 'memory'
+
+    def __init__(self, capacity=10000, clock=time.time):
+        self.capacity = int(capacity)
+        self._clock = clock
+        self._key = os.urandom(32)
+        self._records = {}  # email -> (digest, expires_at, seq)
+        self._heap = []     # (expires_at, seq, email); stale once the email is reset or deleted
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def set(self, email, otp, ttl_seconds):
+        expires_at = self._clock() + ttl_seconds
+        with self._lock:
+            self._purge(self._clock())
+            if email not in self._records:
+                while len(self._records) >= self.capacity:
+                    self._pop_soonest('evicted')
+            self._seq += 1
+            self._records[email] = (self.digest(email, otp), expires_at, self._seq)
+            heapq.heappush(self._heap, (expires_at, self._seq, email))
+            if len(self._heap) > 2 * max(len(self._records), 64):
+                # Mostly stale entries from re-requested codes: rebuild from the live records
+                self._heap = [(exp, seq, key) for key, (_, exp, seq) in self._records.items()]
+                heapq.heapify(self._heap)
+
+    def _lookup(self, email):
+        record = self._records.get(email)
+        return None if record is None else record[:2]
+
+    def delete(self, email):
+        with self._lock:
+            self._records.pop(email, None)  # its heap entry goes stale and is skipped later
+
+    def _purge(self, now):
+        while self._heap and self._heap[0][0] <= now:
+            self._pop_soonest('expired')
+
+    def _pop_soonest(self, reason):
+        while self._heap:
+            _, seq, email = heapq.heappop(self._heap)
+            record = self._records.get(email)
+            if record is not None and record[2] == seq:
+                del self._records[email]
+                REMOVED.inc(reason=reason)
+                return
+
+    def status(self):
+        return {'backend': self.backend, 'capacity': self.capacity, 'entries': len(self)}
+
+
+class SQLiteOTPStore(_OTPStore):
+    """OTP digests in a private WAL-mode SQLite file, visible to every worker of this user."""
+
+    backend = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS otp (
+            email TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS otp_expires_at ON otp (expires_at);
+        CREATE TABLE IF NOT EXISTS otp_count (id INTEGER PRIMARY KEY CHECK (id = 0), n INTEGER NOT NULL);
+        INSERT OR IGNORE INTO otp_count VALUES (0, (SELECT count(*) FROM otp));
+        CREATE TRIGGER IF NOT EXISTS otp_counted_insert AFTER INSERT ON otp
+            BEGIN UPDATE otp_count SET n = n + 1 WHERE id = 0; END;
+        CREATE TRIGGER IF NOT EXISTS otp_counted_delete AFTER DELETE ON otp
+            BEGIN UPDATE otp_count SET n = n - 1 WHERE id = 0; END;
+    """
+
+    def __init__(self, path, capacity=10000, clock=time.time, busy_timeout=5.0, secret=None):
+        self.path = state_path(path, 'otp.sqlite3')
+        self._key = secret_key(secret, self.path + '.key')
+        self.capacity = int(capacity)
+        self.busy_timeout = busy_timeout
+        self._clock = clock
+        self._local = threading.local()
+        with self._connection() as db:
+            db.executescript(self.SCHEMA)
+
+    def _connection(self):
+        # One connection per thread and per process (connections must not cross a fork)
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')  # OTPs are short-lived; losing the last few on power loss is fine
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def __len__(self):
+        return self._connection().execute('SELECT n FROM otp_count WHERE id = 0').fetchone()[0]
+
+    def set(self, email, otp, ttl_seconds):
+        now = self._clock()
+        db = self._connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            expired = db.execute('DELETE FROM otp WHERE expires_at <= ?', (now,)).rowcount
+            exists = db.execute('SELECT 1 FROM otp WHERE email = ?', (email,)).fetchone()
+            evicted = 0
+            if not exists:
+                over = db.execute('SELECT n FROM otp_count WHERE id = 0').fetchone()[0] - self.capacity + 1
+                if over > 0:
+                    evicted = db.execute('DELETE FROM otp WHERE email IN '
+                                         '(SELECT email FROM otp ORDER BY expires_at LIMIT ?)', (over,)).rowcount
+            # An upsert, not INSERT OR REPLACE, so replacing a code does not fire the count triggers
+            db.execute('INSERT INTO otp (email, digest, expires_at) VALUES (?, ?, ?) '
+                       'ON CONFLICT (email) DO UPDATE SET digest = excluded.digest, expires_at = excluded.expires_at',
+                       (email, self.digest(email, otp), now + ttl_seconds))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        if expired:
+            REMOVED.inc(expired, reason='expired')
+        if evicted:
+            REMOVED.inc(evicted, reason='evicted')
+
+    def _lookup(self, email):
+        return self._connection().execute('SELECT digest, expires_at FROM otp WHERE email = ?', (email,)).fetchone()
+
+    def delete(self, email):
+        self._connection().execute('DELETE FROM otp WHERE email = ?', (email,))
+
+    def status(self):
+        return {'backend': self.backend, 'path': self.path, 'capacity': self.capacity, 'entries': len(self)}
+
+
+def create_otp_store(environ=os.environ):
+    """The OTP store selected by AQUAWISE_OTP_BACKEND."""
+    capacity = int(environ.get('AQUAWISE_OTP_CAPACITY', 10000))
+    backend = environ.get('AQUAWISE_OTP_BACKEND', 'memory')
+    if backend == 'memory':
+        return MemoryOTPStore(capacity)
+    if backend == 'sqlite':
+        return SQLiteOTPStore(environ.get('AQUAWISE_OTP_DB'), capacity, secret=environ.get('AQUAWISE_OTP_SECRET'))
+    raise ValueError(f"AQUAWISE_OTP_BACKEND must be 'memory' or 'sqlite', not {backend!r}")
@@ -0,0 +1,155 @@
+"""
+Bounded LRU + TTL cache for single-row predictions.
+
+Sensor readings repeat heavily, so '/predict' keys results on the engine, the
+crop and the numeric inputs quantized to a configurable resolution (e.g. soil
+moisture to 0.1 %, temperature to 0.01 °C). Entries expire after a TTL, the
+least recently used entry is evicted once the cache is full, and everything
+cached for an engine is dropped as soon as that engine's model version changes.
+
+Configuration (environment):
+    AQUAWISE_CACHE_SIZE        max entries, 0 disables the cache (default 10000)
+    AQUAWISE_CACHE_TTL         seconds an entry stays valid (default 300)
+    AQUAWISE_CACHE_RESOLUTION  per-field quantization, e.g.
+                               "soil_moisture_percent=0.1,temperature_celsius=0.01"
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Default quantization step per numeric input field
+DEFAULT_RESOLUTIONS = {
+    'soil_moisture_percent': 0.1,
+    'temperature_celsius': 0.01,
+    'humidity_percent': 0.1,
+    'rainfall_mm': 0.1,
+    'crop_water_base': 1.0
+}
+
+
+def parse_resolutions(spec, defaults=DEFAULT_RESOLUTIONS):
+    """Parse "field=step,field=step" into a resolution dict layered over the defaults."""
+    resolutions = dict(defaults)
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        field, _, step = item.partition('=')
+        step = float(step)
+        if step <= 0:
+            raise ValueError(f"Resolution for '{field}' must be positive")
+        resolutions[field.strip()] = step
+    return resolutions
+
+
+class PredictionCache:
+    """Thread-safe LRU cache with TTL and per-engine model-version invalidation."""
+
+    def __init__(self, max_entries=10000, ttl_seconds=300.0, resolutions=None, clock=time.monotonic):
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = float(ttl_seconds)
+        self.resolutions = dict(resolutions or DEFAULT_RESOLUTIONS)
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._versions = {}            # engine -> model version the cached entries belong to
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        return cls(
+            max_entries=int(environ.get('AQUAWISE_CACHE_SIZE', 10000)),
+            ttl_seconds=float(environ.get('AQUAWISE_CACHE_TTL', 300)),
+            resolutions=parse_resolutions(environ.get('AQUAWISE_CACHE_RESOLUTION'))
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def make_key(self, engine, crop, values):
+        """
+        Cache key: engine, crop and every numeric field rounded to its resolution step.
+        None (not cacheable) if a value is NaN or infinite.
+        """
+        if not all(math.isfinite(float(value)) for value in values.values()):
+            return None
+        quantized = tuple(
+            (field, round(float(value) / self.resolutions.get(field, 1e-6)))
+            for field, value in sorted(values.items())
+        )
+        return (engine, crop, quantized)
+
+    def _check_version(self, engine, version):
+        # Caller holds the lock. A new model version drops every entry cached for that engine.
+        current = self._versions.get(engine)
+        if current == version:
+            return
+        if current is not None:
+            stale = [k for k in self._entries if k[0] == engine]
+            for k in stale:
+                del self._entries[k]
+            self.invalidations += len(stale)
+        self._versions[engine] = version
+
+    def get(self, key, version):
+        """Return the cached prediction or None."""
+        if not self.enabled or key is None:
+            return None
+        with self._lock:
+            self._check_version(key[0], version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if self._clock() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, version, value):
+        if not self.enabled or key is None:
+            return
+        with self._lock:
+            self._check_version(key[0], version)
+            self._entries[key] = (value, self._clock() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'resolutions': dict(self.resolutions),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'model_versions': dict(self._versions)
+            }
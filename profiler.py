@@ -0,0 +1,248 @@
+"""
+On-demand request profiling and allocation snapshots for 'app.py'.
+
+Profiling is off until an operator turns it on. A request is profiled when
+
+    * a random draw falls under the sampling rate (AQUAWISE_PROFILE_RATE, or
+      POST /admin/profile {"rate": 0.05} at runtime), or
+    * it carries a valid signed header, X-Aquawise-Profile: <unix time>:<hmac>,
+      where hmac is HMAC-SHA256(secret, "<unix time>") in hex and secret is
+      AQUAWISE_PROFILE_SECRET (default: the admin token). Signatures are
+      accepted for SIGNATURE_MAX_AGE seconds; `python profiler.py sign` prints one.
+
+While any profiled request is running, one daemon thread samples the
+stacks of those request threads every AQUAWISE_PROFILE_INTERVAL_MS
+(sys._current_frames(), no tracing hooks), and the interpreter's GIL switch
+interval is shortened so samples are not skewed towards C calls that release
+the GIL. Unprofiled requests pay one random draw. Samples are aggregated by
+stack and exported in the collapsed format flamegraph.pl / speedscope read:
+
+    app.py:predict;app.py:predict_response;frame.py:__init__ 42
+
+MemoryTracker wraps tracemalloc: every call returns the top-N allocation
+sites that grew since the previous call, e.g. to find what is allocated on
+every request.
+
+All state is per process; with several gunicorn workers each keeps its own.
+"""
+
+import hashlib
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+PROFILE_HEADER = 'X-Aquawise-Profile'
+SIGNATURE_MAX_AGE = 300  # seconds
+
+
+def sign(secret, timestamp=None):
+    """Header value that marks one request for profiling."""
+    timestamp = str(int(time.time() if timestamp is None else timestamp))
+    digest = hmac.new(secret.encode(), timestamp.encode(), hashlib.sha256).hexdigest()
+    return f'{timestamp}:{digest}'
+
+
+def verify(secret, value, now=None):
+    """True if value is a signature from sign(secret) made within SIGNATURE_MAX_AGE seconds."""
+    if not secret or not value:
+        return False
+    timestamp, _, digest = value.partition(':')
+    try:
+        age = (time.time() if now is None else now) - int(timestamp)
+    except ValueError:
+        return False
+    if not 0 <= age <= SIGNATURE_MAX_AGE:
+        return False
+    expected = hmac.new(secret.encode(), timestamp.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(digest, expected)
+
+
+def _frame_label(code):
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+class SamplingProfiler:
+    """Statistical profiler over the threads of the requests selected for profiling."""
+
+    def __init__(self, rate=0.0, interval_seconds=0.002, secret=None):
+        self.rate = rate
+        self.interval_seconds = interval_seconds
+        self.secret = secret
+        self.profiled_requests = 0
+        self.samples = 0
+        self._stacks = {}     # tuple of code objects (root first) -> sample count
+        self._active = {}     # thread ident -> number of profiled calls running on it
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._saved_switch_interval = None
+
+    @classmethod
+    def from_env(cls, secret=None):
+        return cls(rate=float(os.environ.get('AQUAWISE_PROFILE_RATE', 0)),
+                   interval_seconds=float(os.environ.get('AQUAWISE_PROFILE_INTERVAL_MS', 2)) / 1000,
+                   secret=os.environ.get('AQUAWISE_PROFILE_SECRET') or secret)
+
+    def wants(self, header_value=None):
+        """Decide whether the current request is profiled."""
+        if header_value and verify(self.secret, header_value):
+            return True
+        return self.rate > 0 and random.random() < self.rate
+
+    def start(self):
+        """Begin sampling the calling thread; pair with stop()."""
+        ident = threading.get_ident()
+        with self._lock:
+            self._active[ident] = self._active.get(ident, 0) + 1
+            self.profiled_requests += 1
+            if self._saved_switch_interval is None:
+                # The sampler needs the GIL to look at a stack. With the default 5 ms switch interval it
+                # mostly gets it where C code releases the GIL, so every sample lands on the same
+                # few lines; a short interval lets it in at ordinary bytecode boundaries.
+                self._saved_switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self._saved_switch_interval, self.interval_seconds / 10))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self):
+        ident = threading.get_ident()
+        with self._lock:
+            remaining = self._active.get(ident, 0) - 1
+            if remaining > 0:
+                self._active[ident] = remaining
+            else:
+                self._active.pop(ident, None)
+                if not self._active:
+                    self._wake.clear()
+                    sys.setswitchinterval(self._saved_switch_interval)
+                    self._saved_switch_interval = None
+
+    def run(self, fn, *args):
+        """Call fn(*args) with the calling thread profiled."""
+        self.start()
+        try:
+            return fn(*args)
+        finally:
+            self.stop()
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval_seconds)
+            with self._lock:
+                idents = [i for i in self._active if i != own]
+            if not idents:
+                continue
+            frames = sys._current_frames()
+            stacks = []
+            for ident in idents:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                if stack:
+                    stacks.append(tuple(reversed(stack)))
+            del frames
+            with self._lock:
+                for stack in stacks:
+                    self._stacks[stack] = self._stacks.get(stack, 0) + 1
+                self.samples += len(stacks)
+
+    def collapsed(self, reset=False):
+        """Aggregated stacks in collapsed flamegraph format, heaviest first."""
+        with self._lock:
+            # A copy: the sampler thread keeps adding to self._stacks once the lock is released
+            stacks = dict(self._stacks)
+            if reset:
+                self._stacks = {}
+        merged = {}
+        for stack, count in stacks.items():
+            line = ';'.join(_frame_label(code) for code in stack)
+            merged[line] = merged.get(line, 0) + count
+        return ''.join(f'{line} {count}\n' for line, count in sorted(merged.items(), key=lambda kv: -kv[1]))
+
+    def status(self):
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'interval_ms': self.interval_seconds * 1000,
+                'signed_header': PROFILE_HEADER if self.secret else None,
+                'profiled_requests': self.profiled_requests,
+                'samples': self.samples,
+                'distinct_stacks': len(self._stacks),
+                'active': sum(self._active.values())
+            }
+
+
+class MemoryTracker:
+    """tracemalloc snapshots; each diff() reports growth since the previous one."""
+
+    def __init__(self, frames=None):
+        self.frames = frames or int(os.environ.get('AQUAWISE_TRACEMALLOC_FRAMES', 5))
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _take(self):
+        # Leave out tracemalloc's and the profiler's own bookkeeping
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ])
+
+    def diff(self, top=20, group='lineno'):
+        """
+        Top `top` allocation sites by growth since the last call. The first call starts
+        tracing (or, if something else already started it, only takes the baseline).
+        """
+        with self._lock:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start(self.frames)
+            if started or self._snapshot is None:
+                # Nothing to compare with yet (also when tracing came from PYTHONTRACEMALLOC or another tool)
+                self._snapshot = self._take()
+                return {'tracing': True, 'started': started, 'stats': []}
+            snapshot = self._take()
+            previous, self._snapshot = self._snapshot, snapshot
+        stats = snapshot.compare_to(previous, group)[:top]
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            'tracing': True,
+            'started': False,
+            'traced_bytes': current,
+            'peak_traced_bytes': peak,
+            'stats': [{
+                'size_diff': s.size_diff,
+                'size': s.size,
+                'count_diff': s.count_diff,
+                'count': s.count,
+                'traceback': [f'{frame.filename}:{frame.lineno}' for frame in s.traceback]
+            } for s in stats]
+        }
+
+    def stop(self):
+        with self._lock:
+            tracemalloc.stop()
+            self._snapshot = None
+        return {'tracing': False}
+
+    def status(self):
+        return {'tracing': tracemalloc.is_tracing(), 'frames': self.frames}
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['sign']:
+        sys.exit('Usage: python profiler.py sign   # print an X-Aquawise-Profile header value')
+    secret = os.environ.get('AQUAWISE_PROFILE_SECRET') or os.environ.get('AQUAWISE_ADMIN_TOKEN')
+    if not secret:
+        sys.exit('Set AQUAWISE_PROFILE_SECRET or AQUAWISE_ADMIN_TOKEN to the server\'s value.')
+    print(f'{PROFILE_HEADER}: {sign(secret)}')
@@ -0,0 +1,187 @@
+"""
+Compact exports of the 'model_advanced' network.
+
+'train_model_advanced.py' writes full float32 weights for every Dense and
+BatchNormalization layer. This export folds BatchNorm into the Dense kernels
+(nn_engine.py's folding) and writes three TF.js layers-model variants, each a
+self-contained model directory with model.json, one weight shard and a copy of
+scalers.json:
+
+    model_advanced/float32/   folded weights, float32
+    model_advanced/float16/   folded weights stored as float16
+    model_advanced/uint8/     folded kernels quantized to uint8 with a per-layer
+                              min/scale (TF.js 'quantization' spec); biases stay float32
+
+Each variant is run on the test split next to the original model. The
+results go into model_advanced/scalers.json under 'quantization': MAE and R²
+against the labels, and how far the variant's predictions are from the
+original's (mean and max |Δ| in L/ha, and relative to the original's mean
+prediction). The model's own error (MAE ≈ 10k L/ha) swamps quantization
+noise, so the server picks a variant on the deviation, not on MAE: it serves
+the smallest variant whose max deviation is within AQUAWISE_NN_MAX_DEVIATION
+(a fraction of the mean prediction, e.g. 0.005 = 0.5%); see
+nn_engine.select_variant.
+
+Usage:
+    python quantize_nn.py   # export the variants of model_advanced/ and record their accuracy
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+from sklearn.metrics import r2_score
+from sklearn.model_selection import train_test_split
+
+from nn_engine import MODEL_DIR, UnsupportedModelError, _build_layers, _layer_configs, _map_weights, load_nn_engine
+
+VARIANTS = ('float32', 'float16', 'uint8')
+SHARD_FILE = 'group1-shard1of1.bin'
+
+# Test split used by train_model_advanced.py
+DATASET_PATH = 'datasets/irrigation_dataset.csv'
+TARGET_COL = 'water_requirement_liters_per_hectare'
+TARGET_SCALE = 20.0
+RANDOM_SEED = 42
+
+
+def folded_topology(topology):
+    """The Keras topology without BatchNormalization and Dropout layers."""
+    topology = json.loads(json.dumps(topology))
+    layers = [layer for layer in _layer_configs(topology)
+              if layer['class_name'] not in ('BatchNormalization', 'Dropout')]
+    config = topology['model_config']['config']
+    if isinstance(config, dict):
+        config['layers'] = layers
+    else:
+        topology['model_config']['config'] = layers
+    topology.pop('training_config', None)  # the folded model is for inference only
+    return topology
+
+
+def encode_weight(name, array, variant):
+    """Return (weight spec, bytes) for one tensor in the given variant."""
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    spec = {'name': name, 'shape': list(array.shape), 'dtype': 'float32'}
+    if variant == 'float16':
+        spec['quantization'] = {'dtype': 'float16'}
+        return spec, array.astype(np.float16).tobytes()
+    if variant == 'uint8' and name.endswith('/kernel'):
+        low, high = float(array.min()), float(array.max())
+        scale = (high - low) / 255 if high > low else 1.0
+        quantized = np.clip(np.round((array - low) / scale), 0, 255).astype(np.uint8)
+        spec['quantization'] = {'dtype': 'uint8', 'min': low, 'scale': scale}
+        return spec, quantized.tobytes()
+    return spec, array.tobytes()
+
+
+def write_variant(out_dir, model_json, layers, scalers, variant):
+    """Write a folded TF.js layers-model for one variant; returns the shard size in bytes."""
+    dense_names = [layer['config']['name'] for layer in _layer_configs(model_json['modelTopology'])
+                   if layer['class_name'] == 'Dense']
+    if len(dense_names) != len(layers) or any(kind != 'dense' for kind, _, _, _ in layers):
+        raise UnsupportedModelError('BatchNormalization could not be folded into a Dense layer')
+
+    specs, chunks = [], []
+    for name, (_, kernel, bias, _) in zip(dense_names, layers):
+        for suffix, array in (('kernel', kernel), ('bias', bias)):
+            spec, data = encode_weight(f'{name}/{suffix}', array, variant)
+            specs.append(spec)
+            chunks.append(data)
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, SHARD_FILE), 'wb') as f:
+        for data in chunks:
+            f.write(data)
+    exported = {
+        'format': model_json.get('format', 'layers-model'),
+        'generatedBy': model_json.get('generatedBy'),
+        'convertedBy': f'quantize_nn.py ({variant}, BatchNorm folded)',
+        'modelTopology': folded_topology(model_json['modelTopology']),
+        'weightsManifest': [{'paths': [SHARD_FILE], 'weights': specs}]
+    }
+    with open(os.path.join(out_dir, 'model.json'), 'w') as f:
+        json.dump(exported, f)
+    with open(os.path.join(out_dir, 'scalers.json'), 'w') as f:
+        json.dump(dict(scalers, variant=variant), f, indent=2)
+    return sum(len(data) for data in chunks)
+
+
+def evaluate(engine, X32, y):
+    """MAE / R² in L/ha of an engine on a scaled float32 feature matrix, plus its predictions."""
+    scaled = engine.forward(X32)[:, 0].astype(np.float64)
+    predictions = scaled * engine._y_scale + engine._y_mean
+    return {'mae': float(np.mean(np.abs(y - predictions))), 'r2': float(r2_score(y, predictions))}, predictions
+
+
+def load_test_split(engine):
+    """Scaled test features and L/ha targets, split exactly like train_model_advanced.py."""
+    from dataset_cache import load_dataset
+    df = load_dataset(DATASET_PATH)
+    y = df[TARGET_COL].to_numpy(dtype=np.float64) * TARGET_SCALE
+    _, test_rows = train_test_split(np.arange(len(df)), test_size=0.2, random_state=RANDOM_SEED, shuffle=True)
+    return engine.transform(df.iloc[test_rows]), y[test_rows]
+
+
+def export_variants(model_dir=MODEL_DIR, X32=None, y=None):
+    """
+    Export every variant of model_dir's network and record its size and test accuracy
+    in model_dir/scalers.json. X32 / y default to the trainer's test split.
+    """
+    with open(os.path.join(model_dir, 'model.json')) as f:
+        model_json = json.load(f)
+    with open(os.path.join(model_dir, 'scalers.json')) as f:
+        scalers = json.load(f)
+    scalers.pop('quantization', None)
+
+    original = load_nn_engine(model_dir, fold_batchnorm=False)
+    if X32 is None:
+        X32, y = load_test_split(original)
+    y = np.asarray(y, dtype=np.float64).ravel()
+    baseline, reference = evaluate(original, X32, y)
+    baseline['prediction_scale'] = float(np.mean(np.abs(reference)))  # what relative deviations are measured against
+    baseline['weight_bytes'] = sum(os.path.getsize(os.path.join(model_dir, p))
+                                   for group in model_json['weightsManifest'] for p in group['paths'])
+    print(f"📏 Original: {baseline['weight_bytes'] / 1024:.0f} KB, "
+          f"MAE {baseline['mae']:.1f} L/ha, R² {baseline['r2']:.4f} on {len(y)} test rows")
+
+    layers = _build_layers(model_json['modelTopology'], _map_weights(model_dir, model_json['weightsManifest']))
+    variants = {}
+    for variant in VARIANTS:
+        out_dir = os.path.join(model_dir, variant)
+        weight_bytes = write_variant(out_dir, model_json, layers, scalers, variant)
+        metrics, predictions = evaluate(load_nn_engine(out_dir), X32, y)
+        deviation = np.abs(predictions - reference)
+        metrics.update(
+            path=variant,
+            weight_bytes=weight_bytes,
+            mae_increase=(metrics['mae'] - baseline['mae']) / baseline['mae'],
+            mean_abs_diff=float(np.mean(deviation)),
+            max_abs_diff=float(np.max(deviation)),
+            mean_relative_diff=float(np.mean(deviation)) / baseline['prediction_scale'],
+            max_relative_diff=float(np.max(deviation)) / baseline['prediction_scale']
+        )
+        variants[variant] = metrics
+        print(f"   {variant:<8} {weight_bytes / 1024:7.0f} KB  MAE {metrics['mae']:9.1f} L/ha "
+              f"({metrics['mae_increase'] * 100:+.3f}%)  R² {metrics['r2']:.4f}  vs original: "
+              f"mean |Δ| {metrics['mean_abs_diff']:.2f}, max |Δ| {metrics['max_abs_diff']:.2f} L/ha "
+              f"({metrics['max_relative_diff'] * 100:.3f}% of the mean prediction)")
+
+    scalers['quantization'] = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'test_rows': len(y),
+        'original': baseline,
+        'variants': variants
+    }
+    # Written to a temporary and renamed, so a reloading server never reads half a file
+    tmp_path = os.path.join(model_dir, 'scalers.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(scalers, f, indent=2)
+    os.replace(tmp_path, os.path.join(model_dir, 'scalers.json'))
+    print(f"✅ Variants written to '{model_dir}/<variant>/'; accuracy recorded in '{model_dir}/scalers.json'")
+    return scalers['quantization']
+
+
+if __name__ == '__main__':
+    export_variants(MODEL_DIR)
@@ -1,4 +1,3 @@
-
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
@@ -6,7 +5,15 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
+from sklearn.metrics import mean_absolute_error
+import argparse
+import os
 import pickle
+import time
+from datetime import datetime, timezone
+from dataset_cache import load_dataset, source_hash
+from forest_engine import ARTIFACT_PREFIX, UnsupportedPipelineError, artifact_version, compile_pipeline, save_engine
+from observation_log import LEDGER_FILE, OBSERVATION_LOG, append_ledger, read_ledger, read_observations
 
 # Configuration
 DATASET_PATH = 'datasets/irrigation_dataset.csv'
@@ -23,67 +30,39 @@ CROP_BASE_WATER = {
     'papaya': 4850
 }
 
-def train():
-    print("="*60)
-    print("🔄 RETRAINING MODEL FOR LOCAL COMPATIBILITY")
-    print("="*60)
+FEATURE_COLS = [
+    'crop_type',
+    'soil_moisture_percent',
+    'temperature_celsius',
+    'humidity_percent',
+    'rainfall_mm',
+    'crop_water_base'
+]
+TARGET_COL = 'water_requirement_liters_per_hectare'
 
-    # 1. Load Data
-    print(f"📂 Loading dataset from {DATASET_PATH}...")
-    try:
-        df = pd.read_csv(DATASET_PATH)
-        # Cleanup: Remove potential duplicate header rows if simple concatenation happened
-        if df.iloc[0]['crop_type'] == 'crop_type':
-            df = df.drop(0).reset_index(drop=True)
-            # Re-infer types
-            cols = ['soil_moisture_percent', 'temperature_celsius', 'humidity_percent', 'rainfall_mm', 'water_requirement_liters_per_hectare']
-            for c in cols:
-                df[c] = pd.to_numeric(df[c])
-            
-        print(f"✅ Loaded {len(df)} samples.")
-        
-        # --- UNIT SCALING FIX ---
-        # The raw CSV values (~1200 L/ha) are much smaller than the frontend Rule-Based formula (~6000 L/ha).
-        # We multiply by 5.5 to align the magnitudes so the "Difference %" in the UI is reasonable.
-        # (Original advanced script used 20.0, but that overshoots the Rule-Based baseline).
-        print("⚖️ Scaling target values by 5.5x to match Rule-Based magnitude...")
-        df['water_requirement_liters_per_hectare'] = df['water_requirement_liters_per_hectare'] * 5.5
-        
-    except Exception as e:
-        print(f"❌ Error loading dataset: {e}")
-        return
+# Incremental mode defaults: trees added per update and the bound on forest size
+NEW_TREES = 20
+MAX_TREES = 100
+HOLDOUT_FRACTION = 0.2
 
-    # 2. Add 'crop_water_base' feature
-    print("➕ Adding 'crop_water_base' feature...")
+def add_crop_water_base(df):
+    """Add the 'crop_water_base' feature, dropping rows whose crop has no base value."""
+    df = df.copy()
     # Clean crop_type whitespace just in case
-    df['crop_type'] = df['crop_type'].str.strip()
+    df['crop_type'] = df['crop_type'].astype(str).str.strip()
     df['crop_water_base'] = df['crop_type'].map(CROP_BASE_WATER)
-    
+
     # Check for unmapped crops
     if df['crop_water_base'].isnull().any():
         print("⚠️ Warning: Some crop types could not be mapped to base water values!")
         print(df[df['crop_water_base'].isnull()]['crop_type'].unique())
         df = df.dropna(subset=['crop_water_base'])
+    return df
 
-    # 3. Define Features and Target
-    # Features must match the order/names in app.py's input_df
-    feature_cols = [
-        'crop_type', 
-        'soil_moisture_percent', 
-        'temperature_celsius', 
-        'humidity_percent', 
-        'rainfall_mm', 
-        'crop_water_base'
-    ]
-    target_col = 'water_requirement_liters_per_hectare'
-
-    X = df[feature_cols]
-    y = df[target_col]
-
-    # 4. Create Pipeline
+def build_pipeline(n_estimators=100):
+    """Preprocessing + Random Forest Pipeline trained by the full retrain."""
     # We use a preset column transformer to handle categorical 'crop_type'
     # app.py sends a DataFrame with mixed types (str and floats), so this Pipeline is ideal.
-    
     preprocessor = ColumnTransformer(
         transformers=[
             ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=False), ['crop_type']),
@@ -91,26 +70,225 @@ def train():
         ]
     )
 
-    model = Pipeline(steps=[
+    return Pipeline(steps=[
         ('preprocessor', preprocessor),
-        ('regressor', RandomForestRegressor(n_estimators=100, random_state=42))
+        ('regressor', RandomForestRegressor(n_estimators=n_estimators, random_state=42))
     ])
 
-    # 5. Train
-    print("🚀 Training Random Forest Regressor...")
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    model.fit(X_train, y_train)
-    
-    score = model.score(X_test, y_test)
-    print(f"✅ Training Complete. R² Score on Test Set: {score:.4f}")
+def load_base_split():
+    """Base dataset (scaled to L/ha) split into the fixed train/test sets used by every mode."""
+    print(f"📂 Loading dataset from {DATASET_PATH}...")
+    # Cleaned, typed and deduplicated once by dataset_cache.py (stray header rows dropped);
+    # later runs memory-map the cached columns instead of re-parsing the CSV
+    df = load_dataset(DATASET_PATH)
+    print(f"✅ Loaded {len(df)} samples.")
+
+    # --- UNIT SCALING FIX ---
+    # The raw CSV values (~1200 L/ha) are much smaller than the frontend Rule-Based formula (~6000 L/ha).
+    # We multiply by 5.5 to align the magnitudes so the "Difference %" in the UI is reasonable.
+    # (Original advanced script used 20.0, but that overshoots the Rule-Based baseline).
+    # Rows in the observation log are already in served L/ha and are not scaled.
+    print("⚖️ Scaling target values by 5.5x to match Rule-Based magnitude...")
+    df[TARGET_COL] = df[TARGET_COL] * 5.5
+
+    print("➕ Adding 'crop_water_base' feature...")
+    df = add_crop_water_base(df)
+    return train_test_split(df[FEATURE_COLS], df[TARGET_COL], test_size=0.2, random_state=42)
+
+def load_model():
+    with open(MODEL_FILE, 'rb') as f:
+        return pickle.load(f)
 
-    # 6. Save
+def save_model(model):
+    """Save the pickle and its memory-mapped copy; returns the new model version."""
     print(f"💾 Saving model to '{MODEL_FILE}'...")
     with open(MODEL_FILE, 'wb') as f:
         pickle.dump(model, f)
-    
     print("✅ Model saved successfully!")
-    print("\n👉 ACTION REQUIRED: Please Restart your 'run_backend.bat' server now.")
+
+    # Export the memory-mappable copy that app.py serves (shared across gunicorn workers)
+    version = artifact_version(MODEL_FILE)
+    try:
+        engine = compile_pipeline(model)
+    except UnsupportedPipelineError as e:
+        # e.g. a boosted model from compact_model.py: served from the pickle, so drop the stale copy
+        print(f"⚠️  No memory-mapped copy for this model ({e}); it will be served from the pickle.")
+        for path in (ARTIFACT_PREFIX + '.json', ARTIFACT_PREFIX + '.bin'):
+            if os.path.exists(path):
+                os.remove(path)
+        return version
+    print(f"💾 Writing memory-mapped model to '{ARTIFACT_PREFIX}.bin' + '.json'...")
+    manifest = save_engine(engine, ARTIFACT_PREFIX, source_version=version)
+    print(f"✅ Memory-mapped model saved ({manifest['data_size'] / 1e6:.1f} MB)")
+    return version
+
+def print_reload_hint():
+    print("\n👉 A running server picks up the new model without a restart when AQUAWISE_MODEL_WATCH_SECONDS is set,")
+    print("   or on POST /admin/models/forest/reload. Otherwise restart your 'run_backend.bat' server now.")
+
+def train():
+    print("="*60)
+    print("🔄 RETRAINING MODEL FOR LOCAL COMPATIBILITY")
+    print("="*60)
+    started = time.perf_counter()
+
+    # 1. Load Data
+    try:
+        X_train, X_test, y_train, y_test = load_base_split()
+    except Exception as e:
+        print(f"❌ Error loading dataset: {e}")
+        return
+
+    # Every labeled row logged so far joins the training set; the ledger records how far we read
+    observations, log_offset, log_rows = read_observations(OBSERVATION_LOG)
+    if len(observations):
+        observations = add_crop_water_base(observations)
+        print(f"➕ Adding {len(observations)} logged observations from '{OBSERVATION_LOG}'...")
+        X_train = pd.concat([X_train, observations[FEATURE_COLS]], ignore_index=True)
+        y_train = pd.concat([y_train, observations[TARGET_COL]], ignore_index=True)
+
+    # 2. Create Pipeline
+    model = build_pipeline()
+
+    # 3. Train
+    print("🚀 Training Random Forest Regressor...")
+    model.fit(X_train, y_train)
+
+    score = model.score(X_test, y_test)
+    print(f"✅ Training Complete. R² Score on Test Set: {score:.4f}")
+
+    # 4. Save, then record what this version has seen
+    version = save_model(model)
+    append_ledger({
+        'version': version,
+        'parent': None,
+        'mode': 'full',
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'trees': len(model.named_steps['regressor'].estimators_),
+        'dataset_sha256': source_hash(DATASET_PATH),
+        'observations_offset': log_offset,
+        'observations_rows': log_rows,
+        'train_rows': len(X_train),
+        'base_holdout_mae': float(mean_absolute_error(y_test, model.predict(X_test))),
+        'seconds': round(time.perf_counter() - started, 2)
+    })
+    print(f"🧾 Recorded version {version} in '{LEDGER_FILE}'")
+    print_reload_hint()
+
+def train_incremental(new_trees=NEW_TREES, max_trees=MAX_TREES, holdout_fraction=HOLDOUT_FRACTION):
+    """
+    Grow the saved forest with `new_trees` trees fit only on the observations
+    appended since the current version was trained, then retire the oldest
+    trees so at most `max_trees` remain. Cost scales with the new rows, not the
+    whole history.
+    """
+    print("="*60)
+    print("🔁 INCREMENTAL UPDATE FROM NEW OBSERVATIONS")
+    print("="*60)
+    started = time.perf_counter()
+
+    # 1. The ledger must describe the model on disk, otherwise we don't know what it has seen
+    ledger = read_ledger(LEDGER_FILE)
+    try:
+        current_version = artifact_version(MODEL_FILE)
+    except OSError:
+        print(f"❌ '{MODEL_FILE}' not found. Run a full retrain first.")
+        return
+    parent = next((e for e in reversed(ledger) if e['version'] == current_version), None)
+    if parent is None:
+        print(f"❌ Model version {current_version} has no entry in '{LEDGER_FILE}'.")
+        print("   Run a full retrain (python retrain_model.py) to start the ledger.")
+        return
+
+    # 2. Rows appended after the parent's offset
+    observations, log_offset, log_rows = read_observations(OBSERVATION_LOG, parent['observations_offset'])
+    if log_rows == 0:
+        print(f"✅ No new observations since version {current_version}; nothing to do.")
+        return
+    observations = add_crop_water_base(observations)
+    holdout_rows = int(round(len(observations) * holdout_fraction)) if len(observations) > 1 else 0
+    if len(observations) - holdout_rows < 1:
+        print(f"❌ {log_rows} new rows but none usable for training.")
+        return
+    if holdout_rows:
+        new_train, new_test = train_test_split(observations, test_size=holdout_rows, random_state=42)
+    else:
+        new_train, new_test = observations, observations.iloc[:0]
+    print(f"📥 {log_rows} new rows since version {current_version}: "
+          f"{len(new_train)} to train on, {len(new_test)} held out")
+
+    model = load_model()
+    if not isinstance(model.named_steps['regressor'], RandomForestRegressor):
+        print(f"❌ Version {current_version} is a {type(model.named_steps['regressor']).__name__} "
+              "(a compact_model.py candidate); incremental updates need a forest. Run a full retrain.")
+        return
+    _, X_base_test, _, y_base_test = load_base_split()
+    old_model = load_model()
+
+    # 3. Warm start: keep the fitted trees, fit only the added ones on the new rows.
+    #    The fitted preprocessor is reused as is, so the feature layout never changes.
+    print(f"🌲 Adding {new_trees} trees...")
+    regressor = model.named_steps['regressor']
+    X_new = model.named_steps['preprocessor'].transform(new_train[FEATURE_COLS])
+    n_before = len(regressor.estimators_)
+    regressor.set_params(warm_start=True, n_estimators=n_before + new_trees)
+    regressor.fit(X_new, new_train[TARGET_COL])
+
+    # 4. Retire the oldest trees to keep the forest size bounded
+    retired = max(0, len(regressor.estimators_) - max_trees)
+    if retired:
+        regressor.estimators_ = regressor.estimators_[retired:]
+        print(f"🪓 Retired the {retired} oldest trees")
+    regressor.set_params(warm_start=False, n_estimators=len(regressor.estimators_))
+
+    # 5. Drift report: old vs updated model on the base holdout and on the held-out new rows
+    drift = {'base_holdout_rows': len(X_base_test), 'new_holdout_rows': len(new_test)}
+    print("\n📊 Holdout MAE (L/ha)        old model    updated")
+    for name, X_eval, y_eval in (('base', X_base_test, y_base_test),
+                                 ('new', new_test[FEATURE_COLS], new_test[TARGET_COL])):
+        if not len(X_eval):
+            continue
+        before = float(mean_absolute_error(y_eval, old_model.predict(X_eval)))
+        after = float(mean_absolute_error(y_eval, model.predict(X_eval)))
+        drift[f'{name}_holdout_mae_before'] = before
+        drift[f'{name}_holdout_mae_after'] = after
+        print(f"   {name + ' holdout':<22} {before:12.2f} {after:10.2f}")
+    if 'new_holdout_mae_before' in drift:
+        # How much worse the old model does on new data than on the data it was built for
+        drift['new_vs_base_mae_ratio'] = drift['new_holdout_mae_before'] / max(drift['base_holdout_mae_before'], 1e-9)
+        print(f"   Old model MAE on new rows is {drift['new_vs_base_mae_ratio']:.2f}x its base holdout MAE")
+
+    # 6. Save, then record the new version and what it has seen
+    print()
+    version = save_model(model)
+    seconds = time.perf_counter() - started
+    append_ledger({
+        'version': version,
+        'parent': current_version,
+        'mode': 'incremental',
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'trees': len(regressor.estimators_),
+        'trees_added': new_trees,
+        'trees_retired': retired,
+        'dataset_sha256': parent.get('dataset_sha256'),
+        'observations_offset': log_offset,
+        'observations_rows': parent['observations_rows'] + log_rows,
+        'train_rows': len(new_train),
+        'drift': drift,
+        'seconds': round(seconds, 2)
+    })
+    print(f"🧾 Recorded version {version} (parent {current_version}) in '{LEDGER_FILE}' [{seconds:.1f}s]")
+    print_reload_hint()
 
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser(description="Retrain the Random Forest model.")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"add trees fit on rows appended to '{OBSERVATION_LOG}' instead of retraining")
+    parser.add_argument('--new-trees', type=int, default=NEW_TREES)
+    parser.add_argument('--max-trees', type=int, default=MAX_TREES)
+    parser.add_argument('--holdout-fraction', type=float, default=HOLDOUT_FRACTION)
+    args = parser.parse_args()
+    if args.incremental:
+        train_incremental(args.new_trees, args.max_trees, args.holdout_fraction)
+    else:
+        train()
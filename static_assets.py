@@ -0,0 +1,298 @@
+"""
+Fingerprinted, precompressed static files and cached HTML pages.
+
+Build step (run after changing anything in assets/, css/ or js/):
+
+    python static_assets.py
+
+writes static_build/ with a content-hash fingerprinted copy of every file
+(e.g. assets/professional-ui.3f2a9c1b0d4e.css), its gzip/brotli variants when
+they are meaningfully smaller, and manifest.json. At runtime 'app.py' uses
+StaticAssets to:
+
+    * pick the best precompressed variant for the request's Accept-Encoding
+    * send a strong ETag per representation and answer If-None-Match with 304
+    * mark fingerprinted URLs as immutable for a year; plain URLs revalidate
+    * serve the HTML pages from memory, with their asset links rewritten to
+      the fingerprinted URLs (so browsers never use a stale stylesheet)
+
+Without a build the files are still served with ETags and 304s, just
+uncompressed. Brotli needs the optional 'brotli' package; without it only
+gzip variants are written.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Response
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIRS = ('assets', 'css', 'js')
+BUILD_DIR = 'static_build'
+MANIFEST_FILE = 'manifest.json'
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Already-compressed formats (PNG, fonts, ...) gain nothing from gzip/brotli
+COMPRESSIBLE = {'.css', '.js', '.html', '.json', '.svg', '.txt', '.map', '.csv'}
+# Keep a compressed variant only if it is at most this fraction of the original
+MAX_RATIO = 0.9
+
+# Preference order when the client accepts several encodings
+ENCODINGS = ('br', 'gzip')
+VARIANT_SUFFIX = {'br': '.br', 'gzip': '.gz'}
+
+# assets/x.css, css/x.css or js/x.js inside href/src/url(), with an optional ?v=N cache buster
+ASSET_LINK = re.compile(r"""(?<=["'(])((?:assets|css|js)/[\w./-]+?)(\?v=[\w.]*)?(?=["')])""")
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def fingerprint_name(path, digest):
+    root, ext = os.path.splitext(path)
+    return f'{root}.{digest}{ext}'
+
+
+def compress(data, ext):
+    """Return {encoding: bytes} for the variants worth keeping."""
+    if ext.lower() not in COMPRESSIBLE or not data:
+        return {}
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {enc: body for enc, body in variants.items() if len(body) <= len(data) * MAX_RATIO}
+
+
+def _iter_static_files(root):
+    for directory in STATIC_DIRS:
+        base = os.path.join(root, directory)
+        for dirpath, _, filenames in os.walk(base):
+            for name in sorted(filenames):
+                full = os.path.join(dirpath, name)
+                yield os.path.relpath(full, root).replace(os.sep, '/'), full
+
+
+def build(root='.', out_dir=BUILD_DIR):
+    """Write fingerprinted files, compressed variants and the manifest; returns the manifest."""
+    out_root = os.path.join(root, out_dir)
+    manifest = {}
+    for path, full in _iter_static_files(root):
+        with open(full, 'rb') as f:
+            data = f.read()
+        digest = content_hash(data)
+        fingerprinted = fingerprint_name(path, digest)
+        target = os.path.join(out_root, fingerprinted)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+
+        variants = {}
+        for encoding, body in compress(data, os.path.splitext(path)[1]).items():
+            with open(target + VARIANT_SUFFIX[encoding], 'wb') as f:
+                f.write(body)
+            variants[encoding] = {'file': fingerprinted + VARIANT_SUFFIX[encoding], 'size': len(body)}
+
+        manifest[path] = {'hash': digest, 'fingerprinted': fingerprinted, 'size': len(data), 'variants': variants}
+
+    tmp = os.path.join(out_root, MANIFEST_FILE + '.tmp')
+    os.makedirs(out_root, exist_ok=True)
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(out_root, MANIFEST_FILE))
+    return manifest
+
+
+def accepted_encodings(header):
+    """Parse Accept-Encoding into {coding: q}."""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def negotiate(header, available):
+    """Best encoding from `available` allowed by the Accept-Encoding header, or None for identity."""
+    accepted = accepted_encodings(header)
+    for encoding in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match uses the weak comparison: W/"x" matches "x"."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or any(t.removeprefix('W/') == etag for t in tags)
+
+
+class _Entry:
+    """One static file: its identity bytes on disk plus any precompressed variants."""
+
+    __slots__ = ('path', 'source', 'signature', 'digest', 'fingerprinted', 'content_type', 'variants')
+
+    def __init__(self, path, source, signature, digest, fingerprinted, variants):
+        self.path = path
+        self.source = source
+        self.signature = signature
+        self.digest = digest
+        self.fingerprinted = fingerprinted
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.variants = variants  # {encoding: file path}
+
+
+class StaticAssets:
+    """Serves assets/, css/, js/ and the HTML pages with fingerprints, compression and validators."""
+
+    def __init__(self, root='.', build_dir=BUILD_DIR):
+        self.root = os.path.abspath(root)
+        self.build_root = os.path.join(self.root, build_dir)
+        self._manifest = self._load_manifest()
+        self._entries = {}         # logical path -> _Entry
+        self._fingerprinted = {}   # fingerprinted path -> logical path
+        self._pages = {}           # html name -> (signature, {asset: fingerprinted url}, etag digest, {encoding or None: bytes})
+        self._lock = threading.Lock()
+        for path, _ in _iter_static_files(self.root):
+            self._index(path)
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.build_root, MANIFEST_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _signature(full):
+        st = os.stat(full)
+        return st.st_mtime_ns, st.st_size
+
+    def _index(self, path):
+        """(Re)hash one file; uses the build's variants only if they were built from these bytes."""
+        full = os.path.join(self.root, path)
+        signature = self._signature(full)
+        with open(full, 'rb') as f:
+            digest = content_hash(f.read())
+        fingerprinted = fingerprint_name(path, digest)
+        variants = {}
+        built = self._manifest.get(path)
+        if built and built['hash'] == digest:
+            variants = {enc: os.path.join(self.build_root, v['file']) for enc, v in built['variants'].items()}
+
+        entry = _Entry(path, full, signature, digest, fingerprinted, variants)
+        with self._lock:
+            self._entries[path] = entry
+            self._fingerprinted[fingerprinted] = path
+        return entry
+
+    def _lookup(self, directory, filename):
+        """Entry for a logical or fingerprinted file, re-indexed if it changed on disk."""
+        # Join inside the directory so '../' can never leave it
+        if directory not in STATIC_DIRS or safe_join(os.path.join(self.root, directory), filename) is None:
+            return None, False
+        path = f'{directory}/{filename}'
+        logical = self._fingerprinted.get(path, path)
+        full = os.path.join(self.root, logical)
+        if not os.path.isfile(full):
+            return None, False
+        entry = self._entries.get(logical)
+        if entry is None or entry.signature != self._signature(full):
+            entry = self._index(logical)
+        return entry, path == entry.fingerprinted
+
+    def url_for(self, path):
+        """Fingerprinted path for a logical one (unchanged if the file is unknown)."""
+        directory, _, filename = path.partition('/')
+        entry, _ = self._lookup(directory, filename)
+        return entry.fingerprinted if entry else path
+
+    def _respond(self, request, digest, body_for, available, content_type, cache_control):
+        encoding = negotiate(request.headers.get('Accept-Encoding'), available)
+        etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+        headers = {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return Response(status=304, headers=headers)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return Response(body_for(encoding), status=200, headers=headers, content_type=content_type)
+
+    def serve(self, request, directory, filename):
+        """Response for /<directory>/<filename>, or None if there is no such file."""
+        entry, fingerprinted = self._lookup(directory, filename)
+        if entry is None:
+            return None
+
+        def body_for(encoding):
+            with open(entry.variants[encoding] if encoding else entry.source, 'rb') as f:
+                return f.read()
+
+        return self._respond(request, entry.digest, body_for, entry.variants, entry.content_type,
+                             IMMUTABLE if fingerprinted else REVALIDATE)
+
+    def _load_page(self, name, full, signature):
+        with open(full, 'rb') as f:
+            html = f.read().decode('utf-8')
+        # Point asset links at their fingerprinted URLs; the ?v=N cache busters become redundant
+        links = {}
+
+        def fingerprint(match):
+            links[match.group(1)] = self.url_for(match.group(1))
+            return links[match.group(1)]
+
+        html = ASSET_LINK.sub(fingerprint, html)
+        data = html.encode('utf-8')
+        bodies = {None: data, **compress(data, '.html')}
+        page = (signature, links, content_hash(data), bodies)
+        with self._lock:
+            self._pages[name] = page
+        return page
+
+    def page(self, request, name):
+        """Response for an HTML page served from memory (rebuilt if the file or an asset it links to changes)."""
+        full = safe_join(self.root, name)
+        if full is None or not os.path.isfile(full):
+            return None
+        signature = self._signature(full)
+        page = self._pages.get(name)
+        # url_for re-hashes an asset whose file changed, so a new fingerprint shows up here
+        if (page is None or page[0] != signature
+                or any(self.url_for(path) != url for path, url in page[1].items())):
+            page = self._load_page(name, full, signature)
+        _, _, digest, bodies = page
+        available = {enc for enc in bodies if enc}
+        return self._respond(request, digest, bodies.get, available, 'text/html; charset=utf-8', REVALIDATE)
+
+
+if __name__ == '__main__':
+    manifest = build()
+    original = sum(e['size'] for e in manifest.values())
+    best = sum(min([e['size']] + [v['size'] for v in e['variants'].values()]) for e in manifest.values())
+    compressed = sum(1 for e in manifest.values() if e['variants'])
+    print(f"✅ Built {len(manifest)} static files into '{BUILD_DIR}/' ({compressed} with compressed variants)")
+    print(f"   Smallest representations: {best / 1024:.0f} KB of {original / 1024:.0f} KB"
+          f"{'' if brotli else ' (install brotli for .br variants)'}")
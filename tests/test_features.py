@@ -0,0 +1,80 @@
+"""FeatureTransform (features.py) against the pandas feature code the NN was trained with."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.features import legacy_serving_matrix, legacy_training_matrix, random_readings
+from features import FeatureTransform
+from nn_engine import MODEL_DIR
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def scalers():
+    with open(os.path.join(ROOT, MODEL_DIR, 'scalers.json')) as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='module')
+def transform(scalers):
+    return FeatureTransform.from_scalers(scalers)
+
+
+def readings_with_edge_cases():
+    df = random_readings(500, seed=1)
+    df.loc[0, 'rainfall_mm'] = 0.0            # humidity_rainfall_ratio divides by epsilon
+    df.loc[1, 'humidity_percent'] = 0.0
+    df.loc[2, 'temperature_celsius'] = np.nan
+    df.loc[3, ['soil_moisture_percent', 'rainfall_mm']] = np.nan
+    return df
+
+
+def test_raw_features_match_training_code(scalers, transform):
+    df = readings_with_edge_cases()
+    expected = legacy_training_matrix(df, scalers['feature_columns'], scalers['crop_classes']).astype(np.float32)
+    actual = transform.transform(df, standardize=False)
+    np.testing.assert_array_equal(actual, expected)  # NaNs must sit in the same cells
+
+
+def test_standardized_features_match_serving_code(scalers, transform):
+    df = readings_with_edge_cases()
+    expected = legacy_serving_matrix(df, scalers['feature_columns'], scalers['crop_classes'],
+                                     np.asarray(scalers['scaler_X_mean']), np.asarray(scalers['scaler_X_scale']))
+    np.testing.assert_array_equal(transform.transform(df), expected)
+    assert np.isnan(expected[2:4]).any() and not np.isnan(expected[4:]).any()
+
+
+def test_categorical_crop_column_matches_object_column(transform):
+    df = readings_with_edge_cases()
+    categorical = df.assign(crop_type=df['crop_type'].astype('category'))
+    np.testing.assert_array_equal(transform.transform(categorical), transform.transform(df))
+
+
+@pytest.mark.parametrize('crop', ['quinoa', None, np.nan])
+def test_unknown_crops_are_rejected(transform, crop):
+    df = random_readings(4)
+    df['crop_type'] = df['crop_type'].astype(object)
+    df.loc[2, 'crop_type'] = crop
+    with pytest.raises(ValueError, match='Unknown crop_type'):
+        transform.transform(df)
+    with pytest.raises(ValueError, match='Unknown crop_type'):
+        transform.transform(df.assign(crop_type=df['crop_type'].astype('category')))
+
+
+def test_out_buffer_is_filled_in_place(transform):
+    df = random_readings(16)
+    out = np.empty((16, len(transform.feature_columns)), dtype=np.float32)
+    assert transform.transform(df, out=out) is out
+    np.testing.assert_array_equal(out, transform.transform(df))
+    with pytest.raises(ValueError):
+        transform.transform(df, out=np.empty((16, 3), dtype=np.float32))
+
+
+def test_mapping_input_matches_dataframe(transform):
+    df = random_readings(8)
+    mapping = {column: df[column].tolist() for column in df.columns}
+    np.testing.assert_array_equal(transform.transform(mapping), transform.transform(df))
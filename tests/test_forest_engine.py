@@ -0,0 +1,96 @@
+"""The compiled ForestEngine (forest_engine.py) against the fitted sklearn Pipeline it was compiled from."""
+
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from benchmarks.features import random_readings
+from forest_engine import compile_pipeline, load_engine, save_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_FILE = os.path.join(ROOT, 'optimized_irrigation_model.pkl')
+NUMERIC = ['soil_moisture_percent', 'temperature_celsius', 'humidity_percent', 'rainfall_mm', 'crop_water_base']
+CROP_WATER_BASE = {'rice': 6500, 'maize': 5000, 'pomegranate': 4400, 'banana': 5100,
+                   'mango': 4600, 'watermelon': 4700, 'papaya': 4850}
+
+
+def readings(n, seed=0):
+    """Model inputs with unknown and missing crops and missing numeric values mixed in."""
+    df = random_readings(n, seed)
+    df['crop_type'] = df['crop_type'].astype(object)
+    df['crop_water_base'] = df['crop_type'].map(CROP_WATER_BASE).astype(float)
+    df.loc[0, 'crop_type'] = 'quinoa'   # not seen in training: all one-hot columns 0
+    df.loc[1, 'crop_type'] = None
+    df.loc[2, 'crop_type'] = np.nan
+    df.loc[3, 'temperature_celsius'] = np.nan
+    df.loc[4, ['soil_moisture_percent', 'rainfall_mm']] = np.nan
+    return df
+
+
+def fitted_pipeline(scale_numeric):
+    """A small Pipeline shaped like retrain_model.py's, trained with some missing values."""
+    X = readings(400, seed=7).iloc[3:]  # unknown and missing crops are only ever seen at predict time
+    y = X['crop_water_base'] * (1.5 - X['soil_moisture_percent'].fillna(50) / 100)
+    numeric = StandardScaler() if scale_numeric else 'passthrough'
+    pipeline = Pipeline([
+        ('preprocessor', ColumnTransformer([
+            ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=False), ['crop_type']),
+            ('num', numeric, NUMERIC)
+        ])),
+        ('regressor', RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0))
+    ])
+    return pipeline.fit(X, y)
+
+
+def shipped_pipeline():
+    if not os.path.exists(MODEL_FILE):
+        pytest.skip(f'{os.path.basename(MODEL_FILE)} not built (run retrain_model.py)')
+    with open(MODEL_FILE, 'rb') as f:
+        return pickle.load(f)
+
+
+@pytest.fixture(scope='module', params=['passthrough', 'scaled', 'shipped'])
+def pipeline(request):
+    if request.param == 'shipped':
+        return shipped_pipeline()
+    return fitted_pipeline(scale_numeric=request.param == 'scaled')
+
+
+@pytest.fixture(scope='module')
+def engine(pipeline):
+    return compile_pipeline(pipeline)
+
+
+def test_transform_matches_column_transformer(pipeline, engine):
+    X = readings(300)
+    expected = pipeline.named_steps['preprocessor'].transform(X[engine.input_names]).astype(np.float32)
+    actual = engine.transform(X)
+    np.testing.assert_array_equal(actual, expected)
+    onehot = actual[:, :len(engine.categories) - len(NUMERIC)]
+    assert not onehot[:3].any()                  # unknown and missing crops
+    assert np.isnan(actual[3:5]).any()
+
+
+def test_predictions_match_pipeline(pipeline, engine):
+    X = readings(300)[engine.input_names]
+    np.testing.assert_array_equal(engine.predict(X), pipeline.predict(X))
+
+
+def test_saved_engine_matches_pipeline(pipeline, engine, tmp_path):
+    prefix = str(tmp_path / 'model.forest')
+    save_engine(engine, prefix)
+    X = readings(300, seed=3)[engine.input_names]
+    np.testing.assert_array_equal(load_engine(prefix).predict(X), pipeline.predict(X))
+
+
+def test_single_row_matches_pipeline(pipeline, engine):
+    X = pd.DataFrame([{'crop_type': 'maize', 'soil_moisture_percent': 42.0, 'temperature_celsius': 31.5,
+                       'humidity_percent': 55.0, 'rainfall_mm': 12.0, 'crop_water_base': 5000.0}])
+    np.testing.assert_array_equal(engine.predict(X), pipeline.predict(X))
@@ -0,0 +1,168 @@
+"""MailQueue (mail_queue.py) delivering to a local aiosmtpd server: delivery, retries and permanent failures."""
+
+import smtplib
+import socket
+import time
+from email.message import EmailMessage
+
+import pytest
+
+pytest.importorskip('aiosmtpd')
+from aiosmtpd.controller import Controller
+
+from benchmarks.smtp_sink import SinkHandler
+from mail_queue import CONNECTS, MESSAGES, RETRIES, MailQueue, _is_permanent
+
+
+class ScriptedHandler:
+    """Answers RCPT and DATA with the scripted replies first, then accepts everything."""
+
+    def __init__(self, rcpt=(), data=()):
+        self.rcpt_replies = list(rcpt)
+        self.data_replies = list(data)
+        self.rcpt_calls = 0
+        self.data_calls = 0
+        self.recipients = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        self.rcpt_calls += 1
+        if self.rcpt_replies:
+            return self.rcpt_replies.pop(0)
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.data_calls += 1
+        if self.data_replies:
+            return self.data_replies.pop(0)
+        self.recipients.extend(envelope.rcpt_tos)
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    """Start an aiosmtpd server for a handler; returns a MailQueue factory connected to it."""
+    controllers = []
+
+    def start(handler, **options):
+        port = free_port()
+        controller = Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        controllers.append(controller)
+        options = {'connections': 1, 'max_attempts': 3, 'backoff_seconds': 0.01, **options}
+        return MailQueue(lambda: smtplib.SMTP('127.0.0.1', port, timeout=5), **options)
+
+    yield start
+    for controller in controllers:
+        controller.stop()
+
+
+class Outcomes:
+    """Changes in the mail_queue counters since creation (they are process-wide)."""
+
+    def __init__(self):
+        self._start = self._read()
+
+    @staticmethod
+    def _read():
+        return {'sent': MESSAGES.value(outcome='sent'), 'failed': MESSAGES.value(outcome='failed'),
+                'expired': MESSAGES.value(outcome='expired'), 'retries': RETRIES.value(),
+                'connects': CONNECTS.value()}
+
+    def __getitem__(self, name):
+        return self._read()[name] - self._start[name]
+
+    def wait(self, done, timeout=10.0):
+        """Wait until `done` messages were sent, failed or expired."""
+        deadline = time.monotonic() + timeout
+        while self['sent'] + self['failed'] + self['expired'] < done:
+            assert time.monotonic() < deadline, f'only {self._read()} after {timeout} s'
+            time.sleep(0.01)
+
+
+def message(to='farmer@example.com'):
+    msg = EmailMessage()
+    msg.set_content('Your AquaWise Verification Code is: 123456')
+    msg['Subject'] = 'AquaWise Password Reset Code'
+    msg['From'] = 'aquawise@example.com'
+    msg['To'] = to
+    return msg
+
+
+def test_delivers_over_reused_connections(smtp_server):
+    handler = SinkHandler(drop_every=4)  # also hangs up after every 4th message
+    mail_queue = smtp_server(handler, connections=2)
+    outcomes = Outcomes()
+    addresses = [f'user{i}@example.com' for i in range(12)]
+    for address in addresses:
+        assert mail_queue.submit(message(address))
+    outcomes.wait(len(addresses))
+    assert outcomes['sent'] == len(addresses) and outcomes['failed'] == 0
+    assert sorted(handler.recipients) == sorted(addresses)  # each exactly once
+    assert handler.dropped == 3
+    assert 2 <= outcomes['connects'] < len(addresses)
+
+
+def test_transient_data_failure_is_retried(smtp_server):
+    handler = ScriptedHandler(data=['451 Temporary failure, try again later'] * 2)
+    mail_queue = smtp_server(handler)
+    outcomes = Outcomes()
+    mail_queue.submit(message())
+    outcomes.wait(1)
+    assert outcomes['sent'] == 1 and outcomes['retries'] == 2
+    assert handler.data_calls == 3 and handler.recipients == ['farmer@example.com']
+
+
+def test_transient_recipient_refusal_is_retried(smtp_server):
+    handler = ScriptedHandler(rcpt=['450 Mailbox busy, try again later'])
+    mail_queue = smtp_server(handler)
+    outcomes = Outcomes()
+    mail_queue.submit(message())
+    outcomes.wait(1)
+    assert outcomes['sent'] == 1 and outcomes['retries'] == 1
+    assert handler.rcpt_calls == 2 and handler.recipients == ['farmer@example.com']
+
+
+@pytest.mark.parametrize('script', [{'rcpt': ['550 No such user']}, {'data': ['554 Message rejected']}])
+def test_permanent_failure_is_not_retried(smtp_server, script):
+    handler = ScriptedHandler(**script)
+    mail_queue = smtp_server(handler)
+    outcomes = Outcomes()
+    mail_queue.submit(message())
+    outcomes.wait(1)
+    assert outcomes['failed'] == 1 and outcomes['retries'] == 0
+    assert handler.rcpt_calls == 1 and handler.recipients == []
+
+
+def test_gives_up_after_max_attempts(smtp_server):
+    handler = ScriptedHandler(data=['451 Temporary failure, try again later'] * 10)
+    mail_queue = smtp_server(handler, max_attempts=3)
+    outcomes = Outcomes()
+    mail_queue.submit(message())
+    outcomes.wait(1)
+    assert outcomes['failed'] == 1 and outcomes['retries'] == 2 and handler.data_calls == 3
+
+
+def test_expired_message_is_dropped(smtp_server):
+    handler = ScriptedHandler()
+    mail_queue = smtp_server(handler)
+    outcomes = Outcomes()
+    mail_queue.submit(message(), deadline=time.time() - 1)
+    outcomes.wait(1)
+    assert outcomes['expired'] == 1 and handler.rcpt_calls == 0
+
+
+def test_recipients_refused_is_permanent_only_if_every_code_is_5xx():
+    refused = smtplib.SMTPRecipientsRefused
+    assert _is_permanent(refused({'a@example.com': (550, b'No such user')}))
+    assert not _is_permanent(refused({'a@example.com': (450, b'Mailbox busy')}))
+    assert not _is_permanent(refused({'a@example.com': (550, b'No such user'), 'b@example.com': (451, b'Later')}))
+    assert _is_permanent(smtplib.SMTPDataError(554, b'Rejected'))
+    assert not _is_permanent(smtplib.SMTPDataError(451, b'Later'))
+    assert not _is_permanent(smtplib.SMTPServerDisconnected('Connection unexpectedly closed'))
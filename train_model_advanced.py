@@ -5,7 +5,6 @@ This script engineers 10 new features and trains a more complex model.
 It must be paired with 'predict_advanced.html'.
 """
 
-import pandas as pd
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
@@ -16,6 +15,9 @@ import tensorflowjs as tfjs
 import json
 import os
 import sys
+from dataset_cache import load_dataset
+from features import FEATURE_COLUMNS, FeatureTransform
+from quantize_nn import export_variants
 
 # Suppress TensorFlow warnings
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
@@ -32,7 +34,8 @@ RANDOM_SEED = 42
 # --- Step 1: Load Dataset ---
 print("\n📂 Step 1: Loading dataset...")
 try:
-    df = pd.read_csv(DATASET_PATH)
+    # Typed columnar cache (dataset_cache.py): parsed once, memory-mapped on later runs
+    df = load_dataset(DATASET_PATH)
     print(f"   ✅ Dataset loaded successfully")
     
     # 🌟 CRITICAL FIX: UNIT SCALING 🌟
@@ -49,67 +52,20 @@ except FileNotFoundError:
 # --- Step 2: Preprocessing (Encoding) ---
 print("\n🔧 Step 2: Preprocessing data...")
 label_encoder = LabelEncoder()
-df['crop_encoded'] = label_encoder.fit_transform(df['crop_type'])
+label_encoder.fit(df['crop_type'])  # crop_encoded itself is written by the feature transform
 crop_classes = label_encoder.classes_.tolist()
 print(f"   ✅ Crop types encoded: {len(crop_classes)} types")
 
 # --- Step 3: Advanced Feature Engineering ---
 print("\n🧠 Step 3: Engineering advanced features...")
 
-def create_features(data):
-    # Use a small epsilon to avoid division by zero
-    epsilon = 1e-6
-    
-    # Create a copy to avoid changing the original dataframe
-    df_feat = data.copy()
-    
-    # 1. Climate Ratios
-    df_feat['temp_humidity_ratio'] = df_feat['temperature_celsius'] / (df_feat['humidity_percent'] + epsilon)
-    df_feat['humidity_rainfall_ratio'] = df_feat['humidity_percent'] / (df_feat['rainfall_mm'] + epsilon)
-
-    # 2. Interactions
-    df_feat['temp_moisture_interaction'] = df_feat['temperature_celsius'] * df_feat['soil_moisture_percent']
-    df_feat['moisture_humidity_product'] = df_feat['soil_moisture_percent'] * df_feat['humidity_percent']
-    df_feat['moisture_rainfall_product'] = df_feat['soil_moisture_percent'] * df_feat['rainfall_mm']
-
-    # 3. Water Source / Stress Indicators
-    df_feat['water_saturation_deficit'] = (100 - df_feat['humidity_percent']) * (df_feat['temperature_celsius'] / 25)
-    df_feat['soil_water_deficit'] = (100 - df_feat['soil_moisture_percent'])
-    df_feat['net_water_input'] = df_feat['rainfall_mm'] - (df_feat['temperature_celsius'] / 5) # Simple rain vs evaporation
-
-    # 4. Polynomial features
-    df_feat['temp_squared'] = df_feat['temperature_celsius']**2
-    df_feat['moisture_squared'] = df_feat['soil_moisture_percent']**2
-    
-    return df_feat
-
-df_engineered = create_features(df)
-print(f"   ✅ 10 new features created.")
-
-# Define ALL 7 features in the correct order
-# This order MUST be matched in the JavaScript
-feature_columns = [
-    # Original 5
-    'crop_encoded',
-    'soil_moisture_percent',
-    'temperature_celsius',
-    'humidity_percent',
-    'rainfall_mm',
-    # New 10
-    'temp_humidity_ratio',
-    'humidity_rainfall_ratio',
-    'temp_moisture_interaction',
-    'moisture_humidity_product',
-    'moisture_rainfall_product',
-    'water_saturation_deficit',
-    'soil_water_deficit',
-    'net_water_input',
-    'temp_squared',
-    'moisture_squared'
-]
-
-X = df_engineered[feature_columns].values
-y = df_engineered['water_requirement_liters_per_hectare'].values.reshape(-1, 1)
+# One pass into a preallocated float32 matrix (features.py). The server's nn_engine.py runs the
+# same transform, driven by the feature_columns list saved to scalers.json below.
+feature_columns = FEATURE_COLUMNS
+feature_transform = FeatureTransform(feature_columns, crop_classes)
+X = feature_transform.transform(df, standardize=False)
+print(f"   ✅ {len(feature_columns) - 5} new features created.")
+y = df['water_requirement_liters_per_hectare'].to_numpy(dtype=np.float64).reshape(-1, 1)
 
 print(f"   ✅ Final feature count: {X.shape[1]}")
 
@@ -254,6 +210,13 @@ with open(scalers_path, 'w') as f:
     json.dump(scalers_info, f, indent=2)
 
 print(f"   ✅ Scalers saved to '{scalers_path}'")
+
+# --- Step 9: Compact exports ---
+# BatchNorm folded into the Dense kernels, then float32 / float16 / uint8 variants checked on the
+# test split; the accuracy of each is added to scalers.json (quantize_nn.py)
+print("\n🗜️ Step 9: Exporting folded and quantized variants...")
+export_variants(MODEL_SAVE_PATH, X_test_scaled.astype(np.float32), y_test)
+
 print("\n" + "=" * 70)
 print("✅ ADVANCED MODEL TRAINING COMPLETE!")
 print(f"   Your new 15-feature model is saved in the '{MODEL_SAVE_PATH}/' folder.")